@@ -0,0 +1,357 @@
+# numpy-backed activity logs
+# times are held as int seconds and dates as int days (date.toordinal()),
+# but logs are still read from and written to the original "H:MM:SS" csv format
+# old rows can be rolled up into weeks ("YYYY-Www") and then months ("YYYY-MM") to keep logs small
+
+import csv
+import datetime as dt
+import numpy as np
+
+# marks a cell with nothing logged in it, which is an empty cell in the csv
+EMPTY = -1
+# times logged in a single day are capped just under 24 hours
+MAX_DAY_SECONDS = 24 * 60 * 60 - 1
+# newest rows kept in a LogSummary: enough for the last 7 logged days, and for every day
+# of the last two weeks, which covers both "this week" and "last 7 days"
+SUMMARY_ROWS = 14
+# days from date.toordinal() to numpy's datetime64 epoch (1970-01-01)
+_EPOCH = dt.date(1970, 1, 1).toordinal()
+
+class ActivityLog:
+    """
+    One user's activity log.
+
+    DAYS: 1d int array of the date ordinal each row starts on, oldest first
+    ACTIVITIES: list of activity names, one per column
+    SECONDS: 2d int array shaped (days, activities), EMPTY where nothing was logged
+    SPANS: 1d int array of how many days each row covers; 1 for a day, 7 for a
+        rolled-up week, and the length of the month for a rolled-up month
+
+    All-time totals per activity are summed from the rows once when the log is built,
+    then kept up to date by every change, so totals() doesn't depend on how long the history is.
+    """
+
+    def __init__(self, days: np.ndarray=None, activities: list=None, seconds: np.ndarray=None, spans: np.ndarray=None):
+        self.days = days if days is not None else np.zeros(0, dtype=np.int64)
+        self.activities = activities if activities is not None else []
+        self.seconds = seconds if seconds is not None else np.full((len(self.days), len(self.activities)), EMPTY, dtype=np.int64)
+        self.spans = spans if spans is not None else np.ones(len(self.days), dtype=np.int64)
+        self.rebuild_totals()
+
+    def __len__(self):
+        return len(self.days)
+
+    def has(self, activity: str):
+        """
+        Returns True if the activity has a column in this log.
+        """
+        return activity in self.activities
+
+    def totals(self):
+        """
+        Returns an int array of all-time total seconds for each activity.
+        """
+        return self.column_totals.copy()
+
+    def rebuild_totals(self):
+        """
+        Recomputes the all-time totals from the rows.
+        """
+        self.column_totals = np.where(self.seconds == EMPTY, 0, self.seconds).sum(axis=0)
+
+    def since(self, date: dt.date):
+        """
+        Returns an int array of total seconds for each activity logged on or after a date.
+        """
+        rows = self.seconds[int(np.searchsorted(self.days, date.toordinal())):]
+        return np.where(rows == EMPTY, 0, rows).sum(axis=0)
+
+    def summary(self):
+        """
+        Returns a LogSummary of this log: its totals and newest rows, copied.
+        """
+        return LogSummary(self.days[-SUMMARY_ROWS:].copy(), list(self.activities),
+                          self.seconds[-SUMMARY_ROWS:].copy(), self.column_totals.copy(), self.spans[-SUMMARY_ROWS:].copy())
+
+    def recent(self, activity: str, n: int):
+        """
+        Returns the last n daily rows' dates (newest first) and their seconds for an activity,
+        as a list of datetime.date objects and an int array. Empty cells count as 0.
+        """
+        rows = np.nonzero(self.spans == 1)[0][-n:][::-1]
+        column = self.seconds[rows, self.activities.index(activity)]
+        dates = [dt.date.fromordinal(int(day)) for day in self.days[rows]]
+        return dates, np.where(column == EMPTY, 0, column)
+
+    def roll_up(self, today: dt.date, daily_days: int, weekly_days: int):
+        """
+        Rolls rows older than DAILY_DAYS into one row per week (monday to sunday), and rows
+        older than WEEKLY_DAYS into one row per month. Only whole weeks and months are rolled,
+        and a week is counted in the month it starts in. Totals don't change.
+        Returns True if any rows were rolled up.
+        """
+        daily_cutoff = today.toordinal() - daily_days
+        weekly_cutoff = today.toordinal() - weekly_days
+        # rows newer than every cutoff never change, so most calls stop here
+        old = int(np.searchsorted(self.days, daily_cutoff))
+        if old == 0:
+            return False
+        days = self.days[:old]
+        spans = self.spans[:old]
+        # date ordinal 1 (0001-01-01) was a monday
+        mondays = days - (days - 1) % 7
+        to_week = (spans == 1) & (mondays + 7 <= daily_cutoff)
+        weeks = np.where(to_week, mondays, days)
+        # months are picked from the week a row rolls into, so a week is never split between two months
+        months = ((weeks - _EPOCH).astype("datetime64[D]")).astype("datetime64[M]")
+        month_starts = months.astype("datetime64[D]").astype(np.int64) + _EPOCH
+        month_ends = (months + 1).astype("datetime64[D]").astype(np.int64) + _EPOCH
+        to_month = (spans <= 7) & (month_ends <= weekly_cutoff)
+        new_days = np.where(to_month, month_starts, weeks)
+        new_spans = np.where(to_month, month_ends - month_starts, np.where(to_week, 7, spans))
+        if (new_days == days).all() and (new_spans == spans).all():
+            return False
+        # rows that land in the same bucket are summed; a bucket stays EMPTY for an activity with nothing in it
+        keys, bucket = np.unique(new_days * 64 + new_spans, return_inverse=True)
+        filled = np.zeros((len(keys), len(self.activities)), dtype=np.int64)
+        np.add.at(filled, bucket, np.where(self.seconds[:old] == EMPTY, 0, self.seconds[:old]))
+        logged = np.zeros((len(keys), len(self.activities)), dtype=bool)
+        np.logical_or.at(logged, bucket, self.seconds[:old] != EMPTY)
+        self.days = np.concatenate([keys // 64, self.days[old:]])
+        self.spans = np.concatenate([keys % 64, self.spans[old:]])
+        self.seconds = np.vstack([np.where(logged, filled, EMPTY), self.seconds[old:]])
+        return True
+
+    def add(self, date: dt.date, activity: str, seconds: int):
+        """
+        Adds seconds to an activity on a date, creating the row and column if needed.
+        Returns the new time logged for that day, capped at MAX_DAY_SECONDS (per day the row covers).
+        """
+        col = self._column(activity)
+        row = self._row(date.toordinal())
+        before = max(self.seconds[row, col], 0)
+        updated = min(before + seconds, MAX_DAY_SECONDS * int(self.spans[row]))
+        self.seconds[row, col] = updated
+        self.column_totals[col] += updated - before
+        return int(updated)
+
+    def set(self, date: dt.date, activity: str, seconds: int):
+        """
+        Sets the time logged for an activity on a date, creating the row and column if needed.
+        Unlike add(), doing this twice gives the same result, which journal replay relies on.
+        """
+        # both of these can replace self.seconds, so they have to run before it's indexed
+        col = self._column(activity)
+        row = self._row(date.toordinal())
+        self.column_totals[col] += max(seconds, 0) - max(self.seconds[row, col], 0)
+        self.seconds[row, col] = seconds
+
+    def drop(self, activity: str):
+        """
+        Deletes an activity's whole column.
+        """
+        col = self.activities.index(activity)
+        self.activities.pop(col)
+        self.seconds = np.delete(self.seconds, col, axis=1)
+        self.column_totals = np.delete(self.column_totals, col)
+
+    def merge(self, activity1: str, activity2: str, new_activity: str):
+        """
+        Replaces two activities with one new column holding their per-day sums.
+        The new activity can have the same name as one of the old ones.
+        """
+        merged = self.seconds[:, [self.activities.index(activity1), self.activities.index(activity2)]]
+        merged = np.where(merged == EMPTY, 0, merged).sum(axis=1)
+        total = self.column_totals[self.activities.index(activity1)] + self.column_totals[self.activities.index(activity2)]
+        self.drop(activity1)
+        self.drop(activity2)
+        self.activities.append(new_activity)
+        self.seconds = np.hstack([self.seconds, merged.reshape(-1, 1)])
+        self.column_totals = np.append(self.column_totals, total)
+
+    def cells(self):
+        """
+        Yields (row label, activity, seconds) for every non-empty cell. Labels are
+        "YYYY-MM-DD" for days, "YYYY-Www" for rolled-up weeks and "YYYY-MM" for rolled-up months.
+        """
+        rows, cols = np.nonzero(self.seconds != EMPTY)
+        for row, col in zip(rows, cols):
+            yield _row_label(self.days[row], self.spans[row]), self.activities[col], int(self.seconds[row, col])
+
+    @classmethod
+    def from_cells(cls, activities: list, cells: list):
+        """
+        Builds a log from a list of activity names and (row label, activity, seconds) tuples.
+        """
+        labels = {label:_parse_label(label) for label, _, _ in cells}
+        rows = sorted(set(labels.values()))
+        days = np.array([day for day, _ in rows], dtype=np.int64)
+        spans = np.array([span for _, span in rows], dtype=np.int64)
+        log_data = cls(days, list(activities), spans=spans)
+        row_of = {row:i for i, row in enumerate(rows)}
+        columns = {activity:i for i, activity in enumerate(activities)}
+        for label, activity, seconds in cells:
+            log_data.seconds[row_of[labels[label]], columns[activity]] = seconds
+        log_data.rebuild_totals()
+        return log_data
+
+    def columns(self):
+        """
+        Returns every non-empty cell as four parallel arrays: (date ordinals, days each row covers,
+        column indexes into self.activities, seconds). Cells are ordered by activity, then date.
+        """
+        cols, rows = np.nonzero(self.seconds.T != EMPTY)
+        return self.days[rows], self.spans[rows], cols, self.seconds[rows, cols]
+
+    @classmethod
+    def from_columns(cls, activities: list, days: np.ndarray, spans: np.ndarray, cols: np.ndarray, seconds: np.ndarray):
+        """
+        Builds a log from parallel arrays like the ones columns() returns.
+        """
+        rows, inverse = np.unique(days * 64 + spans, return_inverse=True)
+        log_data = cls(rows // 64, list(activities), spans=rows % 64)
+        log_data.seconds[inverse, cols] = seconds
+        log_data.rebuild_totals()
+        return log_data
+
+    @classmethod
+    def from_csv(cls, file):
+        """
+        Reads a log from a csv file object in the original format:
+        a header of ",activity1,activity2" then rows of "YYYY-MM-DD,H:MM:SS," newest first.
+        """
+        reader = csv.reader(file)
+        activities = next(reader, [""])[1:]
+        days = []
+        spans = []
+        rows = []
+        for line in reader:
+            if not line:
+                continue
+            day, span = _parse_label(line[0])
+            days.append(day)
+            spans.append(span)
+            rows.append([_str_to_seconds(cell) for cell in line[1:len(activities) + 1]]
+                        + [EMPTY] * (len(activities) + 1 - len(line)))
+        days = np.array(days, dtype=np.int64)
+        spans = np.array(spans, dtype=np.int64)
+        seconds = np.array(rows, dtype=np.int64).reshape(len(days), len(activities))
+        # csv rows are newest first; keep them oldest first in memory
+        order = np.lexsort((spans, days))
+        return cls(days[order], activities, seconds[order], spans[order])
+
+    def to_csv(self, file):
+        """
+        Writes the log to a csv file object in the original format, newest date first.
+        """
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow([""] + self.activities)
+        for row in range(len(self.days) - 1, -1, -1):
+            writer.writerow([_row_label(self.days[row], self.spans[row])]
+                            + [_seconds_to_str(seconds) for seconds in self.seconds[row]])
+
+    def _column(self, activity: str):
+        """
+        Returns the column index for an activity, appending an empty column if it doesn't exist.
+        """
+        if activity not in self.activities:
+            self.activities.append(activity)
+            self.seconds = np.hstack([self.seconds, np.full((len(self.days), 1), EMPTY, dtype=np.int64)])
+            self.column_totals = np.append(self.column_totals, 0)
+        return self.activities.index(activity)
+
+    def _row(self, day: int):
+        """
+        Returns the row index for a date ordinal, inserting an empty row if it doesn't exist.
+        A date inside a rolled-up week or month gets that row.
+        """
+        row = int(np.searchsorted(self.days, day, side="right")) - 1
+        if row >= 0 and day < self.days[row] + self.spans[row]:
+            return row
+        row += 1
+        self.days = np.insert(self.days, row, day)
+        self.spans = np.insert(self.spans, row, 1)
+        self.seconds = np.insert(self.seconds, row, EMPTY, axis=0)
+        return row
+
+
+class LogSummary(ActivityLog):
+    """
+    What "list logs" needs from a log, without its history: the all-time totals
+    and only the newest SUMMARY_ROWS rows. Stored alongside each log so listing
+    never has to read the whole thing. Changes go to the full log, not to this.
+    recent() works for up to SUMMARY_ROWS rows, and since() for dates in the last two weeks.
+    """
+
+    def __init__(self, days: np.ndarray, activities: list, seconds: np.ndarray, totals: np.ndarray, spans: np.ndarray):
+        """
+        TOTALS: int array of all-time total seconds for each activity, over the full log
+        """
+        self.days = days
+        self.activities = activities
+        self.seconds = seconds
+        self.column_totals = totals
+        self.spans = spans
+
+    def to_json(self):
+        return {
+            "activities":self.activities,
+            "totals":self.column_totals.tolist(),
+            "days":self.days.tolist(),
+            "spans":self.spans.tolist(),
+            "seconds":self.seconds.tolist()
+        }
+
+    @classmethod
+    def from_json(cls, summary_json: dict):
+        activities = summary_json["activities"]
+        days = np.array(summary_json["days"], dtype=np.int64)
+        seconds = np.array(summary_json["seconds"], dtype=np.int64).reshape(len(days), len(activities))
+        # summaries saved before logs could be rolled up only have daily rows
+        spans = np.array(summary_json.get("spans", [1] * len(days)), dtype=np.int64)
+        return cls(days, activities, seconds, np.array(summary_json["totals"], dtype=np.int64), spans)
+
+
+def _str_to_seconds(str: str):
+    """
+    Turns a "H:MM:SS" csv cell into int seconds, or EMPTY if the cell is blank.
+    """
+    if str == "":
+        return EMPTY
+    split_list = [int(i) for i in str.split(":")]
+    return split_list[0] * 3600 + split_list[1] * 60 + split_list[2]
+
+def _seconds_to_str(seconds: int):
+    """
+    Turns int seconds into a "H:MM:SS" csv cell, or a blank cell if EMPTY.
+    Hours aren't capped at 24, since rolled-up rows hold more than a day.
+    """
+    if seconds == EMPTY:
+        return ""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+def _row_label(day: int, span: int):
+    """
+    Returns the csv date column for a row: "YYYY-MM-DD", "YYYY-Www" for a week, or "YYYY-MM" for a month.
+    """
+    date = dt.date.fromordinal(int(day))
+    if span == 1:
+        return str(date)
+    if span == 7:
+        year, week, _ = date.isocalendar()
+        return f"{year}-W{week:02}"
+    return f"{date.year}-{date.month:02}"
+
+def _parse_label(label: str):
+    """
+    Returns (date ordinal the row starts on, days it covers) for a row label from _row_label().
+    """
+    if "W" in label:
+        year, week = label.split("-W")
+        return dt.date.fromisocalendar(int(year), int(week), 1).toordinal(), 7
+    if len(label) == 7:
+        start = dt.date(int(label[:4]), int(label[5:]), 1)
+        end = dt.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return start.toordinal(), end.toordinal() - start.toordinal()
+    return dt.date.fromisoformat(label).toordinal(), 1
@@ -0,0 +1,114 @@
+# mailboxes that serialize work per user (or per anything else) without blocking other users
+# each Actor runs its jobs one at a time, in the order they were sent, on its own task
+
+import asyncio, functools, inspect
+from collections import deque
+
+class Actor:
+    """
+    A queue of jobs and the task that works through it.
+
+    call() adds a job and waits for its result. The task only exists while there's work,
+    so idle actors cost nothing but the object itself.
+    """
+
+    def __init__(self, on_idle=None):
+        """
+        ON_IDLE: function called with the actor when its queue runs dry
+        """
+        self.on_idle = on_idle
+        self.queue = deque()
+        self.task = None
+        self.jobs = 0
+        self.max_depth = 0
+
+    async def call(self, function, *args, **kwargs):
+        """
+        Runs FUNCTION(*ARGS, **KWARGS) after every job sent before it, and returns its result.
+        FUNCTION can be a plain function or a coroutine function.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((function, args, kwargs, future))
+        self.max_depth = max(self.max_depth, len(self.queue))
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._work())
+        return await future
+
+    def __len__(self):
+        return len(self.queue)
+
+    async def _work(self):
+        try:
+            while self.queue:
+                function, args, kwargs, future = self.queue.popleft()
+                # the caller gave up waiting, so don't run it
+                if future.cancelled():
+                    continue
+                try:
+                    result = function(*args, **kwargs)
+                    if inspect.isawaitable(result):
+                        result = await result
+                except Exception as error:
+                    if not future.cancelled():
+                        future.set_exception(error)
+                except BaseException:
+                    # CancelledError or worse ends the task; the job's caller is cancelled along with it
+                    future.cancel()
+                    raise
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+                self.jobs += 1
+        finally:
+            # if the task is ending early, cancel every job still queued so no caller waits forever
+            while self.queue:
+                self.queue.popleft()[3].cancel()
+            # nothing awaits between the queue running dry and here, so no job can slip in unseen
+            self.task = None
+            if self.on_idle is not None:
+                self.on_idle(self)
+
+
+class Mailboxes:
+    """
+    One Actor per key, made when a key gets work and dropped once it's idle.
+    Jobs for the same key run in order; jobs for different keys run concurrently.
+    """
+
+    def __init__(self):
+        # key -> Actor, only for keys with work queued or running
+        self.actors = {}
+        self.jobs = 0
+        self.max_depth = 0
+
+    async def call(self, key, function, *args, **kwargs):
+        actor = self.actors.get(key)
+        if actor is None:
+            actor = Actor(on_idle=functools.partial(self._drop, key))
+            self.actors[key] = actor
+        return await actor.call(function, *args, **kwargs)
+
+    def serialized(self, key_function):
+        """
+        Decorator that runs every call of an async function in the mailbox of KEY_FUNCTION(*args, **kwargs).
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                return await self.call(key_function(*args, **kwargs), function, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {
+            "active":len(self.actors),
+            "queued":sum(len(actor) for actor in self.actors.values()),
+            "jobs":self.jobs,
+            "max_depth":self.max_depth
+        }
+
+    def _drop(self, key, actor: Actor):
+        self.jobs += actor.jobs
+        self.max_depth = max(self.max_depth, actor.max_depth)
+        if self.actors.get(key) is actor:
+            self.actors.pop(key)
@@ -0,0 +1,149 @@
+# crash-safe file writes
+# every file is written to a temp file and renamed over the old one, so a crash leaves
+# either the old contents or the new ones, and pending writes are committed in groups
+
+import asyncio, contextlib, os
+
+def write_file(path: str, data: bytes, fsync: bool=True):
+    """
+    Atomically replaces PATH with DATA. With FSYNC, the data and the rename are on disk when this returns.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        if fsync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    if fsync:
+        _fsync_directory(os.path.dirname(path))
+
+
+class AtomicWriter:
+    """
+    Queues whole-file writes and commits them in groups.
+
+    Writing a file that already has a write pending just replaces the pending data,
+    so a burst of changes to one file costs one write. A commit writes and fsyncs every
+    pending temp file, renames them all into place, then fsyncs each directory once.
+
+    DELAY is the latency/durability trade-off: with 0, every write() commits right away;
+    otherwise writes wait up to DELAY seconds (while an event loop is running) to be
+    committed together, and a power cut in that window loses them. Wrapping writes in
+    hold() commits them together when the block ends, whatever DELAY is.
+    """
+
+    def __init__(self, delay: float=0.0, fsync: bool=True, call_later=None):
+        """
+        DELAY: seconds to wait collecting writes before committing them
+        FSYNC: whether to fsync; without it writes are still atomic, but only safe from the process crashing
+        CALL_LATER: function(delay, callback) that schedules the delayed commit and returns a handle with cancel();
+            defaults to the running event loop's
+        """
+        self.delay = delay
+        self.fsync = fsync
+        self.call_later = call_later or _loop_call_later
+        # path -> bytes waiting to be written
+        self.pending = {}
+        self.holds = 0
+        self.timer = None
+        self.writes = 0
+        self.coalesced = 0
+        self.files_written = 0
+        self.commits = 0
+        self.fsyncs = 0
+
+    def write(self, path: str, data: bytes):
+        self.writes += 1
+        if path in self.pending:
+            self.coalesced += 1
+        self.pending[path] = data
+        if self.holds > 0:
+            return
+        if self.delay <= 0:
+            self.commit()
+        elif self.timer is None:
+            try:
+                self.timer = self.call_later(self.delay, self.commit)
+            except RuntimeError:
+                # no event loop to commit later from (scripts, migrate.py), so commit now
+                self.commit()
+
+    def read(self, path: str):
+        """
+        Returns the data waiting to be written to PATH, or None if there isn't any.
+        """
+        return self.pending.get(path)
+
+    def discard(self, path: str):
+        """
+        Drops a pending write, for when the file is about to be deleted.
+        """
+        self.pending.pop(path, None)
+
+    @contextlib.contextmanager
+    def hold(self):
+        """
+        Context manager that holds off committing until the block ends, then commits everything at once.
+        """
+        self.holds += 1
+        try:
+            yield self
+        finally:
+            self.holds -= 1
+            if self.holds == 0:
+                self.commit()
+
+    def commit(self):
+        """
+        Writes every pending file. Returns how many were written.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, {}
+        for path, data in pending.items():
+            with open(path + ".tmp", "wb") as file:
+                file.write(data)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+                    self.fsyncs += 1
+        for path in pending:
+            os.replace(path + ".tmp", path)
+        if self.fsync:
+            for directory in {os.path.dirname(path) for path in pending}:
+                _fsync_directory(directory)
+                self.fsyncs += 1
+        self.files_written += len(pending)
+        self.commits += 1
+        return len(pending)
+
+    def stats(self):
+        return {
+            "writes":self.writes,
+            "coalesced":self.coalesced,
+            "files_written":self.files_written,
+            "commits":self.commits,
+            "fsyncs":self.fsyncs,
+            "pending":len(self.pending)
+        }
+
+
+def _loop_call_later(delay: float, callback):
+    return asyncio.get_running_loop().call_later(delay, callback)
+
+def _fsync_directory(directory: str):
+    """
+    Fsyncs a directory so renames inside it survive a power cut. Does nothing where directories can't be opened (windows).
+    """
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
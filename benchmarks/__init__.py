@@ -0,0 +1,2 @@
+# benchmarks for cornbot
+# run them from the repo folder, e.g. python -m benchmarks.list_logs
@@ -0,0 +1,65 @@
+# compares fleet-wide analytics over every users/*.csv with the same query over an export_logs.py dataset,
+# and times the export and import themselves
+# usage: python -m benchmarks.bulk_export [--users 10000] [--days 365] [--format parquet]
+
+import argparse, os, tempfile, time, storage, export_logs
+from collections import Counter
+from benchmarks import synthetic
+
+def totals_from_logs(store: storage.Storage, user_ids: list):
+    """
+    Total seconds per activity over USER_IDS, reading each user's log the way the bot does.
+    """
+    totals = Counter()
+    for user_id in user_ids:
+        log_data = store.load_log(user_id)
+        if log_data is not None:
+            totals.update({activity:int(total) for activity, total in zip(log_data.activities, log_data.totals())})
+    return dict(totals)
+
+def totals_from_dataset(path: str, file_format: str):
+    """
+    The same totals from an exported dataset, as one pyarrow aggregation.
+    """
+    import pyarrow.dataset
+    table = pyarrow.dataset.dataset(path, format=file_format, partitioning="hive").to_table(columns=["activity", "seconds"])
+    grouped = table.group_by("activity").aggregate([("seconds", "sum")])
+    return dict(zip(grouped.column("activity").to_pylist(), grouped.column("seconds_sum").to_pylist()))
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk log export/import against reading every log file.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="legacy")
+    parser.add_argument("--format", choices=["parquet", "ipc"], default="parquet")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        source_path = os.path.join(root, "data")
+        print(f"Building {args.users} synthetic users with {args.days} days of logs...")
+        synthetic.build(source_path, args.users, args.backend, log_fraction=0.8, days=args.days, seed=args.seed)
+        source = storage.open_storage(args.backend, source_path)
+        dataset_path = os.path.join(root, "dataset")
+        user_ids = source.list_users()
+        scan_seconds, scanned = timed(totals_from_logs, source, user_ids)
+        export_seconds, (users, cells) = timed(export_logs.export, source, dataset_path, args.format)
+        query_seconds, queried = timed(totals_from_dataset, dataset_path, args.format)
+        os.makedirs(os.path.join(root, "imported"))
+        destination = storage.open_storage("sqlite", os.path.join(root, "imported"))
+        import_seconds, imported = timed(export_logs.import_logs, destination, dataset_path, args.format)
+        # only logs are exported, so the imported store has no user jsons to list
+        restored = totals_from_logs(destination, user_ids)
+        dataset_bytes = sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(dataset_path) for name in names)
+        source.close()
+        destination.close()
+    print(f"{users} logs, {cells} cells, {dataset_bytes / 1e6:.1f} MB of {args.format}")
+    print(f"fleet totals, reading every log:  {scan_seconds:.2f} s")
+    print(f"fleet totals, from the dataset:   {query_seconds:.2f} s ({scan_seconds / query_seconds:.0f}x faster, "
+          f"{'same totals' if queried == scanned else 'TOTALS DIFFER'})")
+    print(f"export: {export_seconds:.2f} s, import into sqlite: {import_seconds:.2f} s "
+          f"({imported} logs, {'same totals' if restored == scanned else 'TOTALS DIFFER'})")
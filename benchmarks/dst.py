@@ -0,0 +1,154 @@
+# runs the bot across a daylight saving time change with most users in zones that change, on an accelerated clock,
+# checks every prompt still fired at its local time on both sides of it, and times the bulk move
+# against moving the same prompts one at a time, or recomputing every zone user's offset every minute
+# usage: python -m benchmarks.dst [--users 100000] [--speed 30]
+
+import argparse, asyncio, contextlib, importlib, io, os, random, tempfile, time
+import datetime as dt
+import clock, zones
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeClient
+from benchmarks.load import percentile
+
+# European zones all change at 01:00 UTC on the same day; the rest don't change then and shouldn't move,
+# and None is users with a fixed offset
+ZONE_NAMES = ["Europe/Berlin", "Europe/London", "Europe/Paris", "Europe/Madrid", "Europe/Warsaw", "Europe/Athens",
+              "Asia/Kolkata", "Asia/Tokyo", "America/New_York", None]
+
+async def run(bot, start: dt.datetime, end: dt.datetime):
+    """
+    Runs the bot's loops from START to END. Returns (fires, transitions), where fires are
+    (due, fired at, user_ids) and transitions are (real seconds, {zone: offset}, prompts moved, journal bytes).
+    """
+    bot_clock = bot.bot_clock
+    fires = []
+    transitions = []
+    prompt_users = bot.prompt_scheduler.callback
+    apply_zone_transition = bot.apply_zone_transition
+
+    async def recording_prompt_users(due: dt.datetime, user_ids: list):
+        fires.append((due, bot_clock.now(), list(user_ids)))
+        await prompt_users(due, user_ids)
+
+    async def timed_zone_transition(offsets: dict):
+        journal_bytes = bot.store.journal.size()
+        began = time.perf_counter()
+        moved = await apply_zone_transition(offsets)
+        transitions.append((time.perf_counter() - began, offsets, moved, bot.store.journal.size() - journal_bytes))
+        return moved
+
+    bot.prompt_scheduler.callback = recording_prompt_users
+    # run_zone_transitions() looks apply_zone_transition up by name each time
+    bot.apply_zone_transition = timed_zone_transition
+    bot_clock.jump(start)
+    bot.start_loops()
+    # the startup retention pass over every user would compete with the move for the I/O thread
+    bot.retention_task.cancel()
+    await bot_clock.sleep_until(end + dt.timedelta(seconds=5))
+    bot.prompt_scheduler.stop()
+    bot.break_tracker.stop()
+    bot.hourly_task.cancel()
+    bot.zone_task.cancel()
+    bot.flush_data.cancel()
+    return fires, transitions
+
+async def move_one_at_a_time(bot, scheduled: list):
+    """
+    Moves each (hr, minute, user_id) out of its minute and back, one I/O job at a time, the way single prompts
+    are added and deleted. Returns the real seconds per prompt.
+    """
+    began = time.perf_counter()
+    for hr, minute, user_id in scheduled:
+        await bot.io_pool.run(bot.store.remove_from_hour, hr, minute, user_id)
+        await bot.io_pool.run(bot.store.add_to_hour, hr, minute, user_id)
+    return (time.perf_counter() - began) / len(scheduled)
+
+def expected_fires(store, user_ids: list, start: dt.datetime, end: dt.datetime):
+    """
+    Returns {due: set of user ids} for every minute after START up to END, going by each user's zone's real offset
+    at that minute, worked out from scratch with zoneinfo instead of from the bot's schedule.
+    """
+    # (zone or fixed offset) -> local "HH:MM" -> users with a prompt then
+    groups = {}
+    for user_id in user_ids:
+        user_json = store.load_user(user_id)
+        group = groups.setdefault(user_json.get("zone", user_json["tz"]), {})
+        for local in user_json["prompts"]:
+            group.setdefault(local, set()).add(user_id)
+    expected = {}
+    due = start.replace(second=0, microsecond=0) + dt.timedelta(minutes=1)
+    while due <= end:
+        expected[due] = set()
+        for group, prompts in groups.items():
+            offset = zones.offset_at(group, due) if isinstance(group, str) else group
+            expected[due] |= prompts.get(zones.local_time(due, offset), set())
+        due += dt.timedelta(minutes=1)
+    return expected
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        now = dt.datetime.utcnow()
+        change = zones.transitions("Europe/Berlin", now, now + zones.TRANSITION_HORIZON)[0][0]
+        start = change - dt.timedelta(minutes=args.before) + dt.timedelta(seconds=0.5)
+        end = change + dt.timedelta(minutes=args.after)
+        print(f"Building {args.users} users, most in zones that change offset at {change:%Y-%m-%d %H:%M} UTC...")
+        user_ids = synthetic.build(directory, args.users, args.backend, log_fraction=0, seed=args.seed,
+                                   zone_names=ZONE_NAMES, zones_at=start)
+        clock.set_default_clock(clock.AcceleratedClock(start, args.speed))
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = args.backend
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        bot = importlib.import_module("main")
+        bot.load_state()
+        bot.prompt_fanout.client = FakeClient(latency=0.0)
+        print(f"Running {start:%H:%M} to {end:%H:%M} UTC at {args.speed:g}x "
+              f"(about {(end - start).total_seconds() / args.speed:.0f} s)...")
+        with contextlib.redirect_stdout(io.StringIO()):
+            fires, transitions = asyncio.run(run(bot, start, end))
+        expected = expected_fires(bot.store, user_ids, start, end)
+
+        # what moving the same prompts one at a time would cost: a sample of them, through the same journaled store
+        rng = random.Random(args.seed)
+        hours = bot.store.load_hours()
+        scheduled = [(hr, minute, user_id) for hr, hour_json in hours.items() for minute, ids in hour_json.items() for user_id in ids]
+        one_at_a_time = asyncio.run(move_one_at_a_time(bot, rng.sample(scheduled, min(args.sample, len(scheduled)))))
+        # and what recomputing every zone user's offset would cost, every minute
+        zone_users = [(user_id, zone) for zone, ids in bot.zone_index.members.items() for user_id in ids]
+        began = time.perf_counter()
+        for _, zone in zone_users:
+            zones.offset_at(zone, end)
+        recompute = time.perf_counter() - began
+        bot.io_pool.close()
+        bot.store.close()
+
+    fired = {due:set(user_ids) for due, _, user_ids in fires}
+    missed = sum(len(ids - fired.get(due, set())) for due, ids in expected.items())
+    unexpected = sum(len(fired.get(due, set()) - ids) for due, ids in expected.items())
+    duplicates = sum(len(user_ids) - len(set(user_ids)) for _, _, user_ids in fires) + len(fires) - len(fired)
+    drift = sorted((fired_at - due).total_seconds() for due, fired_at, _ in fires)
+    moved = sum(moved for _, _, moved, _ in transitions)
+    print(f"  {'zone users':<34}{len(zone_users)} of {len(user_ids)}")
+    for seconds, offsets, prompts, journal_bytes in transitions:
+        print(f"  {'transition':<34}{', '.join(f'{zone} UTC{zones.format_offset(offset)}' for zone, offset in offsets.items())}")
+        print(f"  {'bulk move':<34}{prompts} prompts in {seconds * 1000:.1f} ms, one {journal_bytes} byte journal record")
+    print(f"  {'prompts expected in window':<34}{sum(len(ids) for ids in expected.values())}")
+    print(f"  {'missed / unexpected / duplicates':<34}{missed} / {unexpected} / {duplicates}")
+    print(f"  {'scheduler drift p50 / max':<34}{percentile(drift, 50):.3f} s / {drift[-1]:.3f} s (simulated)")
+    print(f"  {'one prompt at a time (estimated)':<34}{one_at_a_time * 1000:.3f} ms per prompt, "
+          f"about {one_at_a_time * moved:.1f} s for the same {moved}")
+    print(f"  {'recomputing every offset':<34}{recompute * 1000:.1f} ms per minute, {recompute * 1440:.0f} s per day")
+    ok = missed == 0 and unexpected == 0 and duplicates == 0 and len(transitions) == 1
+    print("Every prompt fired at its local time across the change." if ok else "DST run found errors.")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move users across a daylight saving time change and check their prompts.")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="sqlite")
+    # the move has to fit in the ZONE_MOVE_EARLY_SECONDS before the change, which is SPEED times less real time
+    parser.add_argument("--speed", type=float, default=30, help="simulated seconds per real second")
+    parser.add_argument("--before", type=int, default=10, help="simulated minutes to run before the change")
+    parser.add_argument("--after", type=int, default=40, help="simulated minutes to run after the change")
+    parser.add_argument("--sample", type=int, default=2000, help="prompts to move one at a time for the estimate")
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(0 if main(parser.parse_args()) else 1)
@@ -0,0 +1,110 @@
+# stand-ins for the parts of discord.py that cornbot talks to, with simulated latency
+# every REST-like call sleeps for LATENCY seconds (plus up to JITTER more) and is counted
+
+import asyncio, random
+
+class FakeClient:
+    """
+    Fake discord client. get_user() only finds users that have already been fetched,
+    like the real member cache; fetch_user() and create_dm() cost a round-trip.
+    """
+
+    def __init__(self, latency: float=0.005, jitter: float=0.0, fail_ids: set=None):
+        """
+        LATENCY: seconds each API call takes
+        JITTER: up to this many extra seconds, chosen at random per call
+        FAIL_IDS: user ids whose DMs are closed, so sending to them raises
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_ids = fail_ids or set()
+        self.users = {}
+        self.api_calls = 0
+        # (user_id, content) for every message sent, in order
+        self.sent = []
+
+    async def api_call(self):
+        self.api_calls += 1
+        await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+    def get_user(self, user_id: int):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id: int):
+        await self.api_call()
+        if user_id not in self.users:
+            self.users[user_id] = FakeUser(self, user_id)
+        return self.users[user_id]
+
+
+class FakeUser:
+
+    def __init__(self, client: FakeClient, user_id: int):
+        self.client = client
+        self.id = user_id
+        self.dm_channel = None
+
+    async def create_dm(self):
+        await self.client.api_call()
+        self.dm_channel = FakeChannel(self.client, self.id)
+        return self.dm_channel
+
+    async def send(self, content: str):
+        if self.dm_channel is None:
+            await self.create_dm()
+        return await self.dm_channel.send(content)
+
+
+class FakeChannel:
+
+    def __init__(self, client: FakeClient, user_id: int):
+        self.client = client
+        self.user_id = user_id
+
+    async def send(self, content: str):
+        await self.client.api_call()
+        if self.user_id in self.client.fail_ids:
+            raise PermissionError(f"Cannot send messages to user {self.user_id}")
+        self.client.sent.append((self.user_id, content))
+
+
+class FakeContext:
+    """
+    Fake commands.Context for calling a command's callback directly, as if the author DM'd the bot.
+    Every reply is kept in REPLIES instead of being sent anywhere.
+    """
+
+    def __init__(self, author_id: int, latency: float=0.0):
+        """
+        AUTHOR_ID: id of the user running the command
+        LATENCY: seconds each reply takes to send
+        """
+        # only needed here, so the other fakes work without discord.py installed
+        import discord
+        # commands check isinstance(ctx.channel, DMChannel); an uninitialized one passes that check
+        self.channel = discord.DMChannel.__new__(discord.DMChannel)
+        self.author = FakeUser(None, author_id)
+        self.latency = latency
+        self.replies = []
+
+    async def send(self, content: str):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        self.replies.append(content)
+
+
+class FakeActivity:
+
+    def __init__(self, name: str, start=None):
+        self.name = name
+        self.start = start
+
+
+class FakeMember:
+    """
+    Fake member for presence updates. ACTIVITIES is a list of FakeActivity.
+    """
+
+    def __init__(self, user_id: int, activities: list=None):
+        self.id = user_id
+        self.activities = activities or []
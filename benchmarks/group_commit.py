@@ -0,0 +1,40 @@
+# measures a burst of schedule commands with and without group commit
+# usage: python -m benchmarks.group_commit [--commands 500] [--delay 0.005]
+
+import argparse, asyncio, os, tempfile, time, storage, journal, usercache
+
+async def burst(delay: float, commands: int):
+    """
+    Runs COMMANDS schedule-prompt mutations back to back, the way they'd arrive from
+    different users, with journal fsyncs and legacy file commits grouped every DELAY seconds.
+    Returns (seconds taken including the final flush, journal stats, file writer stats).
+    """
+    directory = tempfile.mkdtemp()
+    base = storage.LegacyStorage(directory, delay)
+    mutation_journal = journal.Journal(os.path.join(directory, "journal.log"), delay)
+    store = journal.JournaledStorage(base, mutation_journal)
+    users = usercache.UserStore(store, 1024 * 1024, mutation_journal)
+    start = time.perf_counter()
+    for i in range(commands):
+        user_id = i % 50
+        users.put(user_id, {"tz":0, "prompts":{f"{i % 24:02}:{i % 60:02}":"Drink some water!"}, "breaks":{"default":70}})
+        store.add_to_hour(i % 24, f"{i % 60:02}", user_id)
+        # each command is its own task step, like separate messages coming in
+        await asyncio.sleep(0)
+    users.flush()
+    store.compact()
+    mutation_journal.sync()
+    return time.perf_counter() - start, mutation_journal.stats(), base.writer.stats()
+
+async def main(args):
+    for delay in (0.0, args.delay):
+        seconds, journal_stats, writer_stats = await burst(delay, args.commands)
+        print(f"sync delay {delay * 1000:g} ms: {seconds:.3f} s, {journal_stats['syncs']} journal fsyncs "
+              f"({journal_stats['coalesced']} appends coalesced), {writer_stats['files_written']} files written "
+              f"for {writer_stats['writes']} saves ({writer_stats['coalesced']} coalesced)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a burst of commands with and without group commit.")
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--delay", type=float, default=0.005, help="group commit window in seconds")
+    asyncio.run(main(parser.parse_args()))
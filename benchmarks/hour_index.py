@@ -0,0 +1,70 @@
+# times removing a prompt from a crowded minute with set buckets against the old list buckets, and finding
+# a user's scheduled minutes through the reverse index against scanning all 24 hour jsons
+# usage: python -m benchmarks.hour_index [--users 100000] [--crowd 0.3] [--lookups 2000]
+
+import argparse, os, random, tempfile, time
+import journal, storage
+from benchmarks import synthetic
+from benchmarks.load import percentile
+
+def crowd(store: storage.Storage, user_ids: list, fraction: float, rng: random.Random):
+    """
+    Also schedules FRACTION of USER_IDS at 20:00 UTC, like everyone in one timezone keeping the default prompt.
+    Returns the user ids in that minute.
+    """
+    crowded = rng.sample(user_ids, int(len(user_ids) * fraction))
+    store.move_in_hours([(user_id, None, 20 * 60) for user_id in crowded])
+    return crowded
+
+def time_each(function, items: list):
+    latencies = []
+    for item in items:
+        began = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - began)
+    return sorted(latencies)
+
+def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Building {args.users} users, {args.crowd:.0%} of them also at 20:00 UTC...")
+        user_ids = synthetic.build(directory, args.users, "sqlite", log_fraction=0, seed=args.seed)
+        base = storage.open_storage("sqlite", directory)
+        store = journal.JournaledStorage(base, journal.Journal(os.path.join(directory, "journal.log")))
+        crowded = crowd(store, user_ids, args.crowd, rng)
+        sample = rng.sample(crowded, min(args.lookups, len(crowded)))
+        bucket = store.load_hour(20)["00"]
+        # the same minute as the list it used to be, removing the same users
+        as_list = sorted(bucket)
+        list_remove = time_each(as_list.remove, sample)
+        set_remove = time_each(bucket.discard, sample)
+        bucket.update(sample)
+        store.user_slots = None
+        began = time.perf_counter()
+        store.slot_index()
+        index_build = time.perf_counter() - began
+        index_lookup = time_each(store.slots_of, sample)
+        scan_lookup = time_each(lambda user_id: storage.Storage.slots_of(store, user_id), sample[:args.scans])
+        # the crowd is only in the journal until it's compacted into sqlite
+        store.compact()
+        sql_lookup = time_each(base.slots_of, sample)
+        mismatched = sum(store.slots_of(user_id) != base.slots_of(user_id) for user_id in sample)
+        store.journal.close()
+        base.close()
+    print(f"  {'crowded minute':<30}{len(crowded)} users")
+    for name, latencies in (("remove from list bucket", list_remove), ("remove from set bucket", set_remove),
+                            ("reverse index lookup", index_lookup), ("sqlite times_user lookup", sql_lookup),
+                            ("scan all 24 hour jsons", scan_lookup)):
+        print(f"  {name:<30}p50 {percentile(latencies, 50) * 1e6:.2f} us, p99 {percentile(latencies, 99) * 1e6:.2f} us")
+    print(f"  {'reverse index build':<30}{index_build * 1000:.1f} ms, once")
+    print(f"  {'index disagreeing with sqlite':<30}{mismatched} of {len(sample)} users")
+    return mismatched == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time set minute buckets and the user to minutes reverse index.")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--crowd", type=float, default=0.3, help="fraction of users who share one minute")
+    parser.add_argument("--lookups", type=int, default=2000, help="users to remove and look up")
+    parser.add_argument("--scans", type=int, default=50, help="users to look up by scanning every hour json")
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(0 if main(parser.parse_args()) else 1)
@@ -0,0 +1,94 @@
+# measures "list" command latency with and without the response cache, under a read-heavy mix with some changes,
+# and checks every cached reply against a freshly rendered one
+# usage: python -m benchmarks.list_cache [--users 2000] [--days 365] [--commands 20000]
+
+import argparse, asyncio, contextlib, importlib, io, os, random, tempfile, time
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeContext
+from benchmarks.load import percentile
+
+def operations(bot, rng: random.Random):
+    """
+    Returns a list of (weight, is a list command, function returning (command callback, args, kwargs)).
+    """
+    return [
+        (20, True, lambda: (bot.list_display.callback, ("logs",), {})),
+        (15, True, lambda: (bot.list_display.callback, ("logs", rng.choice(synthetic.ACTIVITIES)), {})),
+        (25, True, lambda: (bot.list_display.callback, ("prompts",), {})),
+        (15, True, lambda: (bot.list_display.callback, ("breaks",), {})),
+        (15, True, lambda: (bot.list_display.callback, ("timezones",), {})),
+        (5, False, lambda: (bot.log.callback, (), {"arg":f"{rng.choice(synthetic.ACTIVITIES)} 20m"})),
+        (3, False, lambda: (bot.schedule.callback, (), {"arg":f"prompt {rng.randint(0, 23):02}:{rng.randint(0, 59):02} Stretch!"})),
+        (2, False, lambda: (bot.schedule.callback, (), {"arg":f"break {rng.choice(synthetic.GAMES)} {rng.randint(1, 90)}m"}))
+    ]
+
+async def workload(bot, user_ids: list, args, cached: bool, verify: bool=False):
+    """
+    Runs ARGS.commands commands one after another from a fixed set of users.
+    Returns (latencies of list commands, cached replies that didn't match a fresh render if VERIFY).
+    """
+    rng = random.Random(args.seed)
+    ops = operations(bot, rng)
+    weights = [weight for weight, _, _ in ops]
+    bot.response_cache.max_entries = args.entries if cached else 0
+    bot.response_cache.hits = bot.response_cache.misses = 0
+    latencies = []
+    mismatches = 0
+    for _ in range(args.commands):
+        _, is_list, op = rng.choices(ops, weights)[0]
+        callback, command_args, command_kwargs = op()
+        ctx = FakeContext(rng.choice(user_ids))
+        began = time.perf_counter()
+        await callback(ctx, *command_args, **command_kwargs)
+        if not is_list:
+            continue
+        latencies.append(time.perf_counter() - began)
+        if verify:
+            # render the same reply again without the cache, keeping what's cached for the next command
+            saved = dict(bot.response_cache.entries)
+            bot.response_cache.entries.clear()
+            fresh = FakeContext(ctx.author.id)
+            await callback(fresh, *command_args, **command_kwargs)
+            mismatches += ctx.replies != fresh.replies
+            bot.response_cache.entries.clear()
+            bot.response_cache.entries.update(saved)
+    return latencies, mismatches
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Building {args.users} synthetic users with {args.days} days of logs...")
+        user_ids = synthetic.build(directory, args.users, args.backend, log_fraction=0.8, days=args.days, seed=args.seed)
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = args.backend
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        bot = importlib.import_module("main")
+        bot.load_state()
+        # only a hot subset of users, like a busy hour
+        active = random.Random(args.seed).sample(user_ids, min(args.active, len(user_ids)))
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for cached in (False, True):
+                results[cached] = asyncio.run(workload(bot, active, args, cached))
+            stats = bot.response_cache.stats()
+            # a separate run, so rendering everything twice doesn't count against the cached timings
+            _, mismatches = asyncio.run(workload(bot, active, args, True, verify=True))
+        bot.io_pool.close()
+        bot.store.close()
+    for cached in (False, True):
+        latencies, _ = results[cached]
+        latencies.sort()
+        print(f"{'cached' if cached else 'uncached':<9} list p50 {percentile(latencies, 50) * 1000:.3f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.3f} ms over {len(latencies)} list commands")
+    print(f"response cache {stats}, timezone table {bot.util.timezones_cache_stats()}")
+    print(f"{mismatches} cached replies differed from a fresh render")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark list commands with and without the response cache.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--active", type=int, default=200, help="users sending commands")
+    parser.add_argument("--days", type=int, default=365, help="days of history in each generated log")
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="sqlite")
+    parser.add_argument("--commands", type=int, default=20000)
+    parser.add_argument("--entries", type=int, default=20000, help="response cache size")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,102 @@
+# benchmark for "list logs" on a user with 5 years of daily history
+# usage: python -m benchmarks.list_logs [--days 1826] [--activities 10] [--repeat 20]
+
+import argparse, io, json, random, time, util
+import datetime as dt
+from activitylog import ActivityLog, LogSummary
+
+def build_csv(days: int, activities: int):
+    """
+    Returns a log csv string in the original format with the given number of days and activities.
+    Roughly a third of cells are left empty, like a real log.
+    """
+    random.seed(0)
+    log_data = ActivityLog()
+    start = dt.date.today() - dt.timedelta(days=days - 1)
+    for day in range(days):
+        for i in range(activities):
+            if random.random() < 0.66:
+                log_data.add(start + dt.timedelta(days=day), f"activity{i}", random.randint(60, 4 * 3600))
+    file = io.StringIO()
+    log_data.to_csv(file)
+    return file.getvalue()
+
+def legacy_list_logs(csv_str: str, activity: str=None):
+    """
+    The pandas implementation of "list logs" that ActivityLog replaced, kept for comparison.
+    """
+    import pandas as pd
+
+    def get_timedelta(row, column, dataframe):
+        try:
+            split_list = dataframe.loc[str(row), column].split(":")
+        except (KeyError, AttributeError):
+            return dt.timedelta(seconds=0)
+        split_list = [int(i) for i in split_list]
+        return dt.timedelta(hours=split_list[0], minutes=split_list[1], seconds=split_list[2])
+
+    dataframe = pd.read_csv(io.StringIO(csv_str), index_col=0)
+    if activity is None:
+        str_to_return = "ACTIVITY [TOTAL TIME]\n"
+        for column in dataframe.columns:
+            total_time = dt.timedelta(seconds=0)
+            for date in dataframe.index:
+                total_time += get_timedelta(date, column, dataframe)
+            str_to_return += f"\n`{column}` [{total_time}]"
+        return str_to_return
+    str_to_return = f"`{activity}`\n\nLast 7 days:"
+    total_time = dt.timedelta(seconds=0)
+    for counter, date in enumerate(dataframe.index):
+        time_logged = get_timedelta(date, activity, dataframe)
+        if counter < 7:
+            str_to_return += f"\n{date} [{time_logged}]"
+        total_time += time_logged
+    return str_to_return + f"\n\nTotal: [{total_time}]"
+
+def list_logs(csv_str: str, activity: str=None):
+    """
+    "list logs" from the full log: parse the csv into an ActivityLog and render it.
+    """
+    return util.display_log(ActivityLog.from_csv(io.StringIO(csv_str)), activity)
+
+def list_logs_summary(summary_str: str, activity: str=None):
+    """
+    The current implementation of "list logs": parse the summary stored with the log and render it.
+    """
+    return util.display_log(LogSummary.from_json(json.loads(summary_str)), activity)
+
+def bench(function, repeat: int, *args):
+    """
+    Returns the best time in milliseconds out of repeat calls of function(*args), and its last result.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark 'list logs' on a long activity log.")
+    parser.add_argument("--days", type=int, default=5 * 365 + 1)
+    parser.add_argument("--activities", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    csv_str = build_csv(args.days, args.activities)
+    summary_str = json.dumps(ActivityLog.from_csv(io.StringIO(csv_str)).summary().to_json())
+    print(f"{args.days} days x {args.activities} activities ({len(csv_str)} bytes of csv, {len(summary_str)} bytes of summary)")
+    for activity in (None, "activity0"):
+        label = "list logs" if activity is None else f"list logs {activity}"
+        summary_ms, summary_result = bench(list_logs_summary, args.repeat, summary_str, activity)
+        new_ms, new_result = bench(list_logs, args.repeat, csv_str, activity)
+        match = "same output" if summary_result == new_result else "OUTPUT DIFFERS"
+        print(f"{label}: stored summary {summary_ms:.3f} ms, full ActivityLog {new_ms:.2f} ms "
+              f"({new_ms / summary_ms:.0f}x faster, {match})")
+        try:
+            old_ms, old_result = bench(legacy_list_logs, max(1, args.repeat // 10), csv_str, activity)
+        except ImportError:
+            print(f"{label}: ActivityLog {new_ms:.2f} ms (pandas not installed, skipping legacy)")
+            continue
+        match = "same output" if old_result == new_result else "OUTPUT DIFFERS"
+        print(f"{label}: ActivityLog {new_ms:.2f} ms, legacy pandas {old_ms:.2f} ms "
+              f"({old_ms / new_ms:.1f}x faster, {match})")
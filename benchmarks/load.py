@@ -0,0 +1,202 @@
+# synthetic load benchmark: runs the real commands and loops from main.py against generated data
+# through a fake context and client, and writes throughput, latency and peak RSS per scenario as json
+# usage: python -m benchmarks.load [--users 10000] [--backend legacy] [--ops 1000] [--output bench_results.json]
+
+import argparse, asyncio, contextlib, importlib, io, json, os, platform, random, resource, sys, tempfile, time
+import datetime as dt
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeClient, FakeContext, FakeMember, FakeActivity
+
+def percentile(sorted_list: list, percent: int):
+    """
+    Returns the nearest-rank percentile of an already sorted list.
+    """
+    index = max(0, -(-len(sorted_list) * percent // 100) - 1)
+    return sorted_list[index]
+
+def peak_rss_kb():
+    """
+    Returns the peak resident set size of this process so far, in KB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KB, macOS reports bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def summarize(latencies: list, seconds: float, units: int=None):
+    """
+    Returns the stats dict for one scenario. LATENCIES are seconds per operation,
+    SECONDS is the wall time of the whole scenario, and UNITS is how many things
+    were processed if that isn't one per operation (e.g. prompts in a minute).
+    """
+    ordered = sorted(latencies)
+    units = units if units is not None else len(latencies)
+    return {
+        "ops":len(latencies),
+        "units":units,
+        "seconds":round(seconds, 6),
+        "throughput":round(units / seconds, 2) if seconds > 0 else None,
+        "p50_ms":round(percentile(ordered, 50) * 1000, 3),
+        "p99_ms":round(percentile(ordered, 99) * 1000, 3),
+        "max_ms":round(ordered[-1] * 1000, 3),
+        "peak_rss_kb":peak_rss_kb()
+    }
+
+async def run_scenario(calls: list):
+    """
+    Awaits every zero-argument coroutine function in CALLS one after another.
+    Returns (latencies, total seconds).
+    """
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        began = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - began)
+    return latencies, time.perf_counter() - start
+
+def command(callback, user_id: int, latency: float, *args, **kwargs):
+    """
+    Returns a coroutine function that runs a command callback as USER_ID.
+    """
+    return lambda: callback(FakeContext(user_id, latency), *args, **kwargs)
+
+def command_scenarios(main, user_ids: list, args, rng: random.Random):
+    """
+    Returns {scenario name: list of calls} for the commands, with arguments picked up front
+    so only the commands themselves are timed.
+    """
+    pick = lambda: rng.choice(user_ids)
+    latency = args.latency
+    scenarios = {}
+    scenarios["log"] = [command(main.log.callback, pick(), latency, arg=f"{rng.choice(synthetic.ACTIVITIES)} {rng.randint(1, 90)}m")
+                        for _ in range(args.ops)]
+    scenarios["schedule prompt"] = [command(main.schedule.callback, pick(), latency,
+                                            arg=f"prompt {rng.randint(0, 23):02}:{rng.randint(0, 59):02} Drink some water!")
+                                    for _ in range(args.ops)]
+    scenarios["schedule break"] = [command(main.schedule.callback, pick(), latency, arg=f"break {rng.choice(['minecraft', 'valorant', 'celeste'])} 45m")
+                                   for _ in range(args.ops)]
+    scenarios["list logs"] = [command(main.list_display.callback, pick(), latency, "logs") for _ in range(args.ops)]
+    scenarios["list prompts"] = [command(main.list_display.callback, pick(), latency, "prompts") for _ in range(args.ops)]
+    scenarios["delete prompt"] = [command(main.delete.callback, pick(), latency, arg="prompt 1") for _ in range(args.ops)]
+    # merging needs two activities the user actually has
+    merges = []
+    while len(merges) < args.ops:
+        user_id = pick()
+        log_data = main.store.load_log(user_id)
+        if log_data is not None and len(log_data.activities) >= 2:
+            first, second = rng.sample(log_data.activities, 2)
+            merges.append(command(main.merge.callback, user_id, latency, arg=f"{first} {second} {first}"))
+    scenarios["merge"] = merges
+    scenarios["timezone"] = [command(main.timezone.callback, pick(), latency, str(rng.randint(-11, 14))) for _ in range(args.ops)]
+    return scenarios
+
+async def deliver_minute(main, due: dt.datetime, user_ids: list):
+    """
+    Queues a minute's prompts the way prompt_scheduler does, then sends them from the outbox like run_outbox() would.
+    """
+    await main.prompt_users(due, user_ids)
+    while await main.send_outbox_batch() == main.OUTBOX_BATCH:
+        pass
+
+def loop_scenarios(main, user_ids: list, args, rng: random.Random):
+    """
+    Returns {scenario name: (list of calls, units processed)} for the loops and events.
+    """
+    now = dt.datetime.utcnow()
+    scenarios = {}
+    # the busiest minutes of the day, as prompt_scheduler would fire them
+    buckets = main.prompt_scheduler.buckets
+    busiest = sorted(range(len(buckets)), key=lambda i: len(buckets[i]), reverse=True)[:args.minutes]
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    scenarios["prompt_users"] = ([(lambda i=i: deliver_minute(main, midnight + dt.timedelta(minutes=i), list(buckets[i]))) for i in busiest],
+                                 sum(len(buckets[i]) for i in busiest))
+    scenarios["hourly_update"] = ([main.hourly_update for _ in range(args.minutes)], None)
+    # presence updates from registered users starting and stopping games
+    presences = []
+    for _ in range(args.ops):
+        activities = [FakeActivity(rng.choice(synthetic.GAMES), now - dt.timedelta(minutes=rng.randint(0, 180)))] if rng.random() < 0.7 else []
+        member = FakeMember(rng.choice(user_ids), activities)
+        presences.append(lambda member=member: main.on_presence_update(member, member))
+    scenarios["presence update"] = (presences, None)
+    scenarios["break reminder"] = ([(lambda user_id=rng.choice(user_ids): main.send_break_reminder(user_id, "minecraft")) for _ in range(args.ops)], None)
+    return scenarios
+
+async def run_all(main, user_ids: list, args):
+    """
+    Runs every scenario, flushing the cache and compacting the journal after each one
+    like flush_data would. Returns {scenario name: stats}.
+    """
+    rng = random.Random(args.seed)
+    results = {}
+    flushes = []
+    for name, calls in command_scenarios(main, user_ids, args, rng).items():
+        latencies, seconds = await run_scenario(calls)
+        results[name] = summarize(latencies, seconds)
+        flush_latencies, _ = await run_scenario([main.flush_data])
+        flushes.extend(flush_latencies)
+    for name, (calls, units) in loop_scenarios(main, user_ids, args, rng).items():
+        latencies, seconds = await run_scenario(calls)
+        results[name] = summarize(latencies, seconds, units)
+    results["flush_data"] = summarize(flushes, sum(flushes))
+    return results
+
+def main(args):
+    with contextlib.ExitStack() as stack:
+        directory = args.directory or stack.enter_context(tempfile.TemporaryDirectory())
+        if not os.path.exists(os.path.join(directory, "users_index.json")):
+            print(f"Building {args.users} synthetic users in {directory}...")
+            synthetic.build(directory, args.users, args.backend, days=args.days, seed=args.seed)
+        with open(os.path.join(directory, "users_index.json"), "r") as file:
+            user_ids = json.load(file)
+        # main.py reads where its data lives when it's imported
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = args.backend
+        # don't open the metrics port from a benchmark
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        began = time.perf_counter()
+        bot = importlib.import_module("main")
+        bot.load_state()
+        elapsed = time.perf_counter() - began
+        startup = summarize([elapsed], elapsed)
+        bot.prompt_fanout.client = FakeClient(args.latency)
+        # the commands print as they go; keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(run_all(bot, user_ids, args))
+        results = {"startup":startup, **results}
+        bot.users.flush()
+        bot.store.compact()
+        bot.store.close()
+    report = {
+        "config":{
+            "users":len(user_ids),
+            "backend":args.backend,
+            "ops":args.ops,
+            "minutes":args.minutes,
+            "latency":args.latency,
+            "seed":args.seed,
+            "python":platform.python_version(),
+            "platform":platform.platform(),
+            "time":dt.datetime.utcnow().isoformat()
+        },
+        "scenarios":results
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"{'scenario':<18}{'ops':>7}{'per sec':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak RSS MB':>13}")
+    for name, stats in results.items():
+        print(f"{name:<18}{stats['ops']:>7}{stats['throughput'] or 0:>12.1f}{stats['p50_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['peak_rss_kb'] / 1024:>13.1f}")
+    print(f"Wrote {args.output}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run cornbot's commands and loops against synthetic data.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="legacy")
+    parser.add_argument("--days", type=int, default=90, help="days of history in each generated log")
+    parser.add_argument("--ops", type=int, default=1000, help="operations per command scenario")
+    parser.add_argument("--minutes", type=int, default=10, help="busiest minutes to run prompt_users for")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per fake API call or reply")
+    parser.add_argument("--directory", help="reuse (or build into) this data folder instead of a temp one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    main(parser.parse_args())
@@ -0,0 +1,150 @@
+# measures how late the event loop gets under a mixed command workload against users with long logs,
+# with storage work on the I/O thread (pool) and run inline on the event loop like before (inline)
+# usage: python -m benchmarks.loop_latency [--users 2000] [--days 3650] [--clients 50] [--seconds 5]
+
+import argparse, asyncio, contextlib, importlib, io, json, os, random, shutil, subprocess, sys, tempfile, time
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeContext
+from benchmarks.load import percentile
+
+# how often the probe task asks to wake up; anything later than this is time the loop was blocked
+PROBE_SECONDS = 0.001
+
+def run_inline(bot):
+    """
+    Makes the bot run its storage calls directly on the event loop, the way it did before the I/O thread.
+    """
+    import journal, atomicwrite
+
+    async def inline(function, *args, **kwargs):
+        return function(*args, **kwargs)
+
+    bot.io_pool.run = inline
+    bot.io_pool.compute = inline
+    # delayed fsyncs and commits go back to being loop timers too
+    bot.mutation_journal.call_later = journal._loop_call_later
+    if hasattr(bot.store.base, "writer"):
+        bot.store.base.writer.call_later = atomicwrite._loop_call_later
+
+def operations(bot, rng: random.Random):
+    """
+    Returns a list of (weight, function(user_id) returning a coroutine), roughly the mix of a busy hour.
+    """
+    def command(callback, *args, **kwargs):
+        return lambda user_id: callback(FakeContext(user_id, 0.001), *args, **kwargs)
+
+    return [
+        (30, command(bot.log.callback, arg=f"{rng.choice(synthetic.ACTIVITIES)} 20m")),
+        (30, command(bot.list_display.callback, "logs")),
+        (15, command(bot.list_display.callback, "prompts")),
+        (15, command(bot.schedule.callback, arg=f"prompt {rng.randint(0, 23):02}:{rng.randint(0, 59):02} Drink some water!")),
+        (10, command(bot.timezone.callback, str(rng.randint(-11, 14))))
+    ]
+
+async def workload(bot, user_ids: list, args):
+    """
+    Runs ARGS.clients clients sending commands back to back for ARGS.seconds, flushing every second
+    like flush_data would, while a probe measures how late the loop wakes it up.
+    Returns (loop lags, command latencies).
+    """
+    stop = time.perf_counter() + args.seconds
+    lags = []
+    latencies = []
+
+    async def probe():
+        while time.perf_counter() < stop:
+            began = time.perf_counter()
+            await asyncio.sleep(PROBE_SECONDS)
+            lags.append(time.perf_counter() - began - PROBE_SECONDS)
+
+    async def client(rng: random.Random):
+        ops = operations(bot, rng)
+        weights = [weight for weight, _ in ops]
+        while time.perf_counter() < stop:
+            op = rng.choices(ops, weights)[0][1]
+            began = time.perf_counter()
+            await op(rng.choice(user_ids))
+            latencies.append(time.perf_counter() - began)
+
+    async def flusher():
+        while time.perf_counter() < stop:
+            await asyncio.sleep(1)
+            await bot.flush_data()
+
+    await asyncio.gather(probe(), flusher(), *(client(random.Random(args.seed + i)) for i in range(args.clients)))
+    return lags, latencies
+
+def run_mode(args):
+    """
+    Child process: imports the bot against ARGS.directory, runs the workload in ARGS.run mode,
+    and prints the stats as one json line.
+    """
+    with open(os.path.join(args.directory, "users_index.json"), "r") as file:
+        user_ids = json.load(file)
+    os.environ["CORNBOT_DIRECTORY"] = args.directory
+    os.environ["CORNBOT_STORAGE"] = args.backend
+    os.environ["CORNBOT_IO_PROCESSES"] = str(args.processes)
+    os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+    bot = importlib.import_module("main")
+    bot.load_state()
+    if args.run == "inline":
+        run_inline(bot)
+    with contextlib.redirect_stdout(io.StringIO()):
+        lags, latencies = asyncio.run(workload(bot, user_ids, args))
+    bot.io_pool.close()
+    bot.users.flush()
+    bot.store.compact()
+    bot.store.close()
+    lags.sort()
+    latencies.sort()
+    print(json.dumps({
+        "mode":args.run,
+        "commands":len(latencies),
+        "per_sec":round(len(latencies) / args.seconds, 1),
+        "command_p50_ms":round(percentile(latencies, 50) * 1000, 3),
+        "command_p99_ms":round(percentile(latencies, 99) * 1000, 3),
+        "lag_p50_ms":round(percentile(lags, 50) * 1000, 3),
+        "lag_p99_ms":round(percentile(lags, 99) * 1000, 3),
+        "lag_max_ms":round(lags[-1] * 1000, 3)
+    }))
+
+def main(args):
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "data")
+        print(f"Building {args.users} synthetic users with {args.days} days of logs in {source}...")
+        synthetic.build(source, args.users, args.backend, log_fraction=0.8, days=args.days, seed=args.seed)
+        for mode in ("inline", "pool"):
+            # every mode starts from the same data; the commands change it
+            directory = os.path.join(root, mode)
+            shutil.copytree(source, directory)
+            child = subprocess.run([sys.executable, "-m", "benchmarks.loop_latency", "--run", mode, "--directory", directory,
+                                    *sys.argv[1:]], capture_output=True, text=True, check=True)
+            results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    print(f"{'mode':<8}{'cmds/s':>9}{'cmd p50 ms':>12}{'cmd p99 ms':>12}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for result in results:
+        print(f"{result['mode']:<8}{result['per_sec']:>9.1f}{result['command_p50_ms']:>12.3f}{result['command_p99_ms']:>12.3f}"
+              f"{result['lag_p50_ms']:>12.3f}{result['lag_p99_ms']:>12.3f}{result['lag_max_ms']:>12.3f}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"config":vars(args), "results":results}, file, indent=2)
+        print(f"Wrote {args.output}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure event loop lag under a mixed workload, with and without the I/O thread.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=3650, help="days of history in each generated log")
+    parser.add_argument("--clients", type=int, default=50, help="commands in flight at once")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="legacy")
+    parser.add_argument("--processes", type=int, default=0, help="CORNBOT_IO_PROCESSES for the pool run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results here as json")
+    # used by main() to run one mode in a fresh process
+    parser.add_argument("--run", choices=["inline", "pool"], help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_mode(args)
+    else:
+        main(args)
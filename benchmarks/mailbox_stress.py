@@ -0,0 +1,137 @@
+# stress test for the per-user mailboxes: fires many commands per user at once, with replies that
+# take real time to send so commands interleave, then checks that no update was lost
+# usage: python -m benchmarks.mailbox_stress [--users 200] [--commands 20] [--latency 0.002] [--unserialized]
+
+import argparse, asyncio, contextlib, importlib, io, json, os, random, sys, tempfile, time
+import scheduler
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeContext
+
+def plan(main, user_ids: list, commands: int, rng: random.Random):
+    """
+    Returns (calls, expected): the command calls to fire, in a shuffled order that interleaves users,
+    and {user_id: {"tz": final offset, "new_prompts": set of times, "activity": name, "seconds": total logged}}.
+    Each user gets COMMANDS commands: new prompts and logs, plus one timezone change somewhere in the middle.
+    """
+    calls = []
+    expected = {}
+    for user_id in user_ids:
+        user_json = main.users.get(user_id)
+        log_data = main.store.load_log(user_id)
+        # log to an activity the user already has, so the 10 activity limit never rejects one
+        activity = log_data.activities[0] if log_data is not None and len(log_data.activities) else "stress"
+        free_times = [f"{h:02}:{m:02}" for h in range(24) for m in range(0, 60, 7)
+                      if f"{h:02}:{m:02}" not in user_json["prompts"]]
+        user_calls = [(main.timezone.callback, (str(rng.randint(-11, 14)),), {})]
+        new_prompts = set(rng.sample(free_times, commands // 2))
+        for time in new_prompts:
+            user_calls.append((main.schedule.callback, (), {"arg":f"prompt {time} Stretch!"}))
+        seconds = 0
+        while len(user_calls) < commands:
+            minutes = rng.randint(1, 5)
+            seconds += minutes * 60
+            user_calls.append((main.log.callback, (), {"arg":f"{activity} {minutes}m"}))
+        expected[user_id] = {
+            "tz":int(user_calls[0][1][0]),
+            "new_prompts":new_prompts,
+            "activity":activity,
+            "seconds":seconds,
+            "before":_activity_total(log_data, activity)
+        }
+        # the timezone change lands somewhere among the user's other commands
+        rng.shuffle(user_calls)
+        calls.extend((user_id, call) for call in user_calls)
+    rng.shuffle(calls)
+    return calls, expected
+
+def verify(main, expected: dict):
+    """
+    Checks every user's final state against what their commands should have added up to.
+    Returns {check name: number of users that failed it}.
+    """
+    hours = {hr:main.store.load_hour(hr) for hr in range(24)}
+    # user_id -> slots the scheduler actually has them in
+    scheduled = {}
+    for i, bucket in enumerate(main.prompt_scheduler.buckets):
+        for user_id in bucket:
+            scheduled.setdefault(user_id, set()).add(i)
+    # user_id -> slots the hour jsons actually have them in
+    in_hours = {}
+    for hr, hour_json in hours.items():
+        for minute, user_ids in hour_json.items():
+            for user_id in user_ids:
+                in_hours.setdefault(user_id, set()).add(scheduler.slot(hr, int(minute)))
+    failures = {"timezone":0, "prompts":0, "scheduler":0, "hour_jsons":0, "log_totals":0}
+    for user_id, wanted in expected.items():
+        user_json = main.users.get(user_id)
+        if user_json["tz"] != wanted["tz"]:
+            failures["timezone"] += 1
+        if not wanted["new_prompts"] <= set(user_json["prompts"]):
+            failures["prompts"] += 1
+        # every prompt the user has should be in exactly the slot its time and the final offset give
+        slots = {scheduler.slot((int(time[:2]) - user_json["tz"]) % 24, int(time[3:])) for time in user_json["prompts"]}
+        if scheduled.get(user_id, set()) != slots:
+            failures["scheduler"] += 1
+        if in_hours.get(user_id, set()) != slots:
+            failures["hour_jsons"] += 1
+        total = _activity_total(main.store.load_log(user_id), wanted["activity"])
+        if total - wanted["before"] != wanted["seconds"]:
+            failures["log_totals"] += 1
+    return failures
+
+async def fire(calls: list, latency: float, unserialized: bool):
+    """
+    Runs every call at once. With UNSERIALIZED, skips the mailboxes to show the races they prevent.
+    Returns the wall time.
+    """
+    async def run(user_id, callback, args, kwargs):
+        if unserialized:
+            callback = callback.__wrapped__
+        await callback(FakeContext(user_id, latency), *args, **kwargs)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(user_id, *call) for user_id, call in calls))
+    return time.perf_counter() - start
+
+def _activity_total(log_data, activity: str):
+    if log_data is None or not log_data.has(activity):
+        return 0
+    return int(log_data.totals()[log_data.activities.index(activity)])
+
+def main(args):
+    with contextlib.ExitStack() as stack:
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        print(f"Building {args.users} synthetic users in {directory}...")
+        synthetic.build(directory, args.users, args.backend, days=7, seed=args.seed)
+        with open(os.path.join(directory, "users_index.json"), "r") as file:
+            user_ids = json.load(file)
+        # main.py reads where its data lives when it's imported
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = args.backend
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        bot = importlib.import_module("main")
+        bot.load_state()
+        calls, expected = plan(bot, user_ids, args.commands, random.Random(args.seed))
+        # the commands print as they go; keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = asyncio.run(fire(calls, args.latency, args.unserialized))
+        bot.users.flush()
+        failures = verify(bot, expected)
+        bot.store.compact()
+        bot.store.close()
+    print(f"{len(calls)} commands from {len(user_ids)} users in {seconds:.2f}s "
+          f"({'unserialized' if args.unserialized else 'mailboxes'}, {args.latency * 1000:.1f}ms per reply)")
+    print(f"mailboxes: {bot.user_mailboxes.stats()}, hour owner jobs: {bot.hour_owner.jobs}")
+    for check, failed in failures.items():
+        print(f"{check:<12}{failed:>6} users with lost updates")
+    return 1 if any(failures.values()) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fire concurrent commands per user and check none of their updates were lost.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=20, help="commands per user, all in flight at once")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds each reply takes to send")
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="legacy")
+    parser.add_argument("--unserialized", action="store_true", help="bypass the mailboxes, to see the races they prevent")
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,43 @@
+# measures what recording metrics costs per call, with metrics on, off, and not wrapped at all
+# usage: python -m benchmarks.metrics_overhead [--calls 100000]
+
+import argparse, asyncio, tempfile, time, metrics, storage
+import datetime as dt
+
+async def time_calls(function, calls: int):
+    """
+    Returns the average seconds per call of an async function.
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        await function()
+    return (time.perf_counter() - start) / calls
+
+async def main(args):
+    store = storage.LegacyStorage(tempfile.mkdtemp())
+    today = dt.date.today()
+
+    async def noop():
+        pass
+
+    async def log_time():
+        # roughly what the log command does to storage
+        store.log_time(1, today, "running", 60)
+
+    print(f"{'function':<12}{'bare (us)':>12}{'off (us)':>12}{'on (us)':>12}{'overhead (us)':>16}")
+    for function, calls in ((noop, args.calls), (log_time, args.calls // 100)):
+        bare = await time_calls(function, calls)
+        off = metrics.Metrics(enabled=False)
+        disabled = await time_calls(off.instrument("loop")(function), calls)
+        on = metrics.Metrics(enabled=True)
+        enabled = await time_calls(on.instrument("loop")(function), calls)
+        print(f"{function.__name__:<12}{bare * 1e6:>12.2f}{disabled * 1e6:>12.2f}{enabled * 1e6:>12.2f}"
+              f"{on.overhead / calls * 1e6:>16.2f}")
+    totals = on.totals[("loop", "log_time")]
+    print(f"\nlog_time per call: {totals['written_bytes'] / (args.calls // 100):.0f} B written, "
+          f"{totals['files_opened'] / (args.calls // 100):.1f} files opened")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the per-call cost of recording metrics.")
+    parser.add_argument("--calls", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
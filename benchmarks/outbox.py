@@ -0,0 +1,142 @@
+# starts the bot after it was down for a while, with some users' DMs closed and some sends failing once,
+# on an accelerated clock; checks the missed minutes were caught up, failed sends were retried or given up on,
+# and that the backlog didn't hold up the prompts coming due after the start
+# usage: python -m benchmarks.outbox [--users 100000] [--down 30] [--minutes 10] [--speed 60]
+
+import argparse, asyncio, contextlib, importlib, io, os, random, tempfile, time
+import datetime as dt
+import clock, outbox, scheduler
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeClient
+from benchmarks.load import percentile
+
+class FailOnce(set):
+    """
+    User ids whose next send fails, and then works.
+    """
+
+    def __contains__(self, user_id):
+        if super().__contains__(user_id):
+            self.discard(user_id)
+            return True
+        return False
+
+class FlakyClient(FakeClient):
+    """
+    FakeClient whose sends fail for CLOSED users every time, and for FLAKY users the first time.
+    """
+
+    def __init__(self, latency: float, closed: set, flaky: set):
+        super().__init__(latency)
+        self.fail_ids = FailOnce(flaky)
+        self.closed = closed
+
+    async def fetch_user(self, user_id: int):
+        if user_id in self.closed:
+            await self.api_call()
+            raise PermissionError(f"Cannot send messages to user {user_id}")
+        return await super().fetch_user(user_id)
+
+async def run(bot, start: dt.datetime, end: dt.datetime):
+    """
+    Runs the bot's loops from START to END, then until the outbox is empty. Returns every send_all() call as
+    (due, real seconds after starting, user ids, failed user ids, stats).
+    """
+    calls = []
+    send_all = bot.prompt_fanout.send_all
+    began = time.perf_counter()
+
+    async def recording_send_all(due: dt.datetime, messages: list):
+        stats = await send_all(due, messages)
+        calls.append((due, time.perf_counter() - began, [user_id for user_id, _ in messages], list(stats["failed_ids"]), stats))
+        return stats
+
+    bot.prompt_fanout.send_all = recording_send_all
+    bot.start_loops()
+    bot.retention_task.cancel()
+    await bot.bot_clock.sleep_until(end + dt.timedelta(seconds=5))
+    bot.prompt_scheduler.stop()
+    # no new minutes after END, but let the retries play out; the last one is at most 2 ** attempts retry periods away
+    give_up = bot.bot_clock.now() + dt.timedelta(seconds=bot.OUTBOX_RETRY_SECONDS * 2 ** bot.OUTBOX_MAX_ATTEMPTS)
+    while bot.prompt_outbox.pending and bot.bot_clock.now() < give_up:
+        await bot.bot_clock.sleep_until(bot.bot_clock.now() + dt.timedelta(seconds=10))
+    bot.break_tracker.stop()
+    bot.hourly_task.cancel()
+    bot.zone_task.cancel()
+    bot.outbox_task.cancel()
+    bot.flush_data.cancel()
+    return calls
+
+def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        start = dt.datetime.combine(dt.date.today(), dt.time(12)) + dt.timedelta(seconds=0.5)
+        end = start + dt.timedelta(minutes=args.minutes)
+        print(f"Building {args.users} users, down for the {args.down} minutes before {start:%H:%M}...")
+        user_ids = synthetic.build(directory, args.users, "sqlite", log_fraction=0, seed=args.seed)
+        # the last minute the previous run fired
+        last_run = outbox.Outbox(os.path.join(directory, "outbox.db"), 0, 1)
+        last_run.add(start.replace(second=0, microsecond=0) - dt.timedelta(minutes=args.down), [])
+        last_run.close()
+        closed = set(rng.sample(user_ids, int(len(user_ids) * args.closed)))
+        flaky = set(rng.sample(user_ids, int(len(user_ids) * args.flaky))) - closed
+        clock.set_default_clock(clock.AcceleratedClock(start, args.speed))
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = "sqlite"
+        os.environ["CORNBOT_CATCH_UP_MINUTES"] = str(args.window)
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        bot = importlib.import_module("main")
+        bot.load_state()
+        bot.prompt_fanout.client = FlakyClient(args.latency, closed, flaky)
+        # every (due, user_id) that should go out: the missed minutes in the window, then the ones while running
+        expected = set()
+        due = bot.catch_up_since + dt.timedelta(minutes=1)
+        while due <= end:
+            expected |= {(due, user_id) for user_id in bot.prompt_scheduler.buckets[scheduler.slot(due.hour, due.minute)]}
+            due += dt.timedelta(minutes=1)
+        print(f"Running {start:%H:%M} to {end:%H:%M} at {args.speed:g}x, catching up from {bot.catch_up_since:%H:%M}...")
+        with contextlib.redirect_stdout(io.StringIO()):
+            calls = asyncio.run(run(bot, start, end))
+        stats = bot.prompt_outbox.stats()
+        bot.io_pool.close()
+        bot.store.close()
+        bot.prompt_outbox.close()
+
+    delivered = {}
+    for due, _, user_ids_, failed_ids, _ in calls:
+        for user_id in set(user_ids_) - set(failed_ids):
+            delivered[(due, user_id)] = delivered.get((due, user_id), 0) + 1
+    closed_expected = {(due, user_id) for due, user_id in expected if user_id in closed}
+    missed = len(expected - closed_expected - set(delivered))
+    duplicates = sum(count - 1 for count in delivered.values())
+    flaky_recovered = sum(1 for due, user_id in delivered if user_id in flaky)
+    # when the missed minutes' prompts had all been tried once; retries of the failed ones go on for minutes after
+    backlog = [seconds for due, seconds, user_ids_, _, _ in calls if due < start and set(user_ids_) - flaky - closed]
+    # first tries only, in real seconds, which is what a restart at normal speed would see
+    new_lag = sorted(call_stats["max"] / args.speed for due, _, user_ids_, _, call_stats in calls
+                     if due >= start and set(user_ids_) - flaky - closed)
+    print(f"  {'prompts expected':<34}{len(expected)} ({sum(due < start for due, _ in expected)} from the missed minutes)")
+    print(f"  {'missed / duplicates':<34}{missed} / {duplicates}")
+    print(f"  {'closed DMs given up on':<34}{stats['dropped']} of {len(closed_expected)}, after {bot.OUTBOX_MAX_ATTEMPTS} attempts each")
+    print(f"  {'failed once, then sent':<34}{flaky_recovered} ({stats['retried']} retries in all)")
+    if backlog:
+        print(f"  {'missed minutes all tried after':<34}{max(backlog):.2f} s real")
+    if new_lag:
+        print(f"  {'new minutes, slowest prompt':<34}p50 {percentile(new_lag, 50):.3f} s, max {new_lag[-1]:.3f} s real")
+    print(f"  {'send_all calls':<34}{len(calls)}, outbox left with {stats['pending']}")
+    ok = missed == 0 and duplicates == 0 and stats["dropped"] == len(closed_expected) and stats["pending"] == 0
+    print("Every prompt went out once or was given up on." if ok else "Outbox run found errors.")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restart the bot after downtime with failing sends and check the outbox.")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--down", type=int, default=30, help="simulated minutes the bot was down before starting")
+    parser.add_argument("--window", type=int, default=60, help="CORNBOT_CATCH_UP_MINUTES")
+    parser.add_argument("--minutes", type=int, default=10, help="simulated minutes to run after starting")
+    parser.add_argument("--speed", type=float, default=60, help="simulated seconds per real second")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per fake API call")
+    parser.add_argument("--closed", type=float, default=0.01, help="fraction of users whose DMs are closed")
+    parser.add_argument("--flaky", type=float, default=0.02, help="fraction of users whose first send fails")
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(0 if main(parser.parse_args()) else 1)
@@ -0,0 +1,50 @@
+# benchmark for sending one busy minute of prompts through a fake client with simulated latency
+# usage: python -m benchmarks.prompt_fanout [--users 1000] [--latency 0.005] [--concurrency 50]
+
+import argparse, asyncio, time, fanout
+import datetime as dt
+from benchmarks.fake_discord import FakeClient
+
+async def sequential(client: FakeClient, messages: list):
+    """
+    The original prompt loop: fetch_user() then send, one user at a time.
+    Returns how many seconds it took.
+    """
+    start = time.perf_counter()
+    for user_id, content in messages:
+        user = await client.fetch_user(user_id)
+        await user.send(content)
+    return time.perf_counter() - start
+
+async def concurrent(client: FakeClient, messages: list, concurrency: int):
+    """
+    Sends through PromptFanout twice, so the second minute shows the DM channel cache warm.
+    Returns a list of (seconds taken, lag stats) for each minute.
+    """
+    prompt_fanout = fanout.PromptFanout(client, concurrency)
+    results = []
+    for _ in range(2):
+        due = dt.datetime.utcnow()
+        start = time.perf_counter()
+        stats = await prompt_fanout.send_all(due, messages)
+        results.append((time.perf_counter() - start, stats))
+    return results
+
+async def main(args):
+    messages = [(user_id, "What's something you did today that you're proud of?") for user_id in range(args.users)]
+    client = FakeClient(args.latency, args.jitter)
+    seconds = await sequential(client, messages)
+    print(f"sequential: {seconds:.2f} s for {args.users} prompts, {client.api_calls} API calls")
+    client = FakeClient(args.latency, args.jitter)
+    for i, (seconds, stats) in enumerate(await concurrent(client, messages, args.concurrency)):
+        print(f"fanout minute {i + 1} ({'cold' if i == 0 else 'warm'} cache): {seconds:.2f} s, "
+              f"lag p50 {stats['p50']:.3f} s, p99 {stats['p99']:.3f} s, max {stats['max']:.3f} s")
+    print(f"fanout made {client.api_calls} API calls in total")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark prompt delivery for one busy minute.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per fake API call")
+    parser.add_argument("--jitter", type=float, default=0.005, help="up to this many extra seconds per call")
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
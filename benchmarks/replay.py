@@ -0,0 +1,250 @@
+# replays a day of DM commands and presence changes through the bot on an accelerated clock,
+# checks that every prompt fired exactly once, and reports how late the scheduler fired
+# usage: python -m benchmarks.replay [--users 2000] [--hours 24] [--speed 1000] [--events events.jsonl]
+
+import argparse, asyncio, contextlib, importlib, io, itertools, json, os, random, sys, tempfile, time
+import datetime as dt
+import clock, scheduler
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeClient, FakeContext, FakeMember, FakeActivity
+
+def generate_events(user_ids: list, hours: int, per_hour: int, rng: random.Random):
+    """
+    Returns a list of event dicts spread randomly over HOURS hours, sorted by time.
+    Each has "at" (seconds after the replay starts) and "user_id", then either
+    "command", "args" and "kwargs", or "presence" (a game name, or None for no game).
+    About 5% are new users registering, which gives them the default 20:00 prompt.
+    """
+    events = []
+    next_new_id = max(user_ids) + 1
+    registered = list(user_ids)
+    # half-second offsets keep events off minute boundaries
+    times = sorted(rng.randrange(hours * 60 * 60) + 0.5 for _ in range(hours * per_hour))
+    # going in time order means new users only show up in events after they've registered
+    for at in times:
+        kind = rng.random()
+        if kind < 0.05:
+            event = {"user_id":next_new_id, "command":"timezone", "args":[str(rng.randint(-11, 14))], "kwargs":{}}
+            registered.append(next_new_id)
+            next_new_id += 1
+        elif kind < 0.3:
+            time = f"{rng.randint(0, 23):02}:{rng.randint(0, 59):02}"
+            event = {"command":"schedule", "args":[], "kwargs":{"arg":f"prompt {time} Drink some water!"}}
+        elif kind < 0.45:
+            event = {"command":"delete", "args":[], "kwargs":{"arg":"prompt 1"}}
+        elif kind < 0.6:
+            # timezone changes move every one of the user's prompts mid-hour
+            event = {"command":"timezone", "args":[str(rng.randint(-11, 14))], "kwargs":{}}
+        elif kind < 0.8:
+            event = {"command":"log", "args":[], "kwargs":{"arg":f"{rng.choice(synthetic.ACTIVITIES)} {rng.randint(5, 90)}m"}}
+        else:
+            event = {"presence":rng.choice(synthetic.GAMES) if rng.random() < 0.7 else None}
+        event.setdefault("user_id", rng.choice(registered))
+        event["at"] = at
+        events.append(event)
+    return events
+
+async def user_slots(main, user_id: int):
+    """
+    Returns the set of minute-of-day slots a user's prompts are scheduled in, going by their user json.
+    """
+    user_json = await main.io_pool.run(main.users.get, user_id)
+    if user_json is None:
+        return frozenset()
+    return frozenset(scheduler.slot((int(time[:2]) - user_json["tz"]) % 24, int(time[3:])) for time in user_json["prompts"])
+
+async def apply_event(main, event: dict, commands: dict):
+    if "presence" in event:
+        activities = [FakeActivity(event["presence"], main.bot_clock.now())] if event["presence"] else []
+        member = FakeMember(event["user_id"], activities)
+        await main.on_presence_update(member, member)
+    else:
+        await commands[event["command"]].callback(FakeContext(event["user_id"]), *event["args"], **event["kwargs"])
+
+async def replay(main, events: list, start: dt.datetime, hours: int):
+    """
+    Runs the bot's loops while feeding EVENTS in at their times.
+    Returns (fires, changes, initial slots, hourly update times), where fires are
+    (due, fired at, user_ids) for every minute the scheduler fired and changes are
+    (time, user_id, slots) for every event that changed someone's prompt times.
+    """
+    bot_clock = main.bot_clock
+    commands = {"log":main.log, "schedule":main.schedule, "delete":main.delete, "timezone":main.timezone,
+                "list":main.list_display, "merge":main.merge, "reset":main.reset}
+    fires = []
+    hourly_updates = []
+    prompt_users = main.prompt_scheduler.callback
+    hourly_update = main.hourly_update
+
+    async def recording_prompt_users(due: dt.datetime, user_ids: list):
+        fires.append((due, bot_clock.now(), list(user_ids)))
+        await prompt_users(due, user_ids)
+
+    async def recording_hourly_update():
+        hourly_updates.append(bot_clock.now())
+        await hourly_update()
+
+    main.prompt_scheduler.callback = recording_prompt_users
+    # run_hourly_updates() looks hourly_update up by name each time
+    main.hourly_update = recording_hourly_update
+    initial = {}
+    for i, bucket in enumerate(main.prompt_scheduler.buckets):
+        for user_id in bucket:
+            initial.setdefault(user_id, set()).add(i)
+    slots = {user_id:frozenset(user_slots) for user_id, user_slots in initial.items()}
+    changes = []
+    bot_clock.jump(start)
+    main.start_loops()
+    for event in events:
+        await bot_clock.sleep_until(start + dt.timedelta(seconds=event["at"]))
+        await apply_event(main, event, commands)
+        if "command" in event:
+            changed_at = bot_clock.now()
+            new_slots = await user_slots(main, event["user_id"])
+            if new_slots != slots.get(event["user_id"], frozenset()):
+                slots[event["user_id"]] = new_slots
+                changes.append((changed_at, event["user_id"], new_slots))
+    # give the last minute of the replay time to fire
+    await bot_clock.sleep_until(start + dt.timedelta(hours=hours, seconds=5))
+    main.prompt_scheduler.stop()
+    main.break_tracker.stop()
+    main.hourly_task.cancel()
+    main.flush_data.cancel()
+    return fires, changes, initial, hourly_updates
+
+def verify(fires: list, changes: list, initial: dict, start: dt.datetime, hours: int, margin: float=0.0):
+    """
+    Checks every minute of the replay against what the schedule said at the time.
+    A user who changed their prompts between a minute starting and it firing could
+    go either way, so those are counted as ambiguous instead of checked; so are changes
+    up to MARGIN seconds before a minute, for changes that take a while to reach the scheduler.
+    Returns a dict of counts and drift stats.
+    """
+    fired_by_minute = {}
+    duplicates = 0
+    for due, fired_at, user_ids in fires:
+        if due in fired_by_minute:
+            duplicates += len(user_ids)
+            continue
+        if len(set(user_ids)) != len(user_ids):
+            duplicates += len(user_ids) - len(set(user_ids))
+        fired_by_minute[due] = (fired_at, set(user_ids))
+    # model of the buckets, updated as changes are swept in time order
+    buckets = {}
+    current = {}
+    for user_id, user_slots in initial.items():
+        current[user_id] = frozenset(user_slots)
+        for i in user_slots:
+            buckets.setdefault(i, set()).add(user_id)
+    expected_total = missed = unexpected = ambiguous = 0
+    change_index = 0
+    # first change that's within MARGIN of the current minute
+    window_index = 0
+    first_minute = start.replace(second=0, microsecond=0) + dt.timedelta(minutes=1)
+    for m in range(hours * 60):
+        due = first_minute + dt.timedelta(minutes=m)
+        if due > start + dt.timedelta(hours=hours):
+            break
+        while change_index < len(changes) and changes[change_index][0] < due:
+            _, user_id, user_slots = changes[change_index]
+            for i in current.get(user_id, frozenset()):
+                buckets[i].discard(user_id)
+            for i in user_slots:
+                buckets.setdefault(i, set()).add(user_id)
+            current[user_id] = user_slots
+            change_index += 1
+        fired_at, fired = fired_by_minute.get(due, (due + dt.timedelta(minutes=1), set()))
+        while window_index < len(changes) and changes[window_index][0] < due - dt.timedelta(seconds=margin):
+            window_index += 1
+        # changes are in time order, so only look until the one after this minute fired
+        unsure = {user_id for _, user_id, _ in itertools.takewhile(lambda change: change[0] <= fired_at, changes[window_index:])}
+        expected = buckets.get(scheduler.slot(due.hour, due.minute), set())
+        expected_total += len(expected - unsure)
+        missed += len(expected - fired - unsure)
+        unexpected += len(fired - expected - unsure)
+        ambiguous += len(unsure & (expected | fired))
+    drift = sorted((fired_at - due).total_seconds() for due, fired_at, _ in fires)
+    return {
+        "minutes_fired":len(fires),
+        "prompts_expected":expected_total,
+        "prompts_fired":sum(len(user_ids) for _, _, user_ids in fires),
+        "duplicates":duplicates,
+        "missed":missed,
+        "unexpected":unexpected,
+        "ambiguous":ambiguous,
+        "drift_p50_s":drift[len(drift) // 2] if drift else None,
+        "drift_p99_s":drift[max(0, -(-len(drift) * 99 // 100) - 1)] if drift else None,
+        "drift_max_s":drift[-1] if drift else None
+    }
+
+def main(args):
+    rng = random.Random(args.seed)
+    with contextlib.ExitStack() as stack:
+        directory = args.directory or stack.enter_context(tempfile.TemporaryDirectory())
+        if not os.path.exists(os.path.join(directory, "users_index.json")):
+            synthetic.build(directory, args.users, args.backend, seed=args.seed)
+        with open(os.path.join(directory, "users_index.json"), "r") as file:
+            user_ids = json.load(file)
+        if args.events:
+            with open(args.events, "r") as file:
+                events = [json.loads(line) for line in file if line.strip()]
+        else:
+            events = generate_events(user_ids, args.hours, args.events_per_hour, rng)
+        if args.record:
+            with open(args.record, "w") as file:
+                file.writelines(json.dumps(event) + "\n" for event in events)
+        start = dt.datetime.combine(dt.date.today(), dt.time()) + dt.timedelta(seconds=0.5)
+        # main.py picks up the default clock and its data folder when it's imported
+        clock.set_default_clock(clock.AcceleratedClock(start, args.speed))
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = args.backend
+        # don't open the metrics port from a benchmark
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        bot = importlib.import_module("main")
+        bot.load_state()
+        client = FakeClient(latency=0.0)
+        bot.prompt_fanout.client = client
+        print(f"Replaying {len(events)} events over {args.hours} hours at {args.speed:g}x "
+              f"(about {args.hours * 3600 / args.speed:.0f} s)...")
+        real_began = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fires, changes, initial, hourly_updates = asyncio.run(replay(bot, events, start, args.hours))
+        real_seconds = time.perf_counter() - real_began
+        bot.users.flush()
+        bot.store.compact()
+        bot.store.close()
+    results = verify(fires, changes, initial, start, args.hours)
+    results.update({
+        "events":len(events),
+        "schedule_changes":len(changes),
+        "hourly_updates":len(hourly_updates),
+        "hourly_updates_expected":args.hours,
+        "prompts_sent":bot.prompt_fanout.sent,
+        "break_reminders":bot.break_tracker.reminders_sent,
+        "speed":args.speed,
+        "real_seconds":round(real_seconds, 2),
+        "drift_max_real_ms":round(results["drift_max_s"] * 1000 / args.speed, 3) if results["drift_max_s"] is not None else None
+    })
+    for name, value in results.items():
+        print(f"  {name:<26}{value}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    ok = (results["duplicates"] == 0 and results["missed"] == 0 and results["unexpected"] == 0
+          and results["hourly_updates"] == args.hours)
+    print("Every prompt fired exactly once." if ok else "Replay found scheduling errors.")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay DM commands and presence changes on an accelerated clock.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="legacy")
+    parser.add_argument("--hours", type=int, default=24, help="simulated hours to replay")
+    parser.add_argument("--speed", type=float, default=1000, help="simulated seconds per real second")
+    parser.add_argument("--events", help="jsonl file of recorded events to replay instead of generating them")
+    parser.add_argument("--events-per-hour", type=int, default=200, help="how many events to generate per simulated hour")
+    parser.add_argument("--record", help="write the replayed events to this jsonl file")
+    parser.add_argument("--directory", help="reuse (or build into) this data folder instead of a temp one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this json file")
+    sys.exit(0 if main(parser.parse_args()) else 1)
@@ -0,0 +1,127 @@
+# compares `timezone` changes for users with many prompts the old way, deleting and re-adding each prompt,
+# against rescheduling them all in one batch, counting hour json writes and scheduler wakeups,
+# and checks the hour jsons and the scheduler still match every user json afterwards
+# usage: python -m benchmarks.reschedule [--users 2000] [--changers 200] [--prompts 20]
+
+import argparse, asyncio, contextlib, importlib, io, os, random, tempfile, time
+import scheduler, zones
+from benchmarks import synthetic
+from benchmarks.fake_discord import FakeContext
+from benchmarks.load import percentile
+
+ZONE_NAMES = ["Europe/Berlin", "Asia/Kolkata", "America/New_York", "Australia/Adelaide"]
+
+async def give_prompts(bot, user_ids: list, count: int, rng: random.Random):
+    """
+    Gives each of USER_IDS COUNT prompts at random times, scheduled in one batch each.
+    """
+    for user_id in user_ids:
+        user_json = await bot.get_user(user_id)
+        old_json = dict(user_json)
+        user_json["prompts"] = {f"{t // 60:02}:{t % 60:02}":synthetic.PROMPT for t in rng.sample(range(24 * 60), count)}
+        await bot.put_user(user_id, user_json)
+        await bot.reschedule_prompts(user_id, old_json, user_json)
+
+async def one_at_a_time(bot, user_id: int, arg: str):
+    """
+    Changes a user's timezone the way `timezone` used to: each prompt deleted from its hour json,
+    then added back at the new offset, one hour json change and scheduler wakeup at a time.
+    """
+    zone, offset = bot.parse_timezone(arg)
+    user_json = await bot.get_user(user_id)
+    for prompt_time in list(user_json["prompts"]):
+        await bot.delete_prompt_from_hr(user_id, user_json, prompt_time)
+    bot.set_zone(user_json, zone, offset)
+    if zone is None:
+        await bot.io_pool.run(bot.zone_index.remove, user_id)
+    else:
+        await bot.io_pool.run(bot.zone_index.add, user_id, zone, bot.bot_clock.now())
+    await bot.put_user(user_id, user_json)
+    for prompt_time in list(user_json["prompts"]):
+        await bot.schedule_prompt_to_hr(user_id, user_json, prompt_time)
+
+async def batched(bot, user_id: int, arg: str):
+    await bot.timezone.callback(FakeContext(user_id), arg)
+
+async def run(bot, change, changes: list):
+    """
+    Applies every (user_id, timezone argument) in CHANGES with CHANGE.
+    Returns (seconds per change, hour json records journaled, scheduler wakeups).
+    """
+    counts = {"hour":0, "wakeups":0}
+    append = bot.store.journal.append
+    set_wakeup = bot.prompt_scheduler.wakeup.set
+
+    def counting_append(record: dict, sync: bool=True):
+        if record["op"].startswith("hour"):
+            counts["hour"] += 1
+        return append(record, sync)
+
+    def counting_set():
+        counts["wakeups"] += 1
+        set_wakeup()
+
+    bot.store.journal.append = counting_append
+    bot.prompt_scheduler.wakeup.set = counting_set
+    latencies = []
+    for user_id, arg in changes:
+        began = time.perf_counter()
+        await change(bot, user_id, arg)
+        latencies.append(time.perf_counter() - began)
+    bot.store.journal.append = append
+    bot.prompt_scheduler.wakeup.set = set_wakeup
+    return sorted(latencies), counts["hour"], counts["wakeups"]
+
+async def mismatches(bot, user_ids: list):
+    """
+    Returns how many (slot, user id) entries differ between what the user jsons say,
+    the hour jsons, and the prompt scheduler.
+    """
+    expected = set()
+    for user_id in user_ids:
+        user_json = await bot.get_user(user_id)
+        offset = bot.zone_index.offset_for(user_json)
+        expected |= {(zones.utc_slot(prompt_time, offset), user_id) for prompt_time in user_json["prompts"]}
+    stored = {(scheduler.slot(hr, int(minute)), user_id)
+              for hr, hour_json in (await bot.io_pool.run(bot.store.load_hours)).items()
+              for minute, ids in hour_json.items() for user_id in ids}
+    scheduled = {(i, user_id) for i, bucket in enumerate(bot.prompt_scheduler.buckets) for user_id in bucket}
+    return len(expected ^ stored) + len(expected ^ scheduled)
+
+def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Building {args.users} synthetic users, {args.changers} of them with {args.prompts} prompts...")
+        user_ids = synthetic.build(directory, args.users, args.backend, log_fraction=0, seed=args.seed)
+        os.environ["CORNBOT_DIRECTORY"] = directory
+        os.environ["CORNBOT_STORAGE"] = args.backend
+        os.environ.setdefault("CORNBOT_METRICS_PORT", "0")
+        bot = importlib.import_module("main")
+        bot.load_state()
+        changers = rng.sample(user_ids, args.changers)
+        choices = [str(offset) for offset in range(-11, 15)] + ZONE_NAMES
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(give_prompts(bot, changers, args.prompts, rng))
+            for name, change in (("one at a time", one_at_a_time), ("batched", batched)):
+                changes = [(user_id, rng.choice(choices)) for user_id in changers]
+                results[name] = asyncio.run(run(bot, change, changes))
+                results[name] += (asyncio.run(mismatches(bot, user_ids)),)
+        bot.io_pool.close()
+        bot.store.close()
+    for name, (latencies, hour_records, wakeups, wrong) in results.items():
+        print(f"  {name:<14}p50 {percentile(latencies, 50) * 1000:.3f} ms, p99 {percentile(latencies, 99) * 1000:.3f} ms per change, "
+              f"{hour_records / len(latencies):.1f} hour json writes and {wakeups / len(latencies):.1f} scheduler wakeups per change, "
+              f"{wrong} mismatched prompts")
+    ok = all(wrong == 0 for _, _, _, wrong in results.values())
+    print("Hour jsons and the scheduler match every user." if ok else "Reschedule run found mismatches.")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare one-at-a-time and batched prompt rescheduling on timezone changes.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--changers", type=int, default=200, help="users who change timezone")
+    parser.add_argument("--prompts", type=int, default=20, help="prompts each of them has")
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(0 if main(parser.parse_args()) else 1)
@@ -0,0 +1,51 @@
+# shows what rolling old log rows into weeks and months does to log size and "log" cost as history grows,
+# and checks that "list logs" shows exactly the same totals afterwards
+# usage: python -m benchmarks.retention [--years 1 2 5 10] [--activities 10] [--repeat 20]
+
+import argparse, io, util
+import datetime as dt
+from activitylog import ActivityLog
+from benchmarks.list_logs import build_csv, bench
+
+# the bot's defaults, from main.py
+DAILY_DAYS = 90
+WEEKLY_DAYS = 365
+
+def log_command(csv_str: str):
+    """
+    What "log" costs on the legacy backend: read the whole csv, add one cell, write the whole csv back.
+    """
+    log_data = ActivityLog.from_csv(io.StringIO(csv_str))
+    log_data.add(dt.date.today(), "activity0", 1200)
+    file = io.StringIO()
+    log_data.to_csv(file)
+    return file.getvalue()
+
+def roll_up(csv_str: str):
+    log_data = ActivityLog.from_csv(io.StringIO(csv_str))
+    log_data.roll_up(dt.date.today(), DAILY_DAYS, WEEKLY_DAYS)
+    return log_data
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark log size and 'log' cost with and without rolled-up rows.")
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--activities", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    today = dt.date.today()
+    print(f"{DAILY_DAYS} daily days, then weeks until {WEEKLY_DAYS} days, then months; {args.activities} activities")
+    print(f"{'years':>5}{'rows':>7}{'rolled':>8}{'csv bytes':>11}{'rolled':>9}{'log ms':>9}{'rolled':>9}{'roll up ms':>12}  list logs")
+    for years in args.years:
+        csv_str = build_csv(years * 365, args.activities)
+        full = ActivityLog.from_csv(io.StringIO(csv_str))
+        roll_ms, rolled = bench(roll_up, args.repeat, csv_str)
+        file = io.StringIO()
+        rolled.to_csv(file)
+        rolled_str = file.getvalue()
+        full_ms, _ = bench(log_command, args.repeat, csv_str)
+        rolled_ms, _ = bench(log_command, args.repeat, rolled_str)
+        # totals, this week and the last 7 days, plus one activity's last 7 days
+        same = all(util.display_log(full, activity, today) == util.display_log(ActivityLog.from_csv(io.StringIO(rolled_str)), activity, today)
+                   for activity in (None, "activity0"))
+        print(f"{years:>5}{len(full.days):>7}{len(rolled.days):>8}{len(csv_str):>11}{len(rolled_str):>9}"
+              f"{full_ms:>9.2f}{rolled_ms:>9.2f}{roll_ms:>12.2f}  {'same output' if same else 'OUTPUT DIFFERS'}")
@@ -0,0 +1,215 @@
+# runs the bot as several worker processes against one data folder, with a fake gateway handing
+# presence changes to random shards and DM commands to shard 0, on accelerated clocks that start together
+# checks that every prompt went out once, from the worker that owns the user, and that break sessions
+# ended up on the owner too
+# usage: python -m benchmarks.shard_sim [--shards 3] [--users 2000] [--hours 4] [--speed 100]
+
+import argparse, asyncio, contextlib, importlib, io, json, os, random, subprocess, sys, tempfile, time
+import datetime as dt
+import clock, scheduler, sharding
+from benchmarks import replay, synthetic
+from benchmarks.fake_discord import FakeClient
+
+async def run_worker(bot, events: list, start: dt.datetime, hours: int, shard_id: int):
+    """
+    Runs one worker's loops while feeding in the events its shard would get from the gateway.
+    Returns a dict of what it sent, which sessions it tracked, and (on worker 0) every schedule change.
+    """
+    bot_clock = bot.bot_clock
+    commands = {"log":bot.log, "schedule":bot.schedule, "delete":bot.delete, "timezone":bot.timezone}
+    fires = []
+    reminders = []
+    sessions = []
+    send_all = bot.prompt_fanout.send_all
+    send_break_reminder = bot.break_tracker.callback
+    start_session = bot.break_tracker.start_session
+
+    async def recording_send_all(due: dt.datetime, messages: list):
+        fires.append((due.isoformat(), bot_clock.now().isoformat(), [user_id for user_id, _ in messages]))
+        return await send_all(due, messages)
+
+    async def recording_send_break_reminder(user_id: int, game_name: str):
+        reminders.append(user_id)
+        await send_break_reminder(user_id, game_name)
+
+    def recording_start_session(user_id: int, *args):
+        sessions.append(user_id)
+        start_session(user_id, *args)
+
+    bot.prompt_fanout.send_all = recording_send_all
+    bot.break_tracker.callback = recording_send_break_reminder
+    bot.break_tracker.start_session = recording_start_session
+    initial = {}
+    for i, bucket in enumerate(bot.prompt_scheduler.buckets):
+        for user_id in bucket:
+            initial.setdefault(user_id, []).append(i)
+    # worker 0 runs every user's commands, so it compares them against the whole schedule, not just its share
+    slots = {}
+    for hr, hour_json in (await bot.io_pool.run(bot.store.load_hours)).items():
+        for minute, user_ids in hour_json.items():
+            for user_id in user_ids:
+                slots[user_id] = slots.get(user_id, frozenset()) | {scheduler.slot(hr, int(minute))}
+    changes = []
+    bot_clock.jump(start)
+    bot.start_loops()
+    for event in events:
+        await bot_clock.sleep_until(start + dt.timedelta(seconds=event["at"]))
+        await replay.apply_event(bot, event, commands)
+        if "command" in event:
+            changed_at = bot_clock.now()
+            new_slots = await replay.user_slots(bot, event["user_id"])
+            if new_slots != slots.get(event["user_id"], frozenset()):
+                slots[event["user_id"]] = new_slots
+                changes.append((changed_at.isoformat(), event["user_id"], sorted(new_slots)))
+    await bot_clock.sleep_until(start + dt.timedelta(hours=hours, seconds=5))
+    bot.prompt_scheduler.stop()
+    bot.break_tracker.stop()
+    bot.hourly_task.cancel()
+    bot.inbox_task.cancel()
+    if bot.retention_task is not None:
+        bot.retention_task.cancel()
+    bot.flush_data.cancel()
+    return {
+        "fires":fires,
+        "changes":changes,
+        "initial":initial,
+        "reminders":reminders,
+        "sessions":sessions,
+        "live_sessions":list(bot.break_tracker.sessions),
+        "shared":bot.shared.stats()
+    }
+
+def worker(args):
+    """
+    Runs in each worker subprocess: imports the bot as shard ARGS.worker, waits for the agreed start, and runs.
+    """
+    with open(args.events, "r") as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    # DMs only reach shard 0; presence goes to whichever shard the gateway picked
+    events = [event for event in events
+              if event.get("shard", sharding.COMMAND_SHARD) == args.worker]
+    start = dt.datetime.fromisoformat(args.start)
+    clock.set_default_clock(clock.AcceleratedClock(start, args.speed))
+    os.environ["CORNBOT_DIRECTORY"] = args.directory
+    os.environ["CORNBOT_STORAGE"] = args.backend
+    os.environ["CORNBOT_SHARD_COUNT"] = str(args.shards)
+    os.environ["CORNBOT_SHARD_ID"] = str(args.worker)
+    os.environ["CORNBOT_METRICS_PORT"] = "0"
+    bot = importlib.import_module("main")
+    bot.load_state()
+    bot.prompt_fanout.client = FakeClient(latency=0.0)
+    # every worker's clock has to read the same time, so they all start on the same wall-clock second
+    time.sleep(max(0.0, args.start_at - time.time()))
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run_worker(bot, events, start, args.hours, args.worker))
+    bot.io_pool.close()
+    bot.users.flush()
+    bot.store.compact()
+    bot.store.close()
+    bot.shared.close()
+    with open(args.output, "w") as file:
+        json.dump(results, file)
+
+def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Building {args.users} synthetic users for {args.shards} workers...")
+        user_ids = synthetic.build(directory, args.users, args.backend, seed=args.seed,
+                                   user_ids=synthetic.snowflakes(args.users, rng))
+        events = replay.generate_events(user_ids, args.hours, args.events_per_hour, rng)
+        # new users get max(user_ids) + 1 and up, which would all land on one shard
+        known = set(user_ids)
+        new_ids = {}
+        for event in events:
+            if event["user_id"] not in known:
+                event["user_id"] = new_ids.setdefault(event["user_id"], synthetic.snowflakes(1, rng)[0] | len(user_ids) + len(new_ids))
+            if "presence" in event:
+                event["shard"] = rng.randrange(args.shards)
+        events_path = os.path.join(directory, "events.jsonl")
+        with open(events_path, "w") as file:
+            file.writelines(json.dumps(event) + "\n" for event in events)
+        start = dt.datetime.combine(dt.date.today(), dt.time()) + dt.timedelta(seconds=0.5)
+        # long enough for every worker to import the bot and load its share of the schedule
+        start_at = time.time() + args.startup_seconds
+        outputs = [os.path.join(directory, f"results-{shard_id}.json") for shard_id in range(args.shards)]
+        print(f"Running {len(events)} events over {args.hours} hours at {args.speed:g}x "
+              f"(about {args.hours * 3600 / args.speed:.0f} s)...")
+        workers = [subprocess.Popen([sys.executable, "-m", "benchmarks.shard_sim", "--worker", str(shard_id),
+                                     "--shards", str(args.shards), "--directory", directory, "--backend", args.backend,
+                                     "--events", events_path, "--start", start.isoformat(), "--start-at", str(start_at),
+                                     "--speed", str(args.speed), "--hours", str(args.hours), "--output", outputs[shard_id]])
+                   for shard_id in range(args.shards)]
+        if any(process.wait() != 0 for process in workers):
+            print("A worker failed.")
+            return False
+        results = []
+        for path in outputs:
+            with open(path, "r") as file:
+                results.append(json.load(file))
+    # merge every worker's sends into one fire per minute, so a prompt sent by two workers shows up as a duplicate
+    merged = {}
+    for result in results:
+        for due, fired_at, fired_ids in result["fires"]:
+            due, fired_at = dt.datetime.fromisoformat(due), dt.datetime.fromisoformat(fired_at)
+            earlier_at, earlier_ids = merged.get(due, (fired_at, []))
+            merged[due] = (max(earlier_at, fired_at), earlier_ids + fired_ids)
+    fires = [(due, fired_at, fired_ids) for due, (fired_at, fired_ids) in sorted(merged.items())]
+    changes = [(dt.datetime.fromisoformat(at), user_id, frozenset(user_slots)) for at, user_id, user_slots in results[0]["changes"]]
+    initial = {}
+    for result in results:
+        for user_id, user_slots in result["initial"].items():
+            initial.setdefault(int(user_id), set()).update(user_slots)
+    # a change reaches the owning worker within a poll or two, which is a few simulated seconds at speed
+    margin = args.speed * args.propagation_seconds
+    summary = replay.verify(fires, changes, initial, start, args.hours, margin)
+    wrong = {"prompts":0, "initial":0, "reminders":0, "sessions":0}
+    for shard_id, result in enumerate(results):
+        def misplaced(ids):
+            return sum(sharding.shard_for(int(user_id), args.shards) != shard_id for user_id in ids)
+        wrong["prompts"] += sum(misplaced(fired_ids) for _, _, fired_ids in result["fires"])
+        wrong["initial"] += misplaced(result["initial"])
+        wrong["reminders"] += misplaced(result["reminders"])
+        wrong["sessions"] += misplaced(result["sessions"])
+    summary.update({
+        "events":len(events),
+        "presence_events":sum("presence" in event for event in events),
+        "schedule_changes":len(changes),
+        "margin_s":margin,
+        "wrong_worker":wrong,
+        "break_sessions":sum(len(result["sessions"]) for result in results),
+        "break_reminders":sum(len(result["reminders"]) for result in results),
+        "per_worker_prompts":[sum(len(fired_ids) for _, _, fired_ids in result["fires"]) for result in results],
+        "messages_received":[result["shared"]["received"] for result in results],
+        "claims_skipped":sum(result["shared"]["duplicates"] for result in results)
+    })
+    for name, value in summary.items():
+        print(f"  {name:<26}{value}")
+    ok = (summary["duplicates"] == 0 and summary["missed"] == 0 and summary["unexpected"] == 0
+          and not any(wrong.values()))
+    print("Every prompt went out once, from its owner." if ok else "Sharded run found errors.")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the bot as several workers and check prompts and break sessions.")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="sqlite")
+    parser.add_argument("--hours", type=int, default=4, help="simulated hours to run")
+    parser.add_argument("--speed", type=float, default=100, help="simulated seconds per real second")
+    parser.add_argument("--events-per-hour", type=int, default=400)
+    parser.add_argument("--propagation-seconds", type=float, default=0.1,
+                        help="real seconds a change may take to reach its owner before it counts as missed")
+    parser.add_argument("--startup-seconds", type=float, default=5.0, help="real seconds given to workers to load")
+    parser.add_argument("--seed", type=int, default=0)
+    # set by main() when it starts the workers
+    parser.add_argument("--worker", type=int)
+    parser.add_argument("--directory")
+    parser.add_argument("--events")
+    parser.add_argument("--start")
+    parser.add_argument("--start-at", type=float)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    if args.worker is not None:
+        worker(args)
+    else:
+        sys.exit(0 if main(args) else 1)
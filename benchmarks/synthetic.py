@@ -0,0 +1,90 @@
+# builds a synthetic cornbot data folder at a configurable scale
+# usage: python -m benchmarks.synthetic <directory> [--users 10000] [--backend legacy]
+
+import argparse, os, random, storage, registry, zones
+import datetime as dt
+import numpy as np
+from activitylog import ActivityLog, EMPTY
+
+ACTIVITIES = ["running", "reading", "piano", "gaming", "cooking", "drawing", "lifting", "writing", "coding", "chess"]
+GAMES = ["minecraft", "valorant", "league of legends", "stardew valley", "celeste"]
+PROMPT = "What's something you did today that you're proud of?"
+
+def snowflakes(count: int, rng: random.Random):
+    """
+    Returns COUNT distinct ids shaped like Discord's: a creation time in ms since 2015 in the top bits,
+    so sharding.shard_for() spreads them the way it would real users.
+    """
+    return [(rng.randrange(8 * 365 * 24 * 60 * 60 * 1000) << 22) | i for i in range(count)]
+
+def random_user_json(rng: random.Random):
+    """
+    Returns a user json with a random timezone, 1-5 prompts, and 0-3 game break settings.
+    """
+    prompt_times = rng.sample(range(24 * 60), rng.randint(1, 5))
+    return {
+        "tz":rng.randint(-11, 14),
+        "prompts":{f"{t // 60:02}:{t % 60:02}":PROMPT for t in prompt_times},
+        "breaks":{"default":70, **{game:rng.choice([30, 45, 60, 90]) for game in rng.sample(GAMES, rng.randint(0, 3))}}
+    }
+
+def random_log(rng: np.random.Generator, days: int):
+    """
+    Returns an ActivityLog covering the last DAYS days with 1-5 activities,
+    each logged on about half of the days.
+    """
+    activities = list(rng.choice(ACTIVITIES, size=rng.integers(1, 6), replace=False))
+    today = dt.date.today().toordinal()
+    day_ordinals = np.arange(today - days + 1, today + 1, dtype=np.int64)
+    seconds = rng.integers(60, 3 * 60 * 60, size=(days, len(activities)), dtype=np.int64)
+    seconds[rng.random((days, len(activities))) < 0.5] = EMPTY
+    return ActivityLog(day_ordinals, activities, seconds)
+
+def build(directory: str, users: int, backend: str="legacy", log_fraction: float=0.5, days: int=90, seed: int=0,
+          user_ids: list=None, zone_names: list=None, zones_at: dt.datetime=None):
+    """
+    Fills DIRECTORY with USERS registered users (ids 1 to USERS, or USER_IDS) in the given storage backend:
+    user jsons, logs for LOG_FRACTION of them, the 24 hour jsons, and the registry index.
+    With ZONE_NAMES, each user gets one of them at random (None for a fixed offset), scheduled at its
+    offset at ZONES_AT, and the zone index is written too.
+    Returns a list of the user ids.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    store = storage.open_storage(backend, directory)
+    hours = {hr:{} for hr in range(24)}
+    user_ids = list(user_ids) if user_ids is not None else list(range(1, users + 1))
+    zone_index = zones.ZoneIndex(os.path.join(directory, "zones_index.json"))
+    for user_id in user_ids:
+        user_json = random_user_json(rng)
+        zone = rng.choice(zone_names) if zone_names else None
+        if zone is not None:
+            user_json["zone"] = zone
+            user_json["tz"] = zone_index.offsets[zone] = zones.offset_at(zone, zones_at)
+            zone_index.members.setdefault(zone, set()).add(user_id)
+        store.save_user(user_id, user_json)
+        for time in user_json["prompts"]:
+            slot = zones.utc_slot(time, user_json["tz"])
+            hours[slot // 60].setdefault(f"{slot % 60:02}", []).append(user_id)
+        if rng.random() < log_fraction:
+            store.save_log(user_id, random_log(np_rng, days))
+    for hr, hour_json in hours.items():
+        store.save_hour(hr, hour_json)
+    store.close()
+    if zone_names:
+        zone_index.save()
+    registry.UserRegistry(os.path.join(directory, "users_index.json")).rebuild(user_ids)
+    return user_ids
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic cornbot data folder.")
+    parser.add_argument("directory")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--backend", choices=["legacy", "sqlite"], default="legacy")
+    parser.add_argument("--log-fraction", type=float, default=0.5, help="fraction of users with activity logs")
+    parser.add_argument("--days", type=int, default=90, help="days of history in each log")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    build(args.directory, args.users, args.backend, args.log_fraction, args.days, args.seed)
+    print(f"Built {args.users} users in {args.directory} ({args.backend}).")
@@ -0,0 +1,152 @@
+# microbenchmark of timeparse against the parsing it replaced in util.py and main.py
+# usage: python -m benchmarks.timeparse_bench [--calls 100000]
+
+import argparse, random, time, timeparse
+import datetime as dt
+
+# the functions below are the old parsers, copied as they were so there's something to compare against
+
+def split_alpha_num(str: str):
+    if not "".join(str.split(" ")).isalnum():
+        raise ValueError("String contains non-alphanumeric characters")
+    list_to_return = []
+    while str != "":
+        temp_str = str.rstrip("0123456789")
+        list_to_return.insert(0, str[len(temp_str):])
+        str = temp_str
+        temp_str = str.rstrip("qwertyuiopasdfghjklzxcvbnm")
+        list_to_return.insert(0, str[len(temp_str):])
+        str = temp_str
+        str = str.rstrip(" ")
+    list_to_return = list(filter(None, list_to_return))
+    return list_to_return
+
+def validate_time(str: str):
+    list = str.split(":")
+    if len(list) == 2 and list[0].isnumeric() and list[1].isnumeric():
+        if int(list[0]) in range(24) and int(list[1]) in range(60) and len(list[1]) > 1:
+            return True
+        else:
+            return False
+    else:
+        return False
+
+def parse_time_from_args(list: list):
+    time = dt.timedelta(seconds=0)
+    items_parsed_as_time = []
+    for item in list:
+        if item.isnumeric():
+            temp_number = int(item)
+        elif item.isalpha():
+            if "hours ".startswith(item):
+                time += dt.timedelta(hours=temp_number)
+                items_parsed_as_time.append(str(temp_number))
+                items_parsed_as_time.append(item)
+            elif "minutes ".startswith(item):
+                time += dt.timedelta(minutes=temp_number)
+                items_parsed_as_time.append(str(temp_number))
+                items_parsed_as_time.append(item)
+            else:
+                pass
+    if len(items_parsed_as_time) == 0:
+        return list, False
+    else:
+        list.reverse()
+        for item in items_parsed_as_time:
+            list.remove(item)
+        list.reverse()
+        return list, time
+
+def old_log_time(arg: str):
+    # what the log command did with everything after the activity
+    arg_list = split_alpha_num("".join(arg.split()))
+    time = dt.timedelta(seconds=0)
+    temp_number = 0
+    for item in arg_list:
+        if item.isnumeric():
+            temp_number = int(item)
+        elif item.isalpha():
+            if "hours ".startswith(item):
+                time += dt.timedelta(hours=temp_number)
+            elif "minutes ".startswith(item):
+                time += dt.timedelta(minutes=temp_number)
+            elif "seconds ".startswith(item):
+                time += dt.timedelta(seconds=temp_number)
+            else:
+                return None
+    return time
+
+def old_break(arg: str):
+    # what schedule break did to split "<game> <time>"
+    arg_list = arg.split()
+    remaining_args, time = parse_time_from_args(split_alpha_num(" ".join(arg_list)))
+    arg_counter = 0
+    for i in range(len(arg_list)):
+        if "".join(arg_list[:i]) in "".join(remaining_args):
+            arg_counter = i
+    return " ".join(arg_list[:arg_counter]), time
+
+def old_clock(arg: str):
+    if not validate_time(arg):
+        return None
+    return "0" + arg if len(arg) < 5 else arg
+
+def new_log_time(arg: str):
+    return timeparse.parse_duration(arg).timedelta
+
+def new_break(arg: str):
+    return timeparse.split_duration(arg)
+
+def new_clock(arg: str):
+    return timeparse.parse_clock(arg).text
+
+def inputs(rng: random.Random, calls: int, distinct: int):
+    """
+    Returns (durations, breaks, clocks): CALLS inputs each, drawn from DISTINCT different strings,
+    the way real commands repeat the same few inputs.
+    """
+    durations = [rng.choice([f"{rng.randint(1, 90)}m", f"{rng.randint(1, 5)}h{rng.randint(0, 59)}m",
+                             f"{rng.randint(1, 5)} hours {rng.randint(1, 59)} minutes", f"{rng.randint(10, 300)} seconds"])
+                 for _ in range(distinct)]
+    breaks = [f"{rng.choice(['minecraft', 'valorant', 'celeste', 'dark souls 3'])} {duration}" for duration in durations]
+    clocks = [f"{rng.randint(0, 23)}:{rng.randint(0, 59):02}" for _ in range(distinct)]
+    pick = lambda pool: [rng.choice(pool) for _ in range(calls)]
+    return pick(durations), pick(breaks), pick(clocks)
+
+def clear_caches():
+    for function in (timeparse._parse_duration, timeparse._parse_clock, timeparse._split_duration):
+        function.cache_clear()
+
+def time_per_call(function, arguments: list):
+    start = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter() - start) / len(arguments)
+
+def main(args):
+    durations, breaks, clocks = inputs(random.Random(args.seed), args.calls, args.distinct)
+    # the old and new parsers should agree wherever the old one understood the input
+    for duration, break_arg, clock in zip(durations[:1000], breaks[:1000], clocks[:1000]):
+        assert old_log_time(duration) == new_log_time(duration), duration
+        old_game, old_time = old_break(break_arg)
+        new_game, new_time = new_break(break_arg)
+        # the old one ignored seconds, so "celeste 90 seconds" was an error there
+        assert old_time is False or (old_game, old_time) == (new_game, new_time.timedelta), break_arg
+        assert old_clock(clock) == new_clock(clock), clock
+    print(f"{'input':<10}{'old (us)':>10}{'new, cold (us)':>16}{'new, cached (us)':>18}")
+    for name, old, new, arguments in (("duration", old_log_time, new_log_time, durations),
+                                      ("break", old_break, new_break, breaks),
+                                      ("clock", old_clock, new_clock, clocks)):
+        old_time = time_per_call(old, arguments)
+        # cold: every input is parsed from scratch; clearing the caches costs a little, so this is an upper bound
+        cold = time_per_call(lambda argument: (clear_caches(), new(argument)), arguments[:args.calls // 10])
+        clear_caches()
+        cached = time_per_call(new, arguments)
+        print(f"{name:<10}{old_time * 1e6:>10.2f}{cold * 1e6:>16.2f}{cached * 1e6:>18.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare timeparse against the parsers it replaced.")
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=500, help="different strings the inputs are drawn from")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
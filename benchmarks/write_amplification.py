@@ -0,0 +1,157 @@
+# measures bytes written to disk per command, with and without the mutation journal
+# usage: python -m benchmarks.write_amplification [--days 730] [--hour-users 1000] [--commands 200]
+
+import argparse, builtins, os, random, tempfile, storage, journal, usercache
+import datetime as dt
+from activitylog import ActivityLog
+
+class CountingFile:
+    """
+    Wraps a file object and adds every byte written through it to a shared counter.
+    """
+
+    def __init__(self, file, counter: list):
+        self._file = file
+        self._counter = counter
+
+    def write(self, data):
+        self._counter[0] += len(data)
+        return self._file.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self._file.__exit__(*args)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+def count_writes(counter: list):
+    """
+    Replaces builtins.open so that every file opened for writing counts its bytes.
+    Returns the original open so it can be put back.
+    """
+    original_open = builtins.open
+
+    def counting_open(file, mode="r", *args, **kwargs):
+        opened = original_open(file, mode, *args, **kwargs)
+        if any(flag in mode for flag in "wa+"):
+            return CountingFile(opened, counter)
+        return opened
+
+    builtins.open = counting_open
+    return original_open
+
+def build_data(directory: str, days: int, hour_users: int):
+    """
+    Makes a users/ and times/ layout with one test user (id 1) who has 5 prompts,
+    a log with the given number of days, and hour jsons shared with hour_users other users.
+    """
+    random.seed(0)
+    base = storage.LegacyStorage(directory)
+    user_json = {"tz":0, "prompts":{f"{hr:02}:00":"How are you?" for hr in range(8, 23, 3)}, "breaks":{"default":70}}
+    base.save_user(1, user_json)
+    log_data = ActivityLog()
+    start = dt.date.today() - dt.timedelta(days=days)
+    for day in range(days):
+        for activity in ("running", "reading", "piano", "gaming", "cooking"):
+            if random.random() < 0.5:
+                log_data.add(start + dt.timedelta(days=day), activity, random.randint(60, 7200))
+    base.save_log(1, log_data)
+    for hr in range(24):
+        base.save_hour(hr, {"00":[1] + list(range(1000, 1000 + hour_users)) if f"{hr:02}:00" in user_json["prompts"] else
+                            list(range(1000, 1000 + hour_users))})
+    return user_json
+
+def run_commands(store: storage.Storage, users: usercache.UserStore, commands: int):
+    """
+    Replays the storage calls made by a mix of commands, the same way main.py makes them.
+    Yields each command's name after it runs.
+    """
+    today = dt.date.today()
+    for i in range(commands):
+        name = ("log", "schedule prompt", "delete prompt", "merge", "timezone")[i % 5]
+        user_json = users.get(1)
+        if name == "log":
+            store.log_time(1, today, "running", 600)
+        elif name == "schedule prompt":
+            user_json["prompts"]["07:30"] = "Drink some water!"
+            users.put(1, user_json)
+            store.add_to_hour(7, "30", 1)
+        elif name == "delete prompt":
+            user_json["prompts"].pop("07:30")
+            users.put(1, user_json)
+            store.remove_from_hour(7, "30", 1)
+        elif name == "merge":
+            store.log_time(1, today, "stretching", 300)
+            store.merge_activities(1, "cooking", "stretching", "cooking")
+        elif name == "timezone":
+            new_tz = 1 - user_json["tz"]
+            for time in user_json["prompts"]:
+                store.remove_from_hour((int(time[:2]) - user_json["tz"]) % 24, time[3:], 1)
+            user_json["tz"] = new_tz
+            users.put(1, user_json)
+            for time in user_json["prompts"]:
+                store.add_to_hour((int(time[:2]) - user_json["tz"]) % 24, time[3:], 1)
+        yield name
+
+def measure(journaled: bool, args):
+    """
+    Returns {command: bytes written per command}, and for the journal, compaction bytes per command.
+    """
+    directory = tempfile.mkdtemp()
+    build_data(directory, args.days, args.hour_users)
+    base = storage.LegacyStorage(directory)
+    if journaled:
+        mutation_journal = journal.Journal(os.path.join(directory, "journal.log"))
+        store = journal.JournaledStorage(base, mutation_journal)
+        users = usercache.UserStore(store, 1024 * 1024, mutation_journal)
+    else:
+        store = base
+        users = usercache.UserStore(store, 1024 * 1024)
+    counter = [0]
+    # the journal file is opened before counting starts, so its own byte count is used instead
+    journal_bytes = 0
+    totals = {}
+    counts = {}
+    compaction_bytes = 0
+    original_open = count_writes(counter)
+    try:
+        for i, name in enumerate(run_commands(store, users, args.commands)):
+            # without the journal, every command writes its user json straight away like the original bot did
+            if not journaled:
+                users.flush()
+            else:
+                counter[0] += mutation_journal.bytes_written - journal_bytes
+                journal_bytes = mutation_journal.bytes_written
+            totals[name] = totals.get(name, 0) + counter[0]
+            counts[name] = counts.get(name, 0) + 1
+            counter[0] = 0
+            if journaled and (i + 1) % args.compact_every == 0:
+                users.flush()
+                store.compact()
+                compaction_bytes += counter[0] + mutation_journal.bytes_written - journal_bytes
+                journal_bytes = mutation_journal.bytes_written
+                counter[0] = 0
+    finally:
+        builtins.open = original_open
+    return {name:totals[name] / counts[name] for name in totals}, compaction_bytes / args.commands
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure bytes written per command with and without the journal.")
+    parser.add_argument("--days", type=int, default=730, help="days of log history for the test user")
+    parser.add_argument("--hour-users", type=int, default=1000, help="other users in each hour json")
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--compact-every", type=int, default=50, help="commands between compactions")
+    args = parser.parse_args()
+    before, _ = measure(False, args)
+    after, compaction = measure(True, args)
+    print(f"{'command':<16}{'rewrite (B)':>14}{'journal (B)':>14}{'reduction':>12}")
+    for name in before:
+        print(f"{name:<16}{before[name]:>14.0f}{after[name]:>14.0f}{before[name] / after[name]:>11.1f}x")
+    print(f"\nCompaction every {args.compact_every} commands adds {compaction:.0f} B per command, "
+          f"because repeated changes to the same file are written once.")
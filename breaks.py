@@ -0,0 +1,120 @@
+# event-driven break reminders
+# game sessions are started and stopped from presence updates, and the next reminder
+# for every session sits in a priority queue, so nothing runs until a reminder is due
+
+import asyncio, heapq, itertools, traceback
+import datetime as dt
+from clock import Clock, default_clock
+
+class BreakTracker:
+    """
+    Keeps one game session per user and a heap of (due, token, user_id) reminders.
+
+    Reminders happen every INTERVAL after the session's start time. Stopping or replacing
+    a session doesn't search the heap; its entries just stop matching the session's
+    token and are thrown away when they reach the top.
+    """
+
+    def __init__(self, callback, clock: Clock=None):
+        """
+        CALLBACK: async function taking a user id and a game name, sends the reminder
+        CLOCK: clock.Clock to read and wait on time with; defaults to clock.default_clock()
+        """
+        self.callback = callback
+        self.clock = clock or default_clock()
+        # user_id -> (token, game name, started datetime, interval timedelta)
+        self.sessions = {}
+        self.queue = []
+        self.tokens = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.reminders_sent = 0
+
+    def start_session(self, user_id: int, game: str, started: dt.datetime, interval: dt.timedelta):
+        """
+        Starts (or replaces) a user's game session. An interval of 0 means breaks are off.
+        Starting the same game with the same start time again does nothing, since
+        presence updates come once for every server the user shares with the bot.
+        """
+        session = self.sessions.get(user_id)
+        if session is not None and session[1:] == (game, started, interval):
+            return
+        token = next(self.tokens)
+        self.sessions[user_id] = (token, game, started, interval)
+        if interval <= dt.timedelta(0):
+            return
+        due = _next_reminder(started, interval, self.clock.now())
+        heapq.heappush(self.queue, (due, token, user_id))
+        # only wake the loop if this reminder comes before the one it's sleeping on
+        if self.queue[0][1] == token:
+            self.wakeup.set()
+
+    def stop_session(self, user_id: int):
+        self.sessions.pop(user_id, None)
+
+    def set_interval(self, user_id: int, interval: dt.timedelta):
+        """
+        Changes the reminder interval of a user's current session, if they have one.
+        """
+        session = self.sessions.get(user_id)
+        if session is not None:
+            self.start_session(user_id, session[1], session[2], interval)
+
+    def current_game(self, user_id: int):
+        """
+        Returns the name of the game a user is in a session for, or None.
+        """
+        session = self.sessions.get(user_id)
+        return session[1] if session is not None else None
+
+    def start(self):
+        """
+        Starts run() as a task, unless it's already running.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_event_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        """
+        Sleeps until the earliest reminder is due, sends it, and queues that session's next one.
+        """
+        while True:
+            # throw away reminders for sessions that were stopped or replaced
+            while self.queue and not self._is_live(self.queue[0]):
+                heapq.heappop(self.queue)
+            if not self.queue:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            due = self.queue[0][0]
+            if self.clock.now() < due:
+                await self.clock.sleep_until(due, self.wakeup)
+                continue
+            due, token, user_id = heapq.heappop(self.queue)
+            if not self._is_live((due, token, user_id)):
+                continue
+            interval = self.sessions[user_id][3]
+            heapq.heappush(self.queue, (due + interval, token, user_id))
+            try:
+                await self.callback(user_id, self.sessions[user_id][1])
+                self.reminders_sent += 1
+            # one failed DM shouldn't stop everyone else's reminders
+            except Exception:
+                traceback.print_exc()
+
+    def _is_live(self, entry: tuple):
+        session = self.sessions.get(entry[2])
+        return session is not None and session[0] == entry[1]
+
+
+def _next_reminder(started: dt.datetime, interval: dt.timedelta, now: dt.datetime):
+    """
+    Returns the first time after NOW that is a whole number of intervals after STARTED.
+    """
+    if now < started:
+        return started + interval
+    return started + interval * ((now - started) // interval + 1)
@@ -0,0 +1,67 @@
+# checks the hour jsons against every user's prompts: entries for users or times that no longer exist (orphans),
+# user ids listed twice in one minute (duplicates), and prompts missing from the hour jsons
+# run it with the bot stopped; --fix rewrites the hour jsons that are wrong
+# usage: python check_schedule.py [--directory DIR] [--backend sqlite] [--fix]
+
+import argparse, os, storage, zones
+
+def check(store: storage.Storage, zone_index: zones.ZoneIndex):
+    """
+    Compares every hour json entry with the prompts in the user jsons.
+    Returns (hours, duplicate hours, orphans, missing): the hour jsons as loaded, the hours that had duplicates,
+    and (user_id, slot) lists of entries no prompt accounts for and prompts with no entry (see scheduler.slot()).
+    """
+    hours = {}
+    duplicate_hours = set()
+    # user_id -> slots, the reverse of the hour jsons
+    scheduled = {}
+    for hr in range(24):
+        hours[hr] = store.load_hour(hr)
+        if hr in store.hour_duplicates:
+            duplicate_hours.add(hr)
+        for minute, user_ids in hours[hr].items():
+            for user_id in user_ids:
+                scheduled.setdefault(user_id, set()).add(hr * 60 + int(minute))
+    orphans = []
+    missing = []
+    # one pass over every user, each compared in O(their prompts)
+    for user_id in set(scheduled) | set(store.list_users()):
+        user_json = store.load_user(user_id)
+        expected = set()
+        if user_json is not None:
+            offset = zone_index.offset_for(user_json)
+            expected = {zones.utc_slot(time, offset) for time in user_json["prompts"]}
+        have = scheduled.get(user_id, set())
+        orphans += [(user_id, slot) for slot in sorted(have - expected)]
+        missing += [(user_id, slot) for slot in sorted(expected - have)]
+    return hours, duplicate_hours, orphans, missing
+
+def fix(store: storage.Storage, hours: dict, duplicate_hours: set, orphans: list, missing: list):
+    """
+    Removes ORPHANS, adds MISSING, and rewrites the hours with duplicates, in one commit.
+    Returns how many hour jsons were written.
+    """
+    moves = [(user_id, slot, None) for user_id, slot in orphans] + [(user_id, None, slot) for user_id, slot in missing]
+    changed = storage.apply_hour_moves(hours.__getitem__, moves) | duplicate_hours
+    with store.batch():
+        for hr in changed:
+            store.save_hour(hr, hours[hr])
+    return len(changed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check cornbot's hour jsons against its users' prompts.")
+    parser.add_argument("--directory", default=os.environ.get("CORNBOT_DIRECTORY", os.path.dirname(os.path.abspath(__file__))),
+                        help="folder holding cornbot.db or users/ (default: $CORNBOT_DIRECTORY or this folder)")
+    parser.add_argument("--backend", choices=["sqlite", "legacy"], default=os.environ.get("CORNBOT_STORAGE", "sqlite"))
+    parser.add_argument("--fix", action="store_true", help="rewrite the hour jsons that are wrong")
+    args = parser.parse_args()
+    if os.path.exists(os.path.join(args.directory, "journal.log")) and os.path.getsize(os.path.join(args.directory, "journal.log")):
+        parser.error("journal.log isn't empty; start and stop the bot once so it's folded into storage first.")
+    store = storage.open_storage(args.backend, args.directory)
+    zone_index = zones.ZoneIndex()
+    zone_index.load(os.path.join(args.directory, "zones_index.json"))
+    hours, duplicate_hours, orphans, missing = check(store, zone_index)
+    print(f"{store.duplicate_entries} duplicate entries, {len(orphans)} orphaned entries, {len(missing)} missing prompts.")
+    if args.fix and (duplicate_hours or orphans or missing):
+        print(f"Rewrote {fix(store, hours, duplicate_hours, orphans, missing)} hour jsons.")
+    store.close()
@@ -0,0 +1,84 @@
+# clocks for anything in cornbot that waits on time
+# SystemClock is real UTC time; AcceleratedClock runs faster than real time for testing
+# everything that reads the time goes through default_clock(), so a replay can swap it out
+
+import asyncio, time
+import datetime as dt
+
+class Clock:
+    """
+    Base class for clocks. now() returns a naive datetime in UTC,
+    and sleep_until() waits until the clock reaches a given datetime.
+    """
+
+    # how many clock seconds pass per real second
+    speed = 1.0
+
+    def now(self):
+        raise NotImplementedError
+
+    async def sleep_until(self, when: dt.datetime, wakeup: asyncio.Event=None):
+        """
+        Sleeps until the clock reaches WHEN.
+        If WAKEUP is given and gets set first, returns early and clears it.
+        Returns True if it woke up early.
+        """
+        delay = max((when - self.now()).total_seconds(), 0) / self.speed
+        if wakeup is None:
+            await asyncio.sleep(delay)
+            return False
+        try:
+            await asyncio.wait_for(wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            return False
+        wakeup.clear()
+        return True
+
+
+class SystemClock(Clock):
+    """
+    Real UTC time.
+    """
+
+    def now(self):
+        return dt.datetime.utcnow()
+
+
+class AcceleratedClock(Clock):
+    """
+    A clock that starts at a given UTC datetime and runs SPEED times faster than real time.
+    """
+
+    def __init__(self, start: dt.datetime, speed: float):
+        self.start = start
+        self.speed = speed
+        self.real_start = time.monotonic()
+
+    def now(self):
+        return self.start + dt.timedelta(seconds=(time.monotonic() - self.real_start) * self.speed)
+
+    def jump(self, when: dt.datetime):
+        """
+        Sets the clock to WHEN; it keeps running at the same speed from there.
+        Anything already sleeping on the clock won't notice until it wakes up.
+        """
+        self.start = when
+        self.real_start = time.monotonic()
+
+
+# the clock used by anything that isn't given one
+_default = SystemClock()
+
+def default_clock():
+    """
+    Returns the clock the bot reads time from.
+    """
+    return _default
+
+def set_default_clock(clock: Clock):
+    """
+    Replaces the clock the bot reads time from. Has to happen before main.py is imported,
+    since the scheduler, fanout and break tracker keep the clock they were made with.
+    """
+    global _default
+    _default = clock
@@ -0,0 +1,150 @@
+# bulk export of every user's activity log into one Parquet (or Arrow) dataset, and the matching import
+# each row of the dataset is one logged cell: user_id, date, days (1, or 7/28-31 for rolled-up rows), activity, seconds;
+# files are split into hive partitions by user_id % shards, so a user's rows are all in one partition
+# needs pyarrow, which the bot itself doesn't
+# usage: python export_logs.py export DATASET [--directory DIR] [--backend sqlite] [--format parquet] [--shards 16]
+#        python export_logs.py import DATASET [--directory DIR] [--backend sqlite] [--format parquet]
+
+import argparse, os, storage
+import datetime as dt
+import numpy as np
+from activitylog import ActivityLog
+
+# date32 columns count days from 1970-01-01; logs count them from 0001-01-01
+EPOCH = dt.date(1970, 1, 1).toordinal()
+
+# users whose cells are gathered into one record batch before it's handed to the writer
+USERS_PER_BATCH = 1000
+
+def _pyarrow():
+    """
+    Imports pyarrow and pyarrow.dataset, with a readable error if they aren't installed.
+    """
+    try:
+        import pyarrow, pyarrow.dataset
+    except ImportError:
+        raise SystemExit("export_logs.py needs pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.dataset
+
+def _schema(pa):
+    return pa.schema([
+        ("user_id", pa.int64()),
+        ("date", pa.date32()),
+        ("days", pa.int8()),
+        ("activity", pa.string()),
+        ("seconds", pa.int32()),
+        ("shard", pa.int16())
+    ])
+
+def _batches(store: storage.Storage, shards: int, counts: dict):
+    """
+    Yields one record batch per USERS_PER_BATCH users, so only that many logs are in memory at once.
+    Adds the users and cells written to COUNTS.
+    """
+    pa, _ = _pyarrow()
+    schema = _schema(pa)
+    user_ids = sorted(store.list_users())
+    for start in range(0, len(user_ids), USERS_PER_BATCH):
+        parts = []
+        for user_id in user_ids[start:start + USERS_PER_BATCH]:
+            log_data = store.load_log(user_id)
+            if log_data is None:
+                continue
+            days, spans, cols, seconds = log_data.columns()
+            parts.append((user_id, days, spans, np.array(log_data.activities, dtype=object)[cols], seconds))
+            counts["users"] += 1
+        if not parts:
+            continue
+        user_column = np.concatenate([np.full(len(days), user_id, dtype=np.int64) for user_id, days, _, _, _ in parts])
+        counts["cells"] += len(user_column)
+        yield pa.record_batch([
+            pa.array(user_column),
+            pa.array(np.concatenate([days for _, days, _, _, _ in parts]) - EPOCH, pa.int32()).cast(pa.date32()),
+            pa.array(np.concatenate([spans for _, _, spans, _, _ in parts]), pa.int8()),
+            pa.array(np.concatenate([names for _, _, _, names, _ in parts]), pa.string()),
+            pa.array(np.concatenate([seconds for _, _, _, _, seconds in parts]), pa.int32()),
+            pa.array(user_column % shards, pa.int16())
+        ], schema=schema)
+
+def export(store: storage.Storage, path: str, file_format: str="parquet", shards: int=16):
+    """
+    Writes every user's log in STORE to a new dataset folder at PATH. Returns (users, cells) written.
+    """
+    pa, ds = _pyarrow()
+    counts = {"users":0, "cells":0}
+    ds.write_dataset(_batches(store, shards, counts), path, schema=_schema(pa), format=file_format,
+                     partitioning=ds.partitioning(pa.schema([("shard", pa.int16())]), flavor="hive"),
+                     existing_data_behavior="error", preserve_order=True)
+    return counts["users"], counts["cells"]
+
+def _read(pa, file_path: str, file_format: str):
+    """
+    Reads one dataset file through a memory map, so its pages are loaded straight from the page cache.
+    """
+    if file_format == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(file_path, memory_map=True)
+    with pa.memory_map(file_path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+def read_logs(path: str, file_format: str="parquet"):
+    """
+    Yields (user id, ActivityLog) for every user in a dataset written by export(), one partition file at a time.
+    """
+    pa, ds = _pyarrow()
+    for file_path in sorted(ds.dataset(path, format=file_format, partitioning="hive").files):
+        table = _read(pa, file_path, file_format)
+        user_column = table.column("user_id").to_numpy()
+        days = table.column("date").cast(pa.int32()).to_numpy().astype(np.int64) + EPOCH
+        spans = table.column("days").to_numpy().astype(np.int64)
+        # activity names are looked up once per file instead of once per cell
+        activity = table.column("activity").combine_chunks().dictionary_encode()
+        names = np.array(activity.dictionary.to_pylist(), dtype=object)
+        name_index = activity.indices.to_numpy()
+        seconds = table.column("seconds").to_numpy().astype(np.int64)
+        # a user's rows are contiguous within a file, in the order their log had them
+        order = np.argsort(user_column, kind="stable")
+        user_ids, starts = np.unique(user_column[order], return_index=True)
+        for user_id, rows in zip(user_ids, np.split(order, starts[1:])):
+            # activities keep the order they first appear in, which is the log's column order
+            used, first = np.unique(name_index[rows], return_index=True)
+            used = used[np.argsort(first)]
+            cols = np.empty(len(names), dtype=np.int64)
+            cols[used] = np.arange(len(used))
+            yield int(user_id), ActivityLog.from_columns([str(name) for name in names[used]], days[rows], spans[rows],
+                                                         cols[name_index[rows]], seconds[rows])
+
+def import_logs(store: storage.Storage, path: str, file_format: str="parquet"):
+    """
+    Saves every log in a dataset into STORE, replacing the log each of those users already has.
+    Returns how many logs were saved.
+    """
+    imported = 0
+    # one commit for the whole import
+    with store.batch():
+        for user_id, log_data in read_logs(path, file_format):
+            store.save_log(user_id, log_data)
+            imported += 1
+    return imported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every cornbot activity log to a Parquet/Arrow dataset, or import one.")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("dataset", help="dataset folder to write (export) or read (import)")
+    parser.add_argument("--directory", default=os.environ.get("CORNBOT_DIRECTORY", os.path.dirname(os.path.abspath(__file__))),
+                        help="folder holding cornbot.db or users/ (default: $CORNBOT_DIRECTORY or this folder)")
+    parser.add_argument("--backend", choices=["sqlite", "legacy"], default=os.environ.get("CORNBOT_STORAGE", "sqlite"))
+    parser.add_argument("--format", choices=["parquet", "ipc"], default="parquet", help="ipc is the Arrow file format")
+    parser.add_argument("--shards", type=int, default=16, help="partitions to split users between (export only)")
+    args = parser.parse_args()
+    journal_path = os.path.join(args.directory, "journal.log")
+    if os.path.exists(journal_path) and os.path.getsize(journal_path):
+        parser.error("journal.log isn't empty; start and stop the bot once so it's folded into storage first.")
+    store = storage.open_storage(args.backend, args.directory)
+    if args.action == "export":
+        users, cells = export(store, args.dataset, args.format, args.shards)
+        print(f"Exported {cells} cells from {users} logs to {args.dataset}.")
+    else:
+        imported = import_logs(store, args.dataset, args.format)
+        print(f"Imported {imported} logs from {args.dataset} into {args.directory}.")
+    store.close()
@@ -0,0 +1,98 @@
+# concurrent prompt delivery
+# sends a minute's prompts with bounded concurrency through cached DM channels,
+# and keeps track of how late each minute's prompts were delivered
+
+import asyncio
+import datetime as dt
+from collections import deque
+from clock import Clock, default_clock
+
+class PromptFanout:
+    """
+    Sends lots of DMs at once without a REST round-trip per user.
+
+    DM channels are cached by user id, and users are looked up in the client's
+    member cache before falling back to fetch_user(). At most CONCURRENCY sends
+    are in flight at a time. A failed send is counted but doesn't stop the rest.
+    """
+
+    def __init__(self, client, concurrency: int, clock: Clock=None, history: int=24 * 60):
+        """
+        CLIENT: discord client, or anything with get_user() and fetch_user()
+        CONCURRENCY: how many sends can be in flight at once
+        CLOCK: clock.Clock used to measure delivery lag
+        HISTORY: how many minutes of lag stats to keep
+        """
+        self.client = client
+        self.clock = clock or default_clock()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # user_id -> DM channel
+        self.channels = {}
+        # one dict of lag stats per minute that had prompts, oldest first
+        self.lag_history = deque(maxlen=history)
+        self.sent = 0
+        self.failed = 0
+
+    async def channel_for(self, user_id: int):
+        """
+        Returns the DM channel for a user, fetching and caching it if needed.
+        """
+        if user_id in self.channels:
+            return self.channels[user_id]
+        # get_user() only looks in the client's cache; fetch_user() is a REST call
+        user = self.client.get_user(user_id)
+        if user is None:
+            user = await self.client.fetch_user(user_id)
+        channel = user.dm_channel
+        if channel is None:
+            channel = await user.create_dm()
+        self.channels[user_id] = channel
+        return channel
+
+    async def send_all(self, due: dt.datetime, messages: list):
+        """
+        Sends every (user_id, content) in MESSAGES, then records lag stats for the minute.
+        DUE is when the messages were supposed to go out.
+        Returns the stats dict for this minute, plus "failed_ids": the user ids whose send failed.
+        """
+        results = await asyncio.gather(*[self._send(due, user_id, content) for user_id, content in messages])
+        lags = sorted(lag for lag in results if lag is not None)
+        failed_ids = [user_id for (user_id, _), lag in zip(messages, results) if lag is None]
+        stats = {
+            "due":due.isoformat(),
+            "sent":len(lags),
+            "failed":len(results) - len(lags),
+            "p50":_percentile(lags, 50),
+            "p90":_percentile(lags, 90),
+            "p99":_percentile(lags, 99),
+            "max":lags[-1] if lags else None
+        }
+        self.lag_history.append(stats)
+        return {**stats, "failed_ids":failed_ids}
+
+    async def _send(self, due: dt.datetime, user_id: int, content: str):
+        """
+        Sends one message. Returns its lag in seconds, or None if it failed.
+        """
+        async with self.semaphore:
+            try:
+                channel = await self.channel_for(user_id)
+                await channel.send(content)
+            except Exception as error:
+                # the channel may be stale (user left, DMs closed), so look it up fresh next time
+                self.channels.pop(user_id, None)
+                self.failed += 1
+                print(f"Couldn't send prompt to {user_id}: {error!r}")
+                return None
+        self.sent += 1
+        return (self.clock.now() - due).total_seconds()
+
+
+def _percentile(sorted_list: list, percent: int):
+    """
+    Returns the nearest-rank percentile of an already sorted list, or None if it's empty.
+    """
+    if len(sorted_list) == 0:
+        return None
+    index = max(0, -(-len(sorted_list) * percent // 100) - 1)
+    return sorted_list[index]
@@ -26,7 +26,7 @@ HELP = {
     ,
     "log": "`log <activity> <time>`"
     "\nMakes an entry in your personal activity log. You have 10 activity slots."
-    "\n`<time>` - Examples: '1 hour 30 min', '75minutes', '1h 10m30s', etc."
+    "\n`<time>` - Examples: '1 hour 30 min', '75minutes', '1h 10m30s', '1.5 hours', '1:30', etc."
     ,
     "merge": "`merge <activity1> <activity2> <new-activity>`"
     "\nAllows the time from two log activities to be merged into one."
@@ -44,11 +44,12 @@ HELP = {
     ,
     "schedule": "`schedule <break, prompt> <args>`"
     "\nSet a prompt or break reminder for a certain time."
-    "\n`schedule break <game> <time>` - `<time>` Examples: '1h30m', '40 minutes', etc."
+    "\n`schedule break <game> <time>` - `<time>` Examples: '1h30m', '40 minutes', '1:15', etc."
     "\n`schedule prompt <24-hr-time> <message>` - Must be a 24 hour time (no AM or PM)."
     ,
-    "timezone": "`timezone <offset>`"
+    "timezone": "`timezone <offset or zone>`"
     "\nSet or check your timezone setting."
+    "\n`<offset>` is your hours from UTC, like `-4`. A zone name like `America/New_York` follows daylight saving time for you."
     "\nTo see your current timezone, don't give an `<offset>`. To see all timezones, use `list timezones`."
 }
 
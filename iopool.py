@@ -0,0 +1,121 @@
+# runs blocking disk work and CPU-heavy log work off the event loop
+# storage, the user cache and the journal aren't thread-safe, so every call into them goes
+# through one I/O thread, in the order it was made; CPU-heavy work can go to a process pool instead
+
+import asyncio, functools, time, traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+class IOPool:
+    """
+    A single I/O thread plus an optional pool of worker processes, with an awaitable API.
+
+    run() is for anything that touches storage. Jobs run one at a time in submission order,
+    so storage code never has to lock, and the event loop keeps serving heartbeats and
+    other users' commands while a large log is read or the journal is compacted.
+    compute() is for pure functions of their arguments (formatting a log, say): they go to
+    a worker process when PROCESSES > 0, and to the I/O thread otherwise.
+    """
+
+    def __init__(self, processes: int=0):
+        """
+        PROCESSES: worker processes for compute(); 0 runs compute() jobs on the I/O thread
+        """
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cornbot-io")
+        self.process_count = processes
+        # started by the first compute() that needs it, so the bot doesn't fork at import time
+        self.processes = None
+        # the event loop run() was last awaited from; timers are scheduled on it
+        self.loop = None
+        self.jobs = 0
+        self.queued = 0
+        self.max_queued = 0
+        # seconds the I/O thread spent running jobs
+        self.busy = 0.0
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs FUNCTION(*ARGS, **KWARGS) on the I/O thread and returns its result.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            return await self.loop.run_in_executor(self.thread, self._timed, functools.partial(function, *args, **kwargs))
+        finally:
+            self.queued -= 1
+
+    async def compute(self, function, *args):
+        """
+        Runs FUNCTION(*ARGS) in a worker process and returns its result. FUNCTION and ARGS must be picklable.
+        """
+        if self.process_count <= 0:
+            return await self.run(function, *args)
+        if self.processes is None:
+            self.processes = ProcessPoolExecutor(self.process_count)
+        return await asyncio.get_running_loop().run_in_executor(self.processes, function, *args)
+
+    def call_later(self, delay: float, function):
+        """
+        Runs FUNCTION on the I/O thread after DELAY seconds. Safe to call from any thread.
+        Returns a handle with cancel(). Raises RuntimeError if there's no event loop to time it with,
+        so callers like journal.Journal can fall back to doing the work right away.
+        """
+        if self.loop is None or self.loop.is_closed():
+            raise RuntimeError("No event loop to run the timer on")
+        timer = _Timer()
+
+        def fire():
+            if not timer.cancelled:
+                try:
+                    self.thread.submit(self._timed, functools.partial(_report_errors, function))
+                except RuntimeError:
+                    # shut down; close() leaves nothing waiting on timers
+                    pass
+
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, fire)
+        return timer
+
+    def stats(self):
+        return {
+            "jobs":self.jobs,
+            "queued":self.queued,
+            "max_queued":self.max_queued,
+            "busy_seconds":self.busy,
+            "processes":self.process_count
+        }
+
+    def close(self):
+        """
+        Waits for every submitted job to finish, then stops the thread and any worker processes.
+        """
+        self.thread.shutdown(wait=True)
+        if self.processes is not None:
+            self.processes.shutdown(wait=True)
+
+    def _timed(self, function):
+        began = time.perf_counter()
+        try:
+            return function()
+        finally:
+            self.busy += time.perf_counter() - began
+            self.jobs += 1
+
+
+class _Timer:
+    """
+    Handle returned by IOPool.call_later().
+    """
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def _report_errors(function):
+    # nothing awaits a timer's job, so print what went wrong instead of dropping it
+    try:
+        function()
+    except Exception:
+        traceback.print_exc()
@@ -0,0 +1,435 @@
+# append-only mutation journal
+# every change to user data is written here first as one small fsync'd line,
+# then a background compaction folds the changes into the storage backend
+
+import asyncio, io, json, os, zlib
+import datetime as dt
+from storage import Storage, apply_hour_moves, minute_lists
+# activitylog is imported where it's used, so numpy isn't loaded until a log is
+
+class Journal:
+    """
+    A file of checksummed records, one per line: "<crc32 hex> <json>".
+
+    A crash can only ever leave a torn last line, which fails its checksum
+    and is dropped on replay along with anything after it.
+
+    Records reach the OS as soon as they're appended, so they survive the bot crashing.
+    Surviving a power cut takes an fsync; with a SYNC_DELAY, appends made within that
+    many seconds of each other share one fsync (group commit).
+    """
+
+    def __init__(self, path: str, sync_delay: float=0.0, call_later=None):
+        """
+        PATH: journal file
+        SYNC_DELAY: seconds an append can wait for its fsync, so a burst shares one; 0 fsyncs every append
+        CALL_LATER: function(delay, callback) that schedules the delayed fsync and returns a handle with cancel(),
+            like iopool.IOPool.call_later; defaults to the running event loop's
+        """
+        self.path = path
+        self.file = open(path, "ab")
+        self.sync_delay = sync_delay
+        self.call_later = call_later or _loop_call_later
+        self.timer = None
+        self.bytes_written = 0
+        self.appends = 0
+        self.unsynced = 0
+        self.syncs = 0
+        self.coalesced = 0
+
+    def append(self, record: dict, sync: bool=True):
+        """
+        Writes a record and fsyncs it, or schedules the fsync if there's a sync delay.
+        With SYNC=False it's left for the caller to call sync().
+        Returns how many bytes were written.
+        """
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        line = b"%08x %s\n" % (zlib.crc32(payload), payload)
+        self.file.write(line)
+        self.file.flush()
+        self.bytes_written += len(line)
+        self.appends += 1
+        self.unsynced += 1
+        if sync and self.sync_delay <= 0:
+            self.sync()
+        elif sync and self.timer is None:
+            try:
+                self.timer = self.call_later(self.sync_delay, self.sync)
+            except RuntimeError:
+                # nothing to run the timer, so don't leave the record waiting
+                self.sync()
+        return len(line)
+
+    def sync(self):
+        """
+        Fsyncs every record appended since the last sync.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.unsynced == 0:
+            return
+        os.fsync(self.file.fileno())
+        self.syncs += 1
+        self.coalesced += self.unsynced - 1
+        self.unsynced = 0
+
+    def stats(self):
+        return {
+            "appends":self.appends,
+            "syncs":self.syncs,
+            "coalesced":self.coalesced,
+            "bytes_written":self.bytes_written
+        }
+
+    def records(self):
+        """
+        Returns a list of every intact record in the journal, oldest first.
+        """
+        records = []
+        with open(self.path, "rb") as file:
+            for line in file:
+                # no newline means the write was cut off
+                if not line.endswith(b"\n") or len(line) < 10:
+                    break
+                payload = line[9:-1]
+                if line[8:9] != b" " or int(line[:8], 16) != zlib.crc32(payload):
+                    break
+                records.append(json.loads(payload))
+        return records
+
+    def size(self):
+        return self.file.tell()
+
+    def reset(self):
+        """
+        Empties the journal, once everything in it is safely in the storage backend.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.file.truncate(0)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def _loop_call_later(delay: float, callback):
+    return asyncio.get_running_loop().call_later(delay, callback)
+
+
+class JournaledStorage(Storage):
+    """
+    Storage backend wrapper that journals log and hour json mutations instead of
+    rewriting whole files. Changed objects are held in memory until compact() writes them.
+
+    User jsons are passed straight through; usercache.UserStore journals those itself.
+    """
+
+    def __init__(self, base: Storage, journal: Journal):
+        self.base = base
+        self.journal = journal
+        # user_id -> ActivityLog, or None if the log was deleted
+        self.logs = {}
+        # hr -> hour json, and which of them have changed since the last compaction
+        self.hours = {}
+        self.dirty_hours = set()
+        # user_id -> set of slots (see scheduler.slot()) they're in across the hour jsons, the reverse of self.hours;
+        # built from all 24 the first time it's needed, None until then
+        self.user_slots = None
+
+    @property
+    def duplicate_entries(self):
+        return self.base.duplicate_entries
+
+    def list_users(self):
+        return self.base.list_users()
+
+    def load_user(self, user_id: int):
+        return self.base.load_user(user_id)
+
+    def user_zones(self):
+        return self.base.user_zones()
+
+    def save_user(self, user_id: int, user_json: dict):
+        self.base.save_user(user_id, user_json)
+
+    def delete_user(self, user_id: int):
+        self.base.delete_user(user_id)
+
+    def load_log(self, user_id: int):
+        if user_id in self.logs:
+            return self.logs[user_id]
+        return self.base.load_log(user_id)
+
+    def load_summary(self, user_id: int):
+        if user_id in self.logs:
+            log_data = self.logs[user_id]
+            return log_data.summary() if log_data is not None else None
+        return self.base.load_summary(user_id)
+
+    def save_summary(self, user_id: int, summary: "LogSummary"):
+        self.base.save_summary(user_id, summary)
+
+    def save_log(self, user_id: int, log_data: "ActivityLog"):
+        self.journal.append({"op":"log", "user_id":user_id, "csv":_log_to_csv(log_data)})
+        self.logs[user_id] = log_data
+
+    def delete_log(self, user_id: int):
+        existed = self.load_log(user_id) is not None
+        self.journal.append({"op":"log_delete", "user_id":user_id})
+        self.logs[user_id] = None
+        return existed
+
+    def load_hour(self, hr: int):
+        if hr not in self.hours:
+            self.hours[hr] = self.base.load_hour(hr)
+        return self.hours[hr]
+
+    def load_hours(self):
+        missing = [hr for hr in range(24) if hr not in self.hours]
+        if missing:
+            loaded = self.base.load_hours()
+            for hr in missing:
+                self.hours[hr] = loaded[hr]
+        return {hr:self.hours[hr] for hr in range(24)}
+
+    def save_hour(self, hr: int, hour_json: dict):
+        self.journal.append({"op":"hour", "hr":hr, "json":minute_lists(hour_json)})
+        self.hours[hr] = hour_json
+        self.dirty_hours.add(hr)
+        # a whole hour replaced; rare enough to just rebuild the reverse index
+        self.user_slots = None
+
+    def slots_of(self, user_id: int):
+        return sorted(self.slot_index().get(user_id, ()))
+
+    def slot_index(self):
+        """
+        Returns the reverse index of the hour jsons, {user_id: set of slots}, building it if needed.
+        """
+        if self.user_slots is None:
+            self.user_slots = {}
+            for hr, hour_json in self.load_hours().items():
+                for minute, user_ids in hour_json.items():
+                    for user_id in user_ids:
+                        self.user_slots.setdefault(user_id, set()).add(hr * 60 + int(minute))
+        return self.user_slots
+
+    def _index_moves(self, moves: list):
+        """
+        Applies (user_id, old slot, new slot) MOVES to the reverse index, if it's been built,
+        in the same order apply_hour_moves() applies them to the hour jsons.
+        """
+        if self.user_slots is None:
+            return
+        user_slots = self.user_slots
+        # users left with no slots once the removes are done; most get new ones right after, so their sets are kept
+        emptied = []
+        for user_id, old, _ in moves:
+            if old is not None:
+                slots = user_slots.get(user_id)
+                if slots is not None:
+                    slots.discard(old)
+                    if not slots:
+                        emptied.append(user_id)
+        for user_id, _, new in moves:
+            if new is not None:
+                slots = user_slots.get(user_id)
+                if slots is None:
+                    user_slots[user_id] = {new}
+                else:
+                    slots.add(new)
+        for user_id in emptied:
+            if not user_slots.get(user_id, True):
+                user_slots.pop(user_id)
+
+    def log_time(self, user_id: int, date, activity: str, seconds: int):
+        log_data = self._log_for_change(user_id)
+        updated = log_data.add(date, activity, seconds)
+        # journal the resulting value rather than the amount added, so replaying it twice is harmless
+        self.journal.append({"op":"log_set", "user_id":user_id, "date":str(date), "activity":activity, "seconds":updated})
+        return updated
+
+    def drop_activity(self, user_id: int, activity: str):
+        self._log_for_change(user_id).drop(activity)
+        self.journal.append({"op":"log_drop", "user_id":user_id, "activity":activity})
+
+    def merge_activities(self, user_id: int, activity1: str, activity2: str, new_activity: str):
+        self._log_for_change(user_id).merge(activity1, activity2, new_activity)
+        self.journal.append({"op":"log_merge", "user_id":user_id, "activities":[activity1, activity2, new_activity]})
+
+    def roll_up_log(self, user_id: int, today, daily_days: int, weekly_days: int):
+        if user_id not in self.logs:
+            # the base backend has the latest log, so it can be rolled up there without journaling all of it
+            return self.base.roll_up_log(user_id, today, daily_days, weekly_days)
+        log_data = self.logs[user_id]
+        if log_data is None or not log_data.roll_up(today, daily_days, weekly_days):
+            return False
+        # later log_set records for old days are for the rolled-up rows, so replay has to roll up at the same point
+        self.journal.append({"op":"log_roll_up", "user_id":user_id, "today":str(today), "daily_days":daily_days, "weekly_days":weekly_days})
+        return True
+
+    def add_to_hour(self, hr: int, minute: str, user_id: int):
+        hour_json = self.load_hour(hr)
+        _apply_hour_add(hour_json, minute, user_id)
+        self._index_moves([(user_id, None, hr * 60 + int(minute))])
+        self.journal.append({"op":"hour_add", "hr":hr, "minute":minute, "user_id":user_id})
+        self.dirty_hours.add(hr)
+        return hour_json
+
+    def remove_from_hour(self, hr: int, minute: str, user_id: int):
+        hour_json = self.load_hour(hr)
+        _apply_hour_remove(hour_json, minute, user_id)
+        self._index_moves([(user_id, hr * 60 + int(minute), None)])
+        self.journal.append({"op":"hour_remove", "hr":hr, "minute":minute, "user_id":user_id})
+        self.dirty_hours.add(hr)
+        return hour_json
+
+    def move_in_hours(self, moves: list):
+        # one journal record for the whole move, however many prompts it covers
+        changed = apply_hour_moves(self.load_hour, moves)
+        self._index_moves(moves)
+        self.journal.append({"op":"hour_moves", "moves":moves})
+        self.dirty_hours.update(changed)
+        return changed
+
+    def compact(self):
+        """
+        Writes every changed log and hour json to the base backend and empties the journal.
+        Any user jsons in the journal must already be flushed by the UserStore.
+        Returns how many objects were written.
+
+        The final state of every changed log is journaled first, between compact_begin
+        and compact_end records. If the bot stops partway through writing the base backend,
+        recover() replays just those instead of the log changes that led up to them.
+        """
+        if self.logs:
+            # the whole checkpoint shares one fsync
+            self.journal.append({"op":"compact_begin"}, sync=False)
+            for user_id, log_data in self.logs.items():
+                if log_data is None:
+                    self.journal.append({"op":"log_delete", "user_id":user_id}, sync=False)
+                else:
+                    self.journal.append({"op":"log", "user_id":user_id, "csv":_log_to_csv(log_data)}, sync=False)
+            self.journal.append({"op":"compact_end"}, sync=False)
+            self.journal.sync()
+        written = 0
+        # everything is committed to the base backend in one go before the journal is emptied
+        with self.base.batch():
+            for user_id, log_data in self.logs.items():
+                if log_data is None:
+                    self.base.delete_log(user_id)
+                else:
+                    self.base.save_log(user_id, log_data)
+                written += 1
+            for hr in self.dirty_hours:
+                self.base.save_hour(hr, self.hours[hr])
+                written += 1
+        # hour jsons stay cached after being written; there are only 24 of them
+        self.logs.clear()
+        self.dirty_hours.clear()
+        self.journal.reset()
+        return written
+
+    def recover(self):
+        """
+        Replays the journal left by the last run into the base backend, then empties it.
+        Returns how many records were replayed.
+
+        User and hour json records always give the same result when replayed on top
+        of newer data, so all of them are applied. Log records are only safe on top of
+        the data they were made against, so if a compaction finished journaling its
+        checkpoint, only the logs in that checkpoint are applied.
+        """
+        records = self.journal.records()
+        ops = [record["op"] for record in records]
+        log_start = 0
+        if "compact_end" in ops:
+            last_end = len(ops) - 1 - ops[::-1].index("compact_end")
+            log_start = last_end - 1 - ops[last_end-1::-1].index("compact_begin")
+        with self.base.batch():
+            self._replay(records, log_start)
+        self.compact()
+        return len(records)
+
+    def _replay(self, records: list, log_start: int):
+        """
+        Applies journal records, skipping log records before LOG_START.
+        """
+        for i, record in enumerate(records):
+            op = record["op"]
+            if op == "user":
+                self.base.save_user(record["user_id"], record["json"])
+            elif op == "user_delete":
+                self.base.delete_user(record["user_id"])
+            elif op == "hour":
+                self.hours[record["hr"]] = self.base.minute_sets(record["hr"], record["json"])
+                self.dirty_hours.add(record["hr"])
+            elif op == "hour_add":
+                _apply_hour_add(self.load_hour(record["hr"]), record["minute"], record["user_id"])
+                self.dirty_hours.add(record["hr"])
+            elif op == "hour_remove":
+                _apply_hour_remove(self.load_hour(record["hr"]), record["minute"], record["user_id"])
+                self.dirty_hours.add(record["hr"])
+            elif op == "hour_moves":
+                self.dirty_hours.update(apply_hour_moves(self.load_hour, record["moves"]))
+            elif i < log_start:
+                continue
+            elif op == "log":
+                self.logs[record["user_id"]] = _log_from_csv(record["csv"])
+            elif op == "log_delete":
+                self.logs[record["user_id"]] = None
+            elif op == "log_set":
+                log_data = self._log_for_change(record["user_id"])
+                log_data.set(dt.date.fromisoformat(record["date"]), record["activity"], record["seconds"])
+            elif op == "log_drop":
+                self._log_for_change(record["user_id"]).drop(record["activity"])
+            elif op == "log_merge":
+                self._log_for_change(record["user_id"]).merge(*record["activities"])
+            elif op == "log_roll_up":
+                self._log_for_change(record["user_id"]).roll_up(dt.date.fromisoformat(record["today"]),
+                                                                record["daily_days"], record["weekly_days"])
+        # built again from the replayed hour jsons when next needed
+        self.user_slots = None
+
+    def batch(self):
+        return self.base.batch()
+
+    def close(self):
+        self.journal.close()
+        self.base.close()
+
+    def _log_for_change(self, user_id: int):
+        """
+        Returns the in-memory log for a user that is about to be changed, making one if needed.
+        """
+        log_data = self.load_log(user_id)
+        if log_data is None:
+            from activitylog import ActivityLog
+            log_data = ActivityLog()
+        self.logs[user_id] = log_data
+        return log_data
+
+
+def _apply_hour_add(hour_json: dict, minute: str, user_id: int):
+    hour_json.setdefault(minute, set()).add(user_id)
+
+def _apply_hour_remove(hour_json: dict, minute: str, user_id: int):
+    if user_id in hour_json.get(minute, ()):
+        hour_json[minute].discard(user_id)
+        if len(hour_json[minute]) == 0:
+            hour_json.pop(minute)
+
+def _log_to_csv(log_data: "ActivityLog"):
+    file = io.StringIO()
+    log_data.to_csv(file)
+    return file.getvalue()
+
+def _log_from_csv(csv_str: str):
+    from activitylog import ActivityLog
+    return ActivityLog.from_csv(io.StringIO(csv_str))
@@ -1,21 +1,131 @@
 # discord bot by Alan Wells
 
-import discord, util, json, os, helpstrings, customhelp
+import time
+# everything imported after this counts towards "imports" in the startup report
+STARTUP_BEGAN = time.perf_counter()
+
+import discord, asyncio, traceback, util, os, sys, helpstrings, customhelp, storage, usercache, journal, scheduler, fanout, breaks, clock, metrics, actors, iopool, timeparse, copy, responsecache, sharding, zones, outbox
 from discord.ext import commands, tasks
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
-import pandas as pd
 
-DIRECTORY_PATH = os.path.dirname(__file__)
-USERS_PATH = os.path.join(DIRECTORY_PATH, "users")
-TIMES_PATH = os.path.join(DIRECTORY_PATH, "times")
-HOURLY_UPDATE_TIMES = [dt.time(hour=i) for i in range(24)]
+# where cornbot.db (or users/ and times/), the journal, and the registry index live
+DIRECTORY_PATH = os.environ.get("CORNBOT_DIRECTORY", os.path.dirname(__file__))
+# "sqlite" keeps everything in cornbot.db, "legacy" keeps the users/ and times/ files
+# an existing install with users/ and no cornbot.db won't start on sqlite until migrate.py has been run once
+STORAGE_BACKEND = os.environ.get("CORNBOT_STORAGE", "sqlite")
+# to split the bot over several processes, start CORNBOT_SHARD_COUNT of them with CORNBOT_SHARD_ID 0, 1, 2...
+# worker 0 gets every DM, so it runs the commands and writes user data; each worker connects to its share of
+# guilds and sends the prompts and break reminders of its share of users (see sharding.py)
+SHARD_COUNT = int(os.environ.get("CORNBOT_SHARD_COUNT", 1))
+SHARD_ID = int(os.environ.get("CORNBOT_SHARD_ID", 0))
+# where workers queue changes for each other
+SHARED_PATH = os.path.join(DIRECTORY_PATH, "shared.db")
+# how often a worker checks for changes queued for it, in real seconds
+SHARD_POLL_SECONDS = 0.02
+# every change is journaled first, then folded into storage every FLUSH_SECONDS
+# only worker 0 makes changes, but every worker keeps its own journal so none of them replays or empties another's
+JOURNAL_PATH = os.path.join(DIRECTORY_PATH, "journal.log" if SHARD_ID == sharding.COMMAND_SHARD else f"journal-{SHARD_ID}.log")
+FLUSH_SECONDS = 5
+# journal appends within this many seconds share one fsync, and legacy file writes are committed
+# in groups this often; a power cut can lose that much, 0 makes every write durable before replying
+SYNC_DELAY_SECONDS = float(os.environ.get("CORNBOT_SYNC_DELAY", 0.005))
+# worker processes for formatting logs off the I/O thread; 0 formats them on the I/O thread
+IO_PROCESSES = int(os.environ.get("CORNBOT_IO_PROCESSES", 0))
+# how many bytes of user jsons to keep in memory
+USER_CACHE_BYTES = int(os.environ.get("CORNBOT_USER_CACHE_BYTES", 64 * 1024 * 1024))
+# log rows older than RETENTION_DAILY_DAYS are rolled into weeks, and older than RETENTION_WEEKLY_DAYS into months,
+# once a day in the background, so logs stop growing a row per day; totals don't change
+RETENTION_DAILY_DAYS = 90
+RETENTION_WEEKLY_DAYS = 365
+# how many users' logs are rolled up at once, so commands can run in between
+RETENTION_BATCH_USERS = 200
+# how many rendered "list" replies to keep for reuse, over all users
+RESPONSE_CACHE_ENTRIES = 20000
+# how many prompt DMs can be sending at the same time
+PROMPT_CONCURRENCY = 50
+# due prompts are queued here and sent from the queue, so failed sends are retried and a restart doesn't lose them
+# each worker queues and sends its own users' prompts
+OUTBOX_PATH = os.path.join(DIRECTORY_PATH, "outbox.db" if SHARD_ID == sharding.COMMAND_SHARD else f"outbox-{SHARD_ID}.db")
+# minutes that came due while the bot was down are fired on startup if they're at most this many minutes old,
+# and queued prompts older than that are dropped instead of sent
+CATCH_UP_MINUTES = int(os.environ.get("CORNBOT_CATCH_UP_MINUTES", 60))
+# how many queued prompts are sent at a time; newest first, so a backlog doesn't hold up the minute due now
+OUTBOX_BATCH = 500
+# a failed send is retried after OUTBOX_RETRY_SECONDS, twice that the next time, and so on, up to OUTBOX_MAX_ATTEMPTS sends
+OUTBOX_RETRY_SECONDS = 30
+OUTBOX_MAX_ATTEMPTS = 5
+# sorted list of registered user ids, so startup doesn't have to list every user
+REGISTRY_PATH = os.path.join(DIRECTORY_PATH, "users_index.json")
+# which users picked an IANA zone name, and the offset each zone's prompts are scheduled at
+ZONES_PATH = os.path.join(DIRECTORY_PATH, "zones_index.json")
+# a zone's prompts are moved this many seconds before its offset changes, after the minute before it has fired,
+# so none are due while they move
+ZONE_MOVE_EARLY_SECONDS = 30
+# per-command and per-loop metrics, served in prometheus format on 127.0.0.1:METRICS_PORT (0 turns the endpoint off)
+# set CORNBOT_METRICS=off to stop recording them at all
+METRICS_ENABLED = os.environ.get("CORNBOT_METRICS", "on") != "off"
+METRICS_PORT = int(os.environ.get("CORNBOT_METRICS_PORT", 9108))
+# workers serve their metrics on consecutive ports
+if METRICS_PORT:
+    METRICS_PORT += SHARD_ID
+# if set, a json snapshot of the metrics is written here every METRICS_DUMP_SECONDS
+METRICS_DUMP_PATH = os.environ.get("CORNBOT_METRICS_DUMP")
+METRICS_DUMP_SECONDS = 60
+# run with --startup-report to print how long each part of startup took
+STARTUP_REPORT = "--startup-report" in sys.argv
+
+# everything reads the time from here, so benchmarks.replay can run the bot on a faster clock
+bot_clock = clock.default_clock()
+bot_metrics = metrics.Metrics(METRICS_ENABLED)
+
+# (phase name, seconds), in the order the phases finished
+startup_phases = [("imports", time.perf_counter() - STARTUP_BEGAN)]
+# set right before connecting, and cleared once the report has been printed
+connect_began = None
+
+# every call into store and users goes through io_pool's thread, so disk work never blocks the event loop
+io_pool = iopool.IOPool(IO_PROCESSES)
+mutation_journal = journal.Journal(JOURNAL_PATH, SYNC_DELAY_SECONDS, io_pool.call_later)
+store = journal.JournaledStorage(storage.open_storage(STORAGE_BACKEND, DIRECTORY_PATH, SYNC_DELAY_SECONDS, io_pool.call_later),
+                                 mutation_journal)
+users = usercache.UserStore(store, USER_CACHE_BYTES, mutation_journal)
+# None when the bot runs as one process
+shared = sharding.SharedStore(SHARED_PATH, SHARD_ID, SHARD_COUNT) if SHARD_COUNT > 1 else None
+prompt_outbox = outbox.Outbox(OUTBOX_PATH, OUTBOX_RETRY_SECONDS, OUTBOX_MAX_ATTEMPTS)
+# set when prompts are queued, so run_outbox() sends them straight away
+outbox_wakeup = asyncio.Event()
+# the last minute that fired before this start, if it's recent enough to fire the minutes after it; see load_state()
+catch_up_since = None
+# "list" replies are reused until the user's data version is bumped by put_user() or change_log()
+response_cache = responsecache.ResponseCache(RESPONSE_CACHE_ENTRIES)
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
+# presence updates drive break reminders
+intents.presences = True
 
-client = commands.Bot(command_prefix='', intents=intents, case_insensitive=True)
+client = commands.Bot(command_prefix='', intents=intents, case_insensitive=True,
+                      shard_id=SHARD_ID if shared else None, shard_count=SHARD_COUNT if shared else None)
 client.help_command = customhelp.CustomHelp()
+bot_metrics.count_api_calls(client.http)
+
+# commands that change a user's data run one at a time per user, in the order they were sent,
+# while different users' commands run concurrently
+user_mailboxes = actors.Mailboxes()
+# the one task that changes the shared hour jsons and scheduler buckets
+hour_owner = actors.Actor()
+# users with a zone name, which run_zone_transitions() moves the prompts of whenever their zone's offset changes
+zone_index = zones.ZoneIndex()
+# set when a user picks a zone nobody else has, which might change offset before the one being waited on
+zone_wakeup = asyncio.Event()
+
+def command_author(ctx, *args, **kwargs):
+    """
+    Mailbox key for a command: the user who sent it.
+    """
+    return ctx.author.id
 
 #################### EVENTS ####################
 
@@ -24,30 +134,29 @@ async def on_ready():
     """
     Setup function that runs on startup.
     """
+    global connect_began
+    ready_began = time.perf_counter()
+    if connect_began is not None:
+        startup_phases.append(("gateway connect", ready_began - connect_began))
     print(f"Local time is {dt.datetime.now()}.")
-    print(f"UTC time is {dt.datetime.utcnow()}.")
-    # populate util.registered_users list
-    for filename in os.listdir(USERS_PATH):
-        if filename.endswith(".json"):
-            util.registered_users.append(int(filename[:-5]))
-    print(f"Found {len(util.registered_users)} registered user files.")
-    # populate times for prompt_users
-    utcnow_hour = dt.datetime.utcnow().hour
-    print(f"Loading prompts and populating times from times/{utcnow_hour}.json...")
-    with open(f"times/{utcnow_hour}.json", "r") as file:
-        hour_json = json.load(file)
-        prompt_users.change_interval(time=util.populate_times(hour_json, utcnow_hour))
-        util.current_hour_json = hour_json
-    # count how many times were loaded, not counting 0:00:13
-    if len(prompt_users.time) == 1 and prompt_users.time[0].second == 13:
-        loaded_times = 0
-    else:
-        loaded_times = len(prompt_users.time)
-    print(f"Loaded {loaded_times} times for this hour.")
+    print(f"UTC time is {bot_clock.now()}.")
+    print(f"Found {len(util.registered_users)} registered users and {prompt_scheduler.count()} prompts.")
+    # start break sessions for registered users who are already playing something
+    for member in client.get_all_members():
+        if member.id in util.registered_users:
+            await update_break_session(member)
+    print(f"Tracking {len(break_tracker.sessions)} game sessions.")
     print("Starting loops...")
-    prompt_users.start()
-    hourly_update.start()
-    break_check.start()
+    start_loops()
+    # make sure the registry index still matches storage, without holding up startup
+    if SHARD_ID == sharding.COMMAND_SHARD:
+        client.loop.create_task(check_registry())
+        client.loop.create_task(check_zone_index())
+    if connect_began is not None:
+        startup_phases.append(("loops and break sessions", time.perf_counter() - ready_began))
+        if STARTUP_REPORT:
+            print_startup_report()
+        connect_began = None
     # set status
     await client.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name="DM's"))
     print(f"Successfully logged in as {client.user}.")
@@ -63,10 +172,30 @@ async def on_member_join(member):
                       "We'll just need your timezone to finish setting up. You can say `timezone` to continue.")
     # await member.kick()
 
+@client.event
+async def on_presence_update(before, after):
+    """
+    Starts or stops a registered user's game session when their activity changes.
+    """
+    if after.id in util.registered_users:
+        await update_break_session(after)
+
+@client.before_invoke
+async def start_command_metrics(ctx):
+    ctx.metrics_token = bot_metrics.start("command", ctx.command.qualified_name)
+
+@client.after_invoke
+async def finish_command_metrics(ctx):
+    """
+    Records how long a command took and what it touched. Runs even if the command raised.
+    """
+    bot_metrics.finish(getattr(ctx, "metrics_token", None), ctx.command_failed)
+
 
 #################### COMMANDS ####################
 
 @client.command()
+@user_mailboxes.serialized(command_author)
 async def log(ctx, *, arg=None):
     """
     Command to log time of an activity.
@@ -85,82 +214,42 @@ async def log(ctx, *, arg=None):
         if len(activity) > 30:
             await ctx.send("Couldn't parse activity; names must be 30 characters or less.")
             return
-        # then rejoin all following args into 1 string, no spaces,
-        # and resplit it into alphabetical and numeric elements
+        # everything after the activity is the time
         try:
-            arg_list = util.split_alpha_num("".join(arg_list))
-        # if split_alpha_num gives ValueError, arg has non-alphanumeric characters
-        except ValueError:
-            await ctx.send("Couldn't parse time; accepts `hours`, `minutes`, and `seconds` (can be abbreviated).")
+            time = timeparse.parse_duration(" ".join(arg_list)).timedelta
+        except timeparse.ParseError as error:
+            await ctx.send(f"Couldn't parse time at {error.pointer()}: {error}. "
+                           "Accepts `hours`, `minutes`, and `seconds` (can be abbreviated).")
             return
-        time = dt.timedelta(seconds=0)
-        # temp_number keeps track of value while units are parsed
-        temp_number = 0
-        # parse numbers and units
-        for item in arg_list:
-            if item.isnumeric():
-                temp_number = int(item)
-            elif item.isalpha():
-                if "hours ".startswith(item):
-                    time += dt.timedelta(hours=temp_number)
-                elif "minutes ".startswith(item):
-                    time += dt.timedelta(minutes=temp_number)
-                elif "seconds ".startswith(item):
-                    time += dt.timedelta(seconds=temp_number)
-                else:
-                    await ctx.send("Couldn't parse time; accepts `hours`, `minutes`, and `seconds` (can be abbreviated).")
-                    return
         if time >= dt.timedelta(hours=24):
             await ctx.send("Couldn't log a time >=24 hours.")
             return
         # get local date for user's timezone
-        with open(f"users/{ctx.author.id}.json", "r") as file:
-            user_json = json.load(file)
-        local_now = dt.datetime.utcnow() + dt.timedelta(hours=user_json["tz"])
-        local_date = dt.date(year=local_now.year, month=local_now.month, day=local_now.day)
-        # opening file
-        try:
-            with open(f"users/{ctx.author.id}.csv", "r") as file:
-                log_data = pd.read_csv(file, index_col=0)
-        except FileNotFoundError:
-            with open(f"users/{ctx.author.id}.csv", "w") as file:
-                print(f"File not found, creating logs for {ctx.author.id}.")
-                await ctx.send("First-time setting up logs!")
-                # turn time into a string, split it on space, and grab the last element
-                # to prevent formatting issues, like "0 days 0:00:00"
-                time = str(time).split()[-1]
-                # create new csv
-                log_data = pd.DataFrame({activity:time}, index=[local_date])
-                log_data.to_csv(file)
-                await ctx.send(f"Created new activity: `{activity}`. (1/10 slots used)")
-                await ctx.send(f"Logged `{activity}` for {time}.")
-                return
-        if activity not in log_data.iloc[0]:
-            if len(log_data.iloc[0]) >= 10:
+        user_json = await get_user(ctx.author.id)
+        local_date = local_now(user_json).date()
+        # load user's logs
+        log_data = await io_pool.run(store.load_log, ctx.author.id)
+        if log_data is None:
+            print(f"Logs not found, creating logs for {ctx.author.id}.")
+            await ctx.send("First-time setting up logs!")
+            # logging to a user with no log creates a new one
+            await change_log(store.log_time, ctx.author.id, local_date, activity, time.seconds)
+            await ctx.send(f"Created new activity: `{activity}`. (1/10 slots used)")
+            await ctx.send(f"Logged `{activity}` for {time}.")
+            return
+        if not log_data.has(activity):
+            if len(log_data.activities) >= 10:
                 await ctx.send(f"Couldn't create new activity for `{activity}`. (10/10 slots used)")
                 return
             else:
-                await ctx.send(f"Created new activity: `{activity}`. ({len(log_data.iloc[0])+1}/10 slots used)")
-        # add time already logged with time user logged just now
-        updated_time = time + util.get_timedelta(local_date, activity, log_data)
-        if updated_time >= dt.timedelta(hours=24):
-            updated_time = dt.timedelta(hours=23, minutes=59, seconds=59)
-        # turn updated time into a string, split it on space, and grab the last element
-        # to prevent formatting issues, like "0 days 0:00:00"
-        updated_time = str(updated_time).split()[-1]
-        # if already a row for today, put new time in that row
-        if str(local_date) in log_data.index:
-            log_data.loc[str(local_date), activity] = updated_time
-        # if not yet a row for today, make new row df and concat, so that new row is at top
-        else:
-            new_row = pd.DataFrame({activity:updated_time}, index=[local_date])
-            log_data = pd.concat([new_row, log_data])
-        # save/overwrite log csv
-        with open(f"users/{ctx.author.id}.csv", "w") as file:
-            log_data.to_csv(file)
+                await ctx.send(f"Created new activity: `{activity}`. ({len(log_data.activities)+1}/10 slots used)")
+        # add time user logged just now to the time already logged today
+        # this makes today's row if it doesn't exist yet, and caps the day just under 24 hours
+        await change_log(store.log_time, ctx.author.id, local_date, activity, time.seconds)
         await ctx.send(f"Logged `{activity}` for {time}.")
 
 @client.command()
+@user_mailboxes.serialized(command_author)
 async def delete(ctx, *, arg=None):
     """
     Command to delete logs, prompts, or breaks.
@@ -178,20 +267,17 @@ async def delete(ctx, *, arg=None):
                 await ctx.send("Usage: `delete log <activity>`")
                 return
             arg = arg_list.pop(0)
-            # open user's log file and read data
-            try:
-                with open(f"users/{ctx.author.id}.csv", "r") as file:
-                    log_data = pd.read_csv(file, index_col=0)
-            except FileNotFoundError:
+            # load user's logs
+            log_data = await io_pool.run(store.load_log, ctx.author.id)
+            if log_data is None:
                 await ctx.send("No logs found.")
                 return
             # check if the activity the user is trying to delete exists
-            if arg in log_data.iloc[0]:
-                # delete the entire column from the csv and save
-                log_data = log_data.drop(columns=arg)
-                with open(f"users/{ctx.author.id}.csv", "w") as file:
-                    log_data.to_csv(file)
-                await ctx.send(f"Deleted activity `{arg}`. ({len(log_data.iloc[0])}/10 slots used)")
+            if log_data.has(arg):
+                slots_used = len(log_data.activities) - 1
+                # delete the entire column from the log
+                await change_log(store.drop_activity, ctx.author.id, arg)
+                await ctx.send(f"Deleted activity `{arg}`. ({slots_used}/10 slots used)")
             else:
                 await ctx.send(f"Couldn't find activity `{arg}`.")
         # deleting prompt
@@ -201,24 +287,22 @@ async def delete(ctx, *, arg=None):
                 return
             arg = arg_list.pop(0)
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
-            # if user gives a valid time
-            if util.validate_time(arg):
-                # add a 0 to time if need, so format is "HH:MM"
-                if len(arg) < 5:
-                    arg = "0" + arg
+            user_json = await get_user(ctx.author.id)
             # if user gives a valid int, try to grab time of that index from json
-            elif arg.isnumeric():
+            if arg.isnumeric():
                 try:
                     arg = list(user_json["prompts"])[int(arg)-1]
                 except IndexError:
                     await ctx.send(f"Couldn't find prompt with index {arg}.")
                     return
-            # user didn't give a valid time or int
+            # otherwise it should be a time, in "HH:MM" format
             else:
-                await ctx.send("Couldn't parse argument as an index number or time.")
-                return
+                try:
+                    arg = timeparse.parse_clock(arg).text
+                # user didn't give a valid time or int
+                except timeparse.ParseError:
+                    await ctx.send("Couldn't parse argument as an index number or time.")
+                    return
             # try to pop user's given time, return if fail
             try:
                 user_json["prompts"].pop(arg)
@@ -226,26 +310,9 @@ async def delete(ctx, *, arg=None):
                 await ctx.send(f"Couldn't find a prompt scheduled at {arg}.")
                 return
             # save/overwrite user json
-            with open(f"users/{ctx.author.id}.json", "w") as file:
-                json.dump(user_json, file)
-            # get the hour of the given time in utc
-            utc_hour = (int(arg[:2]) - user_json["tz"]) % 24
-            # load hour json
-            with open(f"times/{utc_hour}.json", "r") as file:
-                hour_json = json.load(file)
-            # remove user's id from the minute list, deleting their timeslot
-            hour_json[arg[3:]].remove(ctx.author.id)
-            # if minute list is now empty, pop it
-            if len(hour_json[arg[3:]]) == 0:
-                hour_json.pop(arg[3:])
-            # if deleted time is in the current hour, update the prompt loop
-            if dt.datetime.utcnow().hour == utc_hour:
-                prompt_users.change_interval(time=util.populate_times(hour_json, utc_hour))
-                prompt_users.restart()
-                util.current_hour_json = hour_json
-            # save/overwrite hour json
-            with open(f"times/{utc_hour}.json", "w") as file:
-                json.dump(hour_json, file)
+            await put_user(ctx.author.id, user_json)
+            # remove user's id from the hour json, deleting their timeslot
+            await delete_prompt_from_hr(ctx.author.id, user_json, arg)
             await ctx.send(f"Deleted your daily {arg} prompt.")
         # deleting break
         elif "break ".startswith(delete_type):\
@@ -256,8 +323,7 @@ async def delete(ctx, *, arg=None):
             # rejoin args into a single string
             game_name = " ".join(arg_list)
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
+            user_json = await get_user(ctx.author.id)
             # can't delete default setting
             if game_name == "default":
                 await ctx.send("Can't delete default break setting. To disable breaks, use `schedule break` and set them to 0:00.")
@@ -265,8 +331,8 @@ async def delete(ctx, *, arg=None):
             # if game preference exists, delete it and save file
             elif game_name in user_json["breaks"]:
                 user_json["breaks"].pop(game_name)
-                with open(f"users/{ctx.author.id}.json", "w") as file:
-                    json.dump(user_json, file)
+                await put_user(ctx.author.id, user_json)
+                refresh_break_interval(ctx.author.id, user_json)
                 await ctx.send(f"Deleted break reminders for `{game_name}`. ({len(user_json['breaks'])-1}/10 slots used)"
                                f"\nIt will now use the default setting.")
             # game not found
@@ -277,6 +343,7 @@ async def delete(ctx, *, arg=None):
             await ctx.send("Usage: `delete <break, log, prompt> <args>`")
 
 @client.command()
+@user_mailboxes.serialized(command_author)
 async def merge(ctx, *, arg):
     """
     Command to merge 2 activity categories into 1.
@@ -284,11 +351,9 @@ async def merge(ctx, *, arg):
     if isinstance(ctx.channel, discord.channel.DMChannel) and ctx.author.id in util.registered_users:
         # split args into list and make them lowercase
         arg_list = arg.lower().split()
-        # open user's log file and read data
-        try:
-            with open(f"users/{ctx.author.id}.csv", "r") as file:
-                log_data = pd.read_csv(file, index_col=0)
-        except FileNotFoundError:
+        # load user's logs
+        log_data = await io_pool.run(store.load_log, ctx.author.id)
+        if log_data is None:
             await ctx.send("No logs found.")
             return
         # if not enough args, send usage
@@ -296,10 +361,10 @@ async def merge(ctx, *, arg):
             await ctx.send("Usage: `merge <activity1> <activity2> <new-activity>`")
             return
         # check if the given activities exist in the user's logs
-        if arg_list[0] not in log_data.iloc[0]:
+        if not log_data.has(arg_list[0]):
             await ctx.send(f"Couldn't find activity `{arg_list[0]}`.")
             return
-        if arg_list[1] not in log_data.iloc[0]:
+        if not log_data.has(arg_list[1]):
             await ctx.send(f"Couldn't find activity `{arg_list[1]}`.")
             return
         # check if the given activites are the same
@@ -307,29 +372,17 @@ async def merge(ctx, *, arg):
             await ctx.send(f"Can't merge an activity `{arg_list[0]}` with itself.")
             return
         # check if the new activity already exists, and doesn't match the first 2
-        if arg_list[2] in log_data.iloc[0] and arg_list[2] != arg_list[0] and arg_list[2] != arg_list[1]:
-            await ctx.send(f"Can't create new activity `{arg_list[3]}`; it already exists")
-        # list comprehension. i felt like a GOD after writing this.
-        # a filthy, pythonic god, but still.
-        # make a list of all timedeltas from the first activity arg
-        list_base = [util.get_timedelta(date, arg_list[0], log_data) for date in log_data.index]
-        # make a list of all timedeltas from the second activity arg
-        list_to_add = [util.get_timedelta(date, arg_list[1], log_data) for date in log_data.index]
-        # add the values of the second list into the first. should be impossible to have diff list lengths.
-        list_base = [list_base[i] + list_to_add[i] for i in range(len(list_base))]
-        # turn each time into a string, split it on space, and grab the last element
-        # to prevent formatting issues, like "0 days 0:00:00"
-        list_base = [str(time).split()[-1] for time in list_base]
-        # remove the old/just-got-merged columns from the log
-        log_data = log_data.drop(columns=[arg_list[0], arg_list[1]])
-        # slot the list values into a new column in the log, column title = third arg
+        if log_data.has(arg_list[2]) and arg_list[2] != arg_list[0] and arg_list[2] != arg_list[1]:
+            await ctx.send(f"Can't create new activity `{arg_list[2]}`; it already exists")
+            return
+        # add the two columns together day by day into a new column, column title = third arg
         # old columns are deleted first to allow columns to be merged into themselves (x + y -> x)
-        log_data[arg_list[2]] = list_base
-        with open(f"users/{ctx.author.id}.csv", "w") as file:
-            log_data.to_csv(file)
-        await ctx.send(f"Successfully merged activity categories `{arg_list[0]}` and `{arg_list[1]}` into `{arg_list[2]}`. ({len(log_data.iloc[0])}/10 slots used)")
+        slots_used = len(log_data.activities) - 1
+        await change_log(store.merge_activities, ctx.author.id, arg_list[0], arg_list[1], arg_list[2])
+        await ctx.send(f"Successfully merged activity categories `{arg_list[0]}` and `{arg_list[1]}` into `{arg_list[2]}`. ({slots_used}/10 slots used)")
 
 @client.command(name="list")
+@user_mailboxes.serialized(command_author)
 async def list_display(ctx, list_type=None, arg1=None):
     """
     Command for listing/displaying user's logs, prompts, and breaks settings/data.
@@ -343,35 +396,42 @@ async def list_display(ctx, list_type=None, arg1=None):
             return
         # listing logs
         elif "logs ".startswith(list_type):
-            # opening file
-            try:
-                with open(f"users/{ctx.author.id}.csv", "r") as file:
-                    log_data = pd.read_csv(file, index_col=0)
-            except FileNotFoundError:
-                await ctx.send("No logs found.")
-                return
-            # no arg1 = send all logs; arg1 if found = send specific log
-            if arg1 is None or arg1 in log_data.columns:
-                await ctx.send(util.display_log(log_data, arg1))
-            else:
-                await ctx.send(f"Couldn't find activity `{arg1}`.")
+            # this week and the last 7 days go by the user's local date, so that's part of the cache key
+            user_json = await get_user(ctx.author.id)
+            local_date = local_now(user_json).date()
+
+            async def render():
+                # load the summary saved with the user's logs, so listing doesn't read their whole history
+                log_data = await io_pool.run(store.load_summary, ctx.author.id)
+                if log_data is None:
+                    return "No logs found."
+                # no arg1 = send all logs; arg1 if found = send specific log
+                if arg1 is None or log_data.has(arg1):
+                    return await io_pool.compute(util.display_log, log_data, arg1, local_date)
+                return f"Couldn't find activity `{arg1}`."
+
+            await ctx.send(await response_cache.get(ctx.author.id, ("logs", arg1, local_date), render))
         # listing prompts
         elif "prompts ".startswith(list_type):
-            # opening file
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
+
+            async def render():
+                # load user json
+                return util.display_prompt(await get_user(ctx.author.id))
+
             # send prompts
-            await ctx.send(util.display_prompt(user_json))
+            await ctx.send(await response_cache.get(ctx.author.id, ("prompts",), render))
         # listing timezones
         elif "timezones ".startswith(list_type):
             await ctx.send(util.display_timezones())
         # listing breaks
         elif "breaks ".startswith(list_type):
-            # opening file
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
+
+            async def render():
+                # load user json
+                return util.display_breaks(await get_user(ctx.author.id))
+
             # send breaks
-            await ctx.send(util.display_breaks(user_json))
+            await ctx.send(await response_cache.get(ctx.author.id, ("breaks",), render))
         # list_type is some other word, send usage
         else:
             await ctx.send("Usage: `list <breaks, logs, prompts>`")
@@ -385,6 +445,7 @@ async def list_display(ctx, list_type=None, arg1=None):
             await ctx.send("Try `list timezones`.")
 
 @client.command()
+@user_mailboxes.serialized(command_author)
 async def schedule(ctx, *, arg=None):
     """
     Command to schedule a prompts and breaks.
@@ -405,53 +466,30 @@ async def schedule(ctx, *, arg=None):
                 return
             # grab new first arg, should be time
             time_arg = arg_list.pop(0)
-            # validate time_arg to continue parsing
-            if not util.validate_time(time_arg):
-                await ctx.send("Couldn't parse time; accepts `HH:MM` in 24-hour time.")
+            # validate time_arg and format it as "HH:MM" (8:45 -> 08:45) so all times are len(5)
+            try:
+                time_arg = timeparse.parse_clock(time_arg).text
+            except timeparse.ParseError as error:
+                await ctx.send(f"Couldn't parse time ({error}); accepts `HH:MM` in 24-hour time.")
                 return
-            # add a zero to the hour if need (8:45 -> 08:45) so all times are len(5)
-            if len(time_arg) < 5:
-                time_arg = "0" + time_arg
-            # grab ints out of time_arg
-            user_hour = int(time_arg[:2])
-            user_minute = int(time_arg[3:])
             # rejoin remaining args into a string, they are the prompt message content
             content = " ".join(arg_list)
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
+            user_json = await get_user(ctx.author.id)
             # notify user if a prompt was already scheduled at this time
             if time_arg in list(user_json["prompts"].keys()):
                 await ctx.send(f"Overwriting {time_arg} prompt.")
                 # set prompt time:content
                 user_json["prompts"][time_arg] = content
                 # save/overwrite user json
-                with open(f"users/{ctx.author.id}.json", "w") as file:
-                    json.dump(user_json, file)
+                await put_user(ctx.author.id, user_json)
             else:
                 # set prompt time:content
                 user_json["prompts"][time_arg] = content
                 # save/overwrite user json
-                with open(f"users/{ctx.author.id}.json", "w") as file:
-                    json.dump(user_json, file)
-                # use user's timezone to determine which utc hour json to edit
-                utc_hour = (user_hour - user_json["tz"]) % 24
-                # load hour json
-                with open(f"times/{utc_hour}.json", "r") as file:
-                    hour_json = json.load(file)
-                # if there are no prompts scheduled at this minute, make empty list
-                if time_arg[3:] not in hour_json.keys():
-                    hour_json[time_arg[3:]] = []
-                # append the user's id to the scheduled minute list
-                hour_json[time_arg[3:]].append(ctx.author.id)
-                # save/overwrite hour json
-                with open(f"times/{utc_hour}.json", "w") as file:
-                    json.dump(hour_json, file)
-                # if user just scheduled a time in the current hour, update the prompt loop with new times
-                if dt.datetime.utcnow().hour == utc_hour:
-                    prompt_users.change_interval(time=util.populate_times(hour_json, utc_hour))
-                    prompt_users.restart()
-                    util.current_hour_json = hour_json
+                await put_user(ctx.author.id, user_json)
+                # add the user's id to the hour json for this time
+                await schedule_prompt_to_hr(ctx.author.id, user_json, time_arg)
             await ctx.send(f"Scheduled prompt at {time_arg} daily.")
         # scheduling a break
         if "break ".startswith(sch_type):
@@ -461,33 +499,20 @@ async def schedule(ctx, *, arg=None):
                 return
             # turn arg_list lowercase
             arg_list = [x.lower() for x in arg_list]
-            # split alphabetical and numerical terms
+            # the time is at the end, and everything before it is the game name
             try:
-                alnum_arg_list = util.split_alpha_num(" ".join(arg_list))
-            except ValueError:
-                await ctx.send("Couldn't parse game name or time; can't accept special characters.")
-                return
-            # parse time, remaining_args are terms that were not parsed as time
-            remaining_args, time = util.parse_time_from_args(alnum_arg_list)
-            # if time returns as false, there was no parsable time in the arguments list
-            if time == False:
-                await ctx.send("Couldn't parse time; accepts `hours` and `minutes` (can be abbreviated).")
+                game_name, time = timeparse.split_duration(" ".join(arg_list))
+            except timeparse.ParseError as error:
+                await ctx.send(f"Couldn't parse time at {error.pointer()}: {error}. "
+                               "Accepts `hours` and `minutes` (can be abbreviated).")
                 return
-            # check HOW MANY of the remaining args match the full arg_list
-            # we do this because spaces could have been added by split_alpha_num
-            # ensures "game2" does not become "game 2"
-            for i in range(len(arg_list)):
-                if "".join(arg_list[:i]) in "".join(remaining_args):
-                    arg_counter = i
-            # finally, get the game name using the number we just calculated ^
-            game_name = " ".join(arg_list[:arg_counter])
+            time = time.timedelta
             # if no game name parsed, send usage
             if game_name == "":
                 await ctx.send("Usage: `schedule break <game> <time>`")
                 return
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
+            user_json = await get_user(ctx.author.id)
             # check slots used for breaks already, max 10 allowed not including default
             if len(user_json["breaks"]) >= 11 and game_name not in user_json["breaks"]:
                 await ctx.send(f"Couldn't schedule a new break time for `{game_name}`. (10/10 slots used)")
@@ -495,82 +520,65 @@ async def schedule(ctx, *, arg=None):
             # update user json, value is just stored as an int of minutes
             user_json["breaks"][game_name] = int(time.seconds / 60)
             # save/overwrite user json
-            with open(f"users/{ctx.author.id}.json", "w") as file:
-                json.dump(user_json, file)
+            await put_user(ctx.author.id, user_json)
+            refresh_break_interval(ctx.author.id, user_json)
             if game_name == "default":
                 await ctx.send(f"Updated default break reminders to every {time}.")
             else:
                 await ctx.send(f"Scheduled break reminders for `{game_name}` every {time}. ({len(user_json['breaks'])-1}/10 slots used)")
 
 @client.command()
+@user_mailboxes.serialized(command_author)
 async def timezone(ctx, arg=None):
     """
-    Command to set user's timezone.
+    Command to set user's timezone, as a UTC offset or an IANA zone name.
     Also usable by unregistered users, and completes their registration.
     """
     if isinstance(ctx.channel, discord.channel.DMChannel) and ctx.author.id in util.registered_users:
         # open user json
-        with open(f"users/{ctx.author.id}.json", "r") as file:
-            user_json = json.load(file)
+        user_json = await get_user(ctx.author.id)
         if not arg:
-            # localize current time to user
-            local_hour = (dt.datetime.utcnow().hour + user_json["tz"]) % 24
-            local_minute = dt.datetime.utcnow().minute
-            # format tz string
-            if user_json["tz"] >= 0:
-                tz_str = "+" + str(user_json["tz"])
-            else:
-                tz_str = str(user_json["tz"])
-            await ctx.send(f"Your current timezone is UTC**{tz_str}**. (now {local_hour}:{local_minute})")
-            await ctx.send("Use `timezone <offset>` to change it.")
+            await ctx.send(f"Your current timezone is {describe_timezone(user_json)}. (now {local_now(user_json):%H:%M})")
+            await ctx.send("Use `timezone <offset>` or `timezone <zone name>` to change it.")
             return
+        zone, offset = parse_timezone(arg)
         # check if arg is valid
-        elif util.validate_signed_num(arg) and int(arg) in range(-11, 15):
-            # delete prompts from hour jsons before tz gets updated
-            for time in list(user_json["prompts"].keys()):
-                delete_prompt_from_hr(ctx.author.id, user_json, time)
-            # update tz
-            user_json["tz"] = int(arg)
+        if offset is not None:
+            old_json = dict(user_json)
+            # update tz, and the zone whose transitions move the user's prompts from now on
+            set_zone(user_json, zone, offset)
             # save/overwrite user json
-            with open(f"users/{ctx.author.id}.json", "w") as file:
-                json.dump(user_json, file)
-            # reschedule prompts in correct hour jsons after tz gets updated
-            for time in list(user_json["prompts"].keys()):
-                schedule_prompt_to_hr(ctx.author.id, user_json, time)
-            # localize current time to user
-            local_hour = (dt.datetime.utcnow().hour + user_json["tz"]) % 24
-            local_minute = str(dt.datetime.utcnow().minute)
-            if len(local_minute) < 2:
-                local_minute = "0" + local_minute
-            # format tz string
-            if user_json["tz"] >= 0:
-                tz_str = "+" + str(user_json["tz"])
-            else:
-                tz_str = str(user_json["tz"])
-            await ctx.send(f"Updated your timezone to UTC**{tz_str}**. (now {local_hour}:{local_minute})")
+            await put_user(ctx.author.id, user_json)
+            # move every prompt to its minute at the new tz in one go
+            await reschedule_prompts(ctx.author.id, old_json, user_json)
+            await ctx.send(f"Updated your timezone to {describe_timezone(user_json)}. (now {local_now(user_json):%H:%M})")
             return
-        # arg was not a valid number
+        # arg was not a valid number or zone
         else:
-            await ctx.send("Couldn't parse number; accepts values from -11 to 14.")
+            await ctx.send("Couldn't parse timezone; accepts offsets from -11 to 14, or zone names like `Europe/Berlin`.")
             await ctx.send("Use `list timezone` to see current times.")
             return
     # if user is not registered yet
     elif isinstance(ctx.channel, discord.channel.DMChannel):
+        zone, offset = parse_timezone(arg) if arg else (None, None)
         if not arg:
-            utc_minute = dt.datetime.utcnow().minute
-            eastern_hour = (dt.datetime.utcnow().hour - 4) % 24
+            utc_minute = bot_clock.now().minute
+            eastern_hour = (bot_clock.now().hour - 4) % 24
             pacific_hour = (eastern_hour - 3) % 24
             await ctx.send("Your timezone is the number of hours **offset** you are from UTC time. For example:"
                            f"\nEastern time is **-4** hours (currently {eastern_hour}:{utc_minute})."
                            f"\nPacific time is **-7** hours (currently {pacific_hour}:{utc_minute})."
                            f"\n\n"
                            "Use `list timezone` to see all timezones, or"
-                           f"\nUse `timezone #` with your # of hours to set your timezone.")
+                           f"\nUse `timezone #` with your # of hours to set your timezone."
+                           f"\n\n"
+                           "To follow daylight saving time automatically, use your zone name instead, "
+                           "like `timezone America/New_York`.")
         # check if arg is valid
-        elif util.validate_signed_num(arg) and int(arg) in range(-11, 15):
+        elif offset is not None:
             # set tz and create default values
             user_json = {
-                "tz":int(arg),
+                "tz":offset,
                 "prompts":{
                     "20:00":"What's something you did today that you're proud of?"
                 },
@@ -578,31 +586,24 @@ async def timezone(ctx, arg=None):
                     "default":70
                 }
             }
+            set_zone(user_json, zone, offset)
             # create user file
-            with open(f"users/{ctx.author.id}.json", "w") as file:
-                json.dump(user_json, file)
+            await put_user(ctx.author.id, user_json)
             # put the default prompt into its hour json
-            schedule_prompt_to_hr(ctx.author.id, user_json, "20:00")
+            await reschedule_prompts(ctx.author.id, None, user_json)
             # add user to registry
-            util.registered_users.append(ctx.author.id)
-            # get local time
-            user_hour = (dt.datetime.utcnow().hour + user_json["tz"]) % 24
-            utc_minute = dt.datetime.utcnow().minute
-            # format tz string
-            if user_json["tz"] >= 0:
-                tz_str = "+" + str(user_json["tz"])
-            else:
-                tz_str = str(user_json["tz"])
-            await ctx.send(f"Set your timezone to UTC**{tz_str}**. (now {user_hour}:{utc_minute})")
+            await register_user(ctx.author.id)
+            await ctx.send(f"Set your timezone to {describe_timezone(user_json)}. (now {local_now(user_json):%H:%M})")
             await ctx.send("Setup complete! Don't forget `help` and `about` if you need info or get stuck. Enjoy using Cornbot!"
                            f"\n\n"
                            "*Not sure where to start? Try* `list prompts`*.*")
-        # arg was not a valid number
+        # arg was not a valid number or zone
         else:
-            await ctx.send("Couldn't parse number; accepts values from -11 to 14.")
+            await ctx.send("Couldn't parse timezone; accepts offsets from -11 to 14, or zone names like `Europe/Berlin`.")
             await ctx.send("Use `list timezone` to see current times.")
 
 @client.command()
+@user_mailboxes.serialized(command_author)
 async def reset(ctx, arg=None):
     """
     Command to reset logs, breaks, prompts, or all data.
@@ -613,50 +614,42 @@ async def reset(ctx, arg=None):
                            "\n**WARNING:** any reset data will be permanently erased!")
         elif arg == "all":
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
-            # delete user's scheduled prompts from hour jsons
-            for time in user_json["prompts"]:
-                delete_prompt_from_hr(ctx.author.id, user_json, time)
+            user_json = await get_user(ctx.author.id)
+            # delete user's scheduled prompts from hour jsons, and take them out of their zone
+            await reschedule_prompts(ctx.author.id, user_json, None)
             # delete user json
-            os.remove(f"users/{ctx.author.id}.json")
+            await io_pool.run(users.delete, ctx.author.id)
             # delete user logs, if they exist
-            if os.path.exists(f"users/{ctx.author.id}.csv"):
-                os.remove(f"users/{ctx.author.id}.csv")
-            # remove user from registered_users
-            util.registered_users.remove(ctx.author.id)
+            await change_log(store.delete_log, ctx.author.id)
+            # remove user from registry
+            await unregister_user(ctx.author.id)
+            break_tracker.stop_session(ctx.author.id)
             await ctx.send("All data deleted.\n\nIf you want to re-setup, say `timezone`.")
         elif arg =="breaks":
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
+            user_json = await get_user(ctx.author.id)
             # reset breaks to default
             user_json["breaks"] = {"default":70}
             # save/overwrite user json
-            with open(f"users/{ctx.author.id}.json", "w") as file:
-                json.dump(user_json, file)
+            await put_user(ctx.author.id, user_json)
+            refresh_break_interval(ctx.author.id, user_json)
             await ctx.send("All break reminder settings have been deleted/reset to default.")
         elif arg == "logs":
             # delete user logs, if they exist
-            if os.path.exists(f"users/{ctx.author.id}.csv"):
-                os.remove(f"users/{ctx.author.id}.csv")
+            if await change_log(store.delete_log, ctx.author.id):
                 await ctx.send("All logs have been deleted.")
             else:
                 await ctx.send("No logs found.")
         elif arg == "prompts":
             # load user json
-            with open(f"users/{ctx.author.id}.json", "r") as file:
-                user_json = json.load(file)
-            # delete user's schedule prompts from hour jsons
-            for time in user_json["prompts"]:
-                delete_prompt_from_hr(ctx.author.id, user_json, time)
+            user_json = await get_user(ctx.author.id)
+            old_json = dict(user_json)
             # reset prompts to default
             user_json["prompts"] = {"20:00":"What's something you did today that you're proud of?"}
-            # schedule newly reset prompt to hour json
-            schedule_prompt_to_hr(ctx.author.id, user_json, "20:00")
             # save/overwrite user json
-            with open(f"users/{ctx.author.id}.json", "w") as file:
-                json.dump(user_json, file)
+            await put_user(ctx.author.id, user_json)
+            # swap the old prompts for the default one in the hour jsons, in one go
+            await reschedule_prompts(ctx.author.id, old_json, user_json)
             await ctx.send("All prompt data has reset to default.")
         # arg was something else, send usage
         else:
@@ -685,144 +678,693 @@ async def respond(ctx):
 
 #################### FUNCTIONS ####################
 
-def schedule_prompt_to_hr(user_id: int, user_json: dict, arg: str):
+def load_state():
+    """
+    Loads everything the bot needs in memory before it connects.
+    The journal is replayed first, then the registry index is read on a worker thread
+    while the hour jsons are loaded into the prompt scheduler, since neither needs the other.
+    """
+    global catch_up_since
+    # replay anything the last run journaled but didn't get to write
+    replayed = timed("journal recovery", store.recover)
+    if replayed > 0:
+        print(f"Recovered {replayed} journaled changes from the last run.")
+    # prompts still queued from the last run are sent once the loops start, unless they're too old;
+    # so are the minutes that came due while it was down, back to CATCH_UP_MINUTES ago
+    window_start = bot_clock.now().replace(second=0, microsecond=0) - dt.timedelta(minutes=CATCH_UP_MINUTES)
+    expired = prompt_outbox.expire(window_start)
+    fired_through = prompt_outbox.fired_through()
+    if fired_through is not None:
+        catch_up_since = max(fired_through, window_start)
+    if prompt_outbox.pending or expired:
+        print(f"Outbox has {prompt_outbox.pending} prompts from the last run; dropped {expired} older ones.")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        registry_found = executor.submit(timed, "registry load", util.registered_users.load, REGISTRY_PATH)
+        timed("zone index load", zone_index.load, ZONES_PATH)
+        hours = timed("hour json load", store.load_hours)
+        began = time.perf_counter()
+        for hr, hour_json in hours.items():
+            if shared is not None:
+                # each worker only schedules its own users' prompts
+                hour_json = {minute:[user_id for user_id in user_ids if shared.owns(user_id)] for minute, user_ids in hour_json.items()}
+            prompt_scheduler.load(hr, hour_json)
+        startup_phases.append(("scheduler build", time.perf_counter() - began))
+        if SHARD_ID == sharding.COMMAND_SHARD:
+            # built now instead of on the first command that reschedules prompts
+            timed("reverse index build", store.slot_index)
+        if store.duplicate_entries:
+            # sets drop them as the hour jsons load; they're gone from storage once their hours are next written
+            print(f"Dropped {store.duplicate_entries} duplicate hour json entries.")
+        # build the index from storage the first time
+        if not registry_found.result():
+            timed("registry rebuild", util.registered_users.rebuild, store.list_users())
+    if SHARD_ID != sharding.COMMAND_SHARD:
+        # worker 0 keeps the index files; the others follow its changes in memory
+        util.registered_users.path = None
+        zone_index.path = None
+
+def timed(name: str, function, *args):
+    """
+    Calls FUNCTION(*ARGS), adds how long it took to startup_phases as NAME, and returns its result.
+    """
+    began = time.perf_counter()
+    result = function(*args)
+    startup_phases.append((name, time.perf_counter() - began))
+    return result
+
+def print_startup_report():
+    """
+    Prints how long each startup phase took. Phases that ran in parallel overlap,
+    so time to ready is measured from the first import instead of adding them up.
+    """
+    gateway = dict(startup_phases).get("gateway connect", 0)
+    print("Startup report:")
+    for name, seconds in startup_phases:
+        print(f"  {name:<26}{seconds * 1000:>9.1f} ms")
+    print(f"  {'time to ready':<26}{(time.perf_counter() - STARTUP_BEGAN - gateway) * 1000:>9.1f} ms (excluding gateway connect)")
+
+async def get_user(user_id: int):
+    """
+    Loads a user json on the I/O thread. Returns a copy, so a command can change it
+    while the I/O thread might be writing out the cached one, then hand it back with put_user().
+    """
+    return await io_pool.run(lambda: copy.deepcopy(users.get(user_id)))
+
+async def put_user(user_id: int, user_json: dict):
+    """
+    Stores a changed user json in the cache, on the I/O thread.
+    """
+    await io_pool.run(users.put, user_id, user_json)
+    response_cache.bump(user_id)
+    if not owns_user(user_id):
+        # the owner sends prompts and break reminders from its own cached copy
+        await tell_owner("user", user_id, user_json)
+
+async def change_log(function, user_id: int, *args):
+    """
+    Runs a store method that changes a user's log, like store.log_time, on the I/O thread. Returns its result.
+    """
+    result = await io_pool.run(function, user_id, *args)
+    response_cache.bump(user_id)
+    return result
+
+async def register_user(user_id: int):
+    """
+    Adds a user to the registry, on every worker.
+    """
+    await io_pool.run(util.registered_users.add, user_id)
+    if shared is not None:
+        await io_pool.run(shared.broadcast, "register", user_id)
+
+async def unregister_user(user_id: int):
+    """
+    Removes a user from the registry, on every worker.
+    """
+    await io_pool.run(util.registered_users.remove, user_id)
+    if shared is not None:
+        await io_pool.run(shared.broadcast, "unregister", user_id)
+
+def owns_user(user_id: int):
+    """
+    Returns True if this worker sends the user's prompts and break reminders. Always True in one process.
+    """
+    return shared is None or shared.owns(user_id)
+
+async def tell_owner(kind: str, user_id: int, body=None):
+    """
+    Queues a change for the worker that owns USER_ID; apply_shard_message() applies it there.
+    """
+    await io_pool.run(shared.post, shared.owner(user_id), kind, user_id, body)
+
+def parse_timezone(arg: str):
+    """
+    Returns (zone name, offset in hours) for a `timezone` argument: a whole-hour offset from -11 to 14
+    (with no zone), or an IANA zone name like "Europe/Berlin". Returns (None, None) if it's neither.
+    """
+    if util.validate_signed_num(arg) and int(arg) in range(-11, 15):
+        return None, int(arg)
+    zone = zones.lookup(arg)
+    if zone is None:
+        return None, None
+    return zone, zone_index.offset(zone)
+
+def set_zone(user_json: dict, zone: str, offset):
+    """
+    Sets a user's offset and zone (None for a fixed offset) in USER_JSON.
+    reschedule_prompts() moves them between zones in zone_index, along with their prompts.
+    """
+    user_json["tz"] = offset
+    if zone is None:
+        user_json.pop("zone", None)
+    else:
+        user_json["zone"] = zone
+
+def describe_timezone(user_json: dict):
+    """
+    Returns a user's timezone the way messages show it: "UTC**+2**", or "**Europe/Berlin** (UTC+2)".
+    """
+    offset = zones.format_offset(zone_index.offset_for(user_json))
+    if "zone" in user_json:
+        return f"**{user_json['zone']}** (UTC{offset})"
+    return f"UTC**{offset}**"
+
+def local_now(user_json: dict):
+    """
+    Returns the current time in a user's timezone.
+    """
+    return bot_clock.now() + dt.timedelta(hours=zone_index.offset_for(user_json))
+
+async def schedule_prompt_to_hr(user_id: int, user_json: dict, arg: str):
     """
     Schedules a prompt to its correct hour json. Not a command, just for internal use.
     Basically a stripped down version of schedule() that doesn't send messages.
     """
-    # use user's timezone to determine which utc hour json to edit
-    utc_hour = (int(arg[:2]) - user_json["tz"]) % 24
-    # load hour json
-    with open(f"times/{utc_hour}.json", "r") as file:
-        hour_json = json.load(file)
-    # if there are no prompts scheduled at this minute, make empty list
-    if arg[3:] not in hour_json.keys():
-        hour_json[arg[3:]] = []
-    # append the user's id to the scheduled minute list
-    hour_json[arg[3:]].append(user_id)
-    # save/overwrite hour json
-    with open(f"times/{utc_hour}.json", "w") as file:
-        json.dump(hour_json, file)
-    # if user just scheduled a time in the current hour, update the prompt loop with new times
-    if dt.datetime.utcnow().hour == utc_hour:
-        prompt_users.change_interval(time=util.populate_times(hour_json, utc_hour))
-        prompt_users.restart()
-        util.current_hour_json = hour_json
-
-def delete_prompt_from_hr(user_id: int, user_json: dict, arg: str):
+    async def add():
+        # use user's timezone to determine which utc minute to schedule in
+        # worked out here, after any zone transition queued ahead of this one has moved the user's other prompts
+        slot = zones.utc_slot(arg, zone_index.offset_for(user_json))
+        # append the user's id to the scheduled minute list
+        await io_pool.run(store.add_to_hour, slot // 60, f"{slot % 60:02}", user_id)
+        # and to the prompt scheduler's bucket for that minute, on whichever worker sends their prompts
+        if owns_user(user_id):
+            prompt_scheduler.add(slot, user_id)
+        else:
+            await tell_owner("prompt_add", user_id, {"slot":slot})
+
+    # hour jsons are shared by every user, so only hour_owner changes them
+    await hour_owner.call(add)
+
+async def delete_prompt_from_hr(user_id: int, user_json: dict, arg: str):
     """
     Deletes a prompt from its hour json. Not a command, just for internal use.
     Basically a stripped down version of delete() that doesn't send messages.
     """
-    # get the hour of the given time in utc
-    utc_hour = (int(arg[:2]) - user_json["tz"]) % 24
-    # load hour json
-    with open(f"times/{utc_hour}.json", "r") as file:
-        hour_json = json.load(file)
-    # remove user's id from the minute list, deleting their timeslot
-    hour_json[arg[3:]].remove(user_id)
-    # if minute list is now empty, pop it
-    if len(hour_json[arg[3:]]) == 0:
-        hour_json.pop(arg[3:])
-    # if deleted time is in the current hour, update the prompt loop
-    if dt.datetime.utcnow().hour == utc_hour:
-        prompt_users.change_interval(time=util.populate_times(hour_json, utc_hour))
-        prompt_users.restart()
-        util.current_hour_json = hour_json
-    # save/overwrite hour json
-    with open(f"times/{utc_hour}.json", "w") as file:
-        json.dump(hour_json, file)
+    async def remove():
+        # get the minute of the given time in utc
+        slot = zones.utc_slot(arg, zone_index.offset_for(user_json))
+        # remove user's id from the minute list, deleting their timeslot
+        await io_pool.run(store.remove_from_hour, slot // 60, f"{slot % 60:02}", user_id)
+        if owns_user(user_id):
+            prompt_scheduler.remove(slot, user_id)
+        else:
+            await tell_owner("prompt_remove", user_id, {"slot":slot})
+
+    await hour_owner.call(remove)
+
+async def reschedule_prompts(user_id: int, old_json: dict, new_json: dict):
+    """
+    Moves all of a user's prompts from the minutes the hour jsons have them in to the ones NEW_JSON puts them in,
+    as one change to the hour jsons (each changed hour written once) and one to the prompt scheduler,
+    and moves the user between zones in zone_index if their zone changed from OLD_JSON's.
+    Either json may be None: not registered yet, or no longer (reset all).
+    """
+    def slots(user_json: dict):
+        if user_json is None:
+            return set()
+        offset = zone_index.offset_for(user_json)
+        return {zones.utc_slot(time, offset) for time in user_json["prompts"]}
+
+    async def move():
+        # the minutes the hour jsons actually have the user in, from the reverse index, so anything left over
+        # from an earlier failure is cleared out too; taken after any zone transition queued ahead of this one
+        old_slots = set(await io_pool.run(store.slots_of, user_id))
+        # worked out before the user leaves their zone, which forgets its offset if they were the last in it
+        strays = old_slots ^ slots(old_json)
+        if strays:
+            print(f"Fixed {len(strays)} hour json entries for {user_id} that didn't match their prompts.")
+        old_zone = old_json.get("zone") if old_json else None
+        new_zone = new_json.get("zone") if new_json else None
+        if new_zone != old_zone:
+            if new_zone is None:
+                await io_pool.run(zone_index.remove, user_id)
+            elif await io_pool.run(zone_index.add, user_id, new_zone, bot_clock.now()):
+                # a zone nobody had might change offset before the one run_zone_transitions() is waiting for
+                zone_wakeup.set()
+        new_slots = slots(new_json)
+        # prompts that land in the same utc minute either way stay put
+        moves = ([(user_id, slot, None) for slot in sorted(old_slots - new_slots)]
+                 + [(user_id, None, slot) for slot in sorted(new_slots - old_slots)])
+        if not moves:
+            return
+        await io_pool.run(store.move_in_hours, moves)
+        if owns_user(user_id):
+            prompt_scheduler.move(moves)
+        else:
+            await tell_owner("prompt_moves", user_id, {"moves":moves})
 
+    # hour jsons are shared by every user, so only hour_owner changes them
+    await hour_owner.call(move)
 
-#################### LOOPS ####################
+def get_break_interval(user_json: dict, game_name: str):
+    """
+    Returns a timedelta of how often a user wants break reminders while playing a game.
+    """
+    # if the user has a preference for the current game, use it
+    if game_name.lower() in user_json["breaks"]:
+        return dt.timedelta(minutes=user_json["breaks"][game_name.lower()])
+    # if no preference, just use their default value
+    else:
+        return dt.timedelta(minutes=user_json["breaks"]["default"])
+
+async def update_break_session(member):
+    """
+    Starts, replaces, or stops a member's game session to match their current activity.
+    Presence for a user another worker owns is passed on to that worker.
+    """
+    # grab the current game the user is playing, if it exists
+    game = None
+    for activity in member.activities:
+        # if isinstance(activity, discord.Game):
+        game = activity
+    game_name = game.name if game else None
+    started = getattr(game, "start", None)
+    if started is not None and started.tzinfo is not None:
+        started = started.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    if not owns_user(member.id):
+        await tell_owner("presence", member.id, {"game":game_name, "started":started.isoformat() if started else None})
+        return
+    await set_break_session(member.id, game_name, started)
 
-@tasks.loop()
-async def prompt_users():
+async def set_break_session(user_id: int, game_name: str, started: dt.datetime):
     """
-    Sends users their prompts when they are scheduled.
-    Uses a list of times to determine when to run.
-    Uses util.current_hour_json to fetch user id's.
+    Starts, replaces, or stops a user's game session.
+    GAME_NAME is None when they aren't playing anything, and STARTED is None when Discord didn't say.
     """
-    # do not run at 0:00:13, which indicates no times this hour
-    if prompt_users.time[0].second == 13:
+    if game_name is None:
+        break_tracker.stop_session(user_id)
         return
-    # grab the minute int for the current time and make it a string format "MM"
-    utcnow_mins = str(dt.datetime.utcnow().minute)
-    if len(utcnow_mins) < 2:
-        utcnow_mins = "0" + utcnow_mins
-    # look in current_hour_json for list of users who have a prompt at this minute
-    for user_id_ in util.current_hour_json[utcnow_mins]:
-        # load user json
-        with open(f"users/{user_id_}.json", "r") as file:
-            user_json = json.load(file)
-            # adjust current hour to user's timezone
-            user_tz = user_json["tz"]
-            hour_to_user = str((dt.datetime.utcnow().hour + user_tz) % 24)
-            # add a 0 to hour if need, so format is "HH"
-            if len(hour_to_user) < 2:
-                hour_to_user = "0" + hour_to_user
-            time_to_user = f"{hour_to_user}:{utcnow_mins}"
-        # fetch user id and send them prompt contents from their json
-        user = await client.fetch_user(user_id_)
-        await user.send(user_json["prompts"][time_to_user])
-
-@tasks.loop(time=HOURLY_UPDATE_TIMES)
+    # activities without a start time are treated as starting when they were first seen
+    if started is None:
+        if break_tracker.current_game(user_id) == game_name:
+            return
+        started = bot_clock.now()
+    user_json = await io_pool.run(users.get, user_id)
+    break_tracker.start_session(user_id, game_name, started, get_break_interval(user_json, game_name))
+
+def refresh_break_interval(user_id: int, user_json: dict):
+    """
+    Applies changed break preferences to a user's current game session, if they're in one.
+    """
+    game_name = break_tracker.current_game(user_id)
+    if game_name is not None:
+        break_tracker.set_interval(user_id, get_break_interval(user_json, game_name))
+
+
+#################### LOOPS ####################
+
+@bot_metrics.instrument("loop")
+async def prompt_users(due: dt.datetime, user_ids: list):
+    """
+    Queues users' prompts in the outbox when they're due, for run_outbox() to send.
+    Called by prompt_scheduler at the start of every minute that has prompts,
+    and for minutes missed while the bot was down.
+    """
+    messages = []
+    # load every user json in one trip to the I/O thread
+    user_jsons = await io_pool.run(lambda: [users.get(user_id_) for user_id_ in user_ids])
+    for user_id_, user_json in zip(user_ids, user_jsons):
+        if user_json is None:
+            # reset all a moment ago; their prompts are on their way out of the scheduler
+            continue
+        time_to_user = zones.local_time(due, zone_index.offset_for(user_json))
+        # a prompt moved or deleted since this minute came due is skipped instead of failing everyone after it
+        if time_to_user in user_json["prompts"]:
+            messages.append((user_id_, user_json["prompts"][time_to_user]))
+
+    def queue():
+        # one commit for the whole minute, which also records it as fired
+        prompt_outbox.add(due, messages)
+        if shared is not None:
+            # claimed only once they're queued, so a crash in between sends them twice instead of never;
+            # anyone whose prompt for this minute already went out, say from a worker that owned them before
+            # a restart, is taken back out before run_outbox() can see it, since both run on the I/O thread
+            claimed = set(shared.claim([user_id_ for user_id_, _ in messages], due.isoformat()))
+            prompt_outbox.remove(due, [user_id_ for user_id_, _ in messages if user_id_ not in claimed])
+
+    await io_pool.run(queue)
+    outbox_wakeup.set()
+
+async def run_outbox():
+    """
+    Sends queued prompts as soon as they're due or ready to retry, a batch at a time.
+    """
+    while True:
+        outbox_wakeup.clear()
+        try:
+            if await send_outbox_batch() == OUTBOX_BATCH:
+                # probably more ready; let anything else waiting on the loop run first
+                await asyncio.sleep(0)
+                continue
+            next_attempt = await io_pool.run(prompt_outbox.next_attempt)
+        except Exception:
+            traceback.print_exc()
+            next_attempt = bot_clock.now() + dt.timedelta(seconds=OUTBOX_RETRY_SECONDS)
+        if next_attempt is None:
+            await outbox_wakeup.wait()
+        else:
+            await bot_clock.sleep_until(next_attempt, outbox_wakeup)
+
+@bot_metrics.instrument("loop")
+async def send_outbox_batch():
+    """
+    Sends up to OUTBOX_BATCH queued prompts that are ready, newest first, through prompt_fanout,
+    then removes the ones that went out and schedules retries of the rest. Returns how many it took.
+    """
+    batch = await io_pool.run(prompt_outbox.take, bot_clock.now(), OUTBOX_BATCH)
+    # grouped by the minute they were due, so delivery lag is still tracked per minute
+    by_due = {}
+    for row_id, user_id, due, content in batch:
+        by_due.setdefault(due, []).append((row_id, user_id, content))
+    # send them all at once through cached DM channels; a failed send doesn't stop the rest
+    results = await asyncio.gather(*[prompt_fanout.send_all(due, [(user_id, content) for _, user_id, content in rows])
+                                     for due, rows in by_due.items()])
+    sent = []
+    failed = []
+    for (due, rows), stats in zip(by_due.items(), results):
+        failed_ids = set(stats.pop("failed_ids"))
+        for row_id, user_id, _ in rows:
+            (failed if user_id in failed_ids else sent).append(row_id)
+        if stats["failed"] > 0 or (stats["max"] or 0) > 30:
+            print(f"Prompts for {due:%H:%M}: {stats}")
+    dropped = await io_pool.run(prompt_outbox.finish, sent, failed, bot_clock.now())
+    if dropped:
+        print(f"Gave up on {dropped} prompts after {OUTBOX_MAX_ATTEMPTS} attempts.")
+    return len(batch)
+
+prompt_scheduler = scheduler.PromptScheduler(prompt_users)
+prompt_fanout = fanout.PromptFanout(client, PROMPT_CONCURRENCY)
+
+@bot_metrics.instrument("loop")
 async def hourly_update():
     """
-    Runs every hour using HOURLY_UPDATE_TIMES.
-    Updates util.current_hour_json to current time.
-    Refreshes prompt_users to the new times.
+    Runs at the start of every hour on bot_clock.
+    Prints cache and scheduler stats.
     """
-    utcnow_hour = dt.datetime.utcnow().hour
-    with open(f"times/{utcnow_hour}.json", "r") as file:
-        hour_json = json.load(file)
-        prompt_users.change_interval(time=util.populate_times(hour_json, utcnow_hour))
-        prompt_users.restart()
-        util.current_hour_json = hour_json
+    print(f"User cache: {users.stats()}")
+    print(f"Response cache: {response_cache.stats()}")
+    if shared is not None:
+        print(f"Shard: {shared.stats()}")
+        # prompts sent over a day ago can't be due again
+        await io_pool.run(shared.prune, 2 * 24 * 60 * 60)
+    print(f"Scheduled prompts: {prompt_scheduler.count()}")
+    # prompts that kept failing past the catch-up window aren't worth sending any more
+    await io_pool.run(prompt_outbox.expire, bot_clock.now() - dt.timedelta(minutes=CATCH_UP_MINUTES))
+    print(f"Outbox: {prompt_outbox.stats()}")
+    if prompt_fanout.lag_history:
+        print(f"Last prompt delivery: {prompt_fanout.lag_history[-1]}")
 
-@tasks.loop(minutes=1)
-async def break_check():
+async def run_hourly_updates():
     """
-    Runs every minute. Checks the activity status of every registered member
-    and sends them their break reminders when it's time.
+    Calls hourly_update() at the start of every hour. Waits on bot_clock instead of
+    using tasks.loop, which always waits on wall-clock time.
     """
-    # all members that the bot can see
-    for member in client.get_all_members():
-        # if user is registered
-        if member.id in util.registered_users:
-            # grab the current game the user is playing, if it exists
-            game = None
-            for activity in member.activities:
-                # if isinstance(activity, discord.Game):
-                game = activity
-            if not game:
-                pass
-            # if game does exist
-            else:
-                # load user json to find out when next reminder should be
-                with open(f"users/{member.id}.json", "r") as file:
-                    user_json = json.load(file)
-                # if the user has a preference for the current game, use it
-                if game.name.lower() in user_json["breaks"]:
-                    break_pref = dt.timedelta(minutes=user_json["breaks"][game.name.lower()])
-                # if no preference, just use their default value
-                else:
-                    break_pref = dt.timedelta(minutes=user_json["breaks"]["default"])
-                # elapsed_time = how much time has passed since user started playing game (0:02 = 5:32 - 5:30)
-                elapsed_time = dt.datetime.utcnow - game.start
-                # elapsed % pref = how much time since last reminder should have happened
-                # this allows reminders to reoccur at their correct interval (instead of happening once)
-                # here we check if the modulus is <1 min, which should catch everything
-                # since function runs every 1 min (and negative elapsed shouldn't be possible)
-                if elapsed_time % break_pref < dt.timedelta(minutes=1):
-                    await member.send("Time for a break? If you need,\n"
-                                "- Get some food\n"
-                                "- Get some water\n"
-                                "- Stretch or move around! :)")
-                else:
-                    pass
-
-
-
-# GOOOOO!
-client.run('TOKEN_HERE')
+    while True:
+        next_hour = bot_clock.now().replace(minute=0, second=0, microsecond=0) + dt.timedelta(hours=1)
+        await bot_clock.sleep_until(next_hour)
+        try:
+            await hourly_update()
+        except Exception:
+            traceback.print_exc()
+
+@bot_metrics.instrument("loop")
+async def apply_retention():
+    """
+    Rolls up old rows in every registered user's log, a batch of users at a time.
+    Runs once a day on bot_clock.
+    """
+    today = bot_clock.now().date()
+    user_ids = list(util.registered_users)
+    rolled = 0
+
+    async def roll_up(user_id: int):
+        # runs in the user's mailbox, so no command reads their log while the I/O thread rewrites it
+        if not await io_pool.run(store.roll_up_log, user_id, today, RETENTION_DAILY_DAYS, RETENTION_WEEKLY_DAYS):
+            return False
+        # "list logs <activity>" shows the newest daily rows, and a user with few recent ones can lose some to the roll-up
+        response_cache.bump(user_id)
+        return True
+
+    for start in range(0, len(user_ids), RETENTION_BATCH_USERS):
+        batch = user_ids[start:start + RETENTION_BATCH_USERS]
+        rolled += sum(await asyncio.gather(*(user_mailboxes.call(user_id, roll_up, user_id) for user_id in batch)))
+    print(f"Retention: rolled up old rows in {rolled} of {len(user_ids)} logs.")
+
+async def run_retention():
+    """
+    Calls apply_retention() once at startup and then at the start of every day on bot_clock.
+    """
+    while True:
+        try:
+            await apply_retention()
+        except Exception:
+            traceback.print_exc()
+        tomorrow = bot_clock.now().replace(hour=0, minute=0, second=0, microsecond=0) + dt.timedelta(days=1)
+        await bot_clock.sleep_until(tomorrow)
+
+async def run_shard_inbox():
+    """
+    Applies the changes other workers queued for this one, every SHARD_POLL_SECONDS.
+    """
+    while True:
+        try:
+            for kind, user_id, body in await io_pool.run(shared.receive):
+                await apply_shard_message(kind, user_id, body)
+        except Exception:
+            traceback.print_exc()
+        await asyncio.sleep(SHARD_POLL_SECONDS)
+
+async def apply_shard_message(kind: str, user_id: int, body):
+    """
+    Applies one change queued by another worker, in the order that worker made them.
+    """
+    if kind == "prompt_add":
+        prompt_scheduler.add(body["slot"], user_id)
+    elif kind == "prompt_remove":
+        prompt_scheduler.remove(body["slot"], user_id)
+    elif kind == "prompt_moves":
+        prompt_scheduler.move(body["moves"])
+    elif kind == "user":
+        # worker 0 already stored it; this copy is what prompts and break reminders are sent from
+        await io_pool.run(users.refresh, user_id, body)
+        refresh_break_interval(user_id, body)
+    elif kind == "presence":
+        await set_break_session(user_id, body["game"], dt.datetime.fromisoformat(body["started"]) if body["started"] else None)
+    elif kind == "register":
+        util.registered_users.add(user_id)
+    elif kind == "zones":
+        # worker 0 already moved the hour jsons; move the scheduled prompts of the users this worker owns
+        zone_index.offsets.update(body["offsets"])
+        prompt_scheduler.move([(user_id_, old, new) for user_id_, old, new in body["moves"] if owns_user(user_id_)])
+    elif kind == "unregister":
+        util.registered_users.remove(user_id)
+        break_tracker.stop_session(user_id)
+        await io_pool.run(users.forget, user_id)
+
+async def run_zone_transitions():
+    """
+    Moves the prompts of every user in a zone whose UTC offset is about to change, ZONE_MOVE_EARLY_SECONDS before it does.
+    Sleeps until the next transition of any zone in use, found from the transitions zone_index worked out ahead of time,
+    or until a user picks a zone nobody else had.
+    """
+    early = dt.timedelta(seconds=ZONE_MOVE_EARLY_SECONDS)
+    while True:
+        try:
+            # on the I/O thread, which is where zone_index changes; working out a zone's transitions also takes a while
+            change = await io_pool.run(zone_index.next_change, bot_clock.now() + early)
+            if change is None:
+                # nothing within the horizon; look again tomorrow, when the horizon has moved on
+                await bot_clock.sleep_until(bot_clock.now() + dt.timedelta(days=1), zone_wakeup)
+                continue
+            when, offsets = change
+            if await bot_clock.sleep_until(when - early, zone_wakeup):
+                # woken by a new zone, which might change sooner
+                continue
+            await apply_zone_transition(offsets)
+        except Exception:
+            traceback.print_exc()
+            # try again in a minute instead of straight away
+            await bot_clock.sleep_until(bot_clock.now() + dt.timedelta(minutes=1))
+
+@bot_metrics.instrument("loop")
+async def apply_zone_transition(offsets: dict):
+    """
+    Moves every prompt of every user in the zones in OFFSETS ({zone: new offset in hours}) to its new UTC minute,
+    as one bulk change to the hour jsons and one to the prompt scheduler. User jsons aren't touched.
+    Returns how many prompts moved.
+    """
+    def plan():
+        # minutes each user's prompts move back by
+        shifts = {}
+        for zone, offset in offsets.items():
+            shift = round((offset - zone_index.offset(zone)) * 60)
+            shifts.update(dict.fromkeys(zone_index.members.get(zone, ()), shift))
+        # going by the hour jsons instead of the user jsons moves exactly what's scheduled,
+        # including prompts added or deleted a moment ago
+        moves = []
+        for hr, hour_json in store.load_hours().items():
+            for minute, user_ids in hour_json.items():
+                old = scheduler.slot(hr, int(minute))
+                moves += [(user_id, old, (old - shifts[user_id]) % scheduler.MINUTES_PER_DAY)
+                          for user_id in user_ids if user_id in shifts]
+        store.move_in_hours(moves)
+        return moves
+
+    async def move():
+        moves = await io_pool.run(plan)
+        # the scheduler and the offsets prompts are sent at change together, between two minutes firing
+        prompt_scheduler.move([(user_id, old, new) for user_id, old, new in moves if owns_user(user_id)])
+
+        def set_offsets():
+            zone_index.set_offsets(offsets)
+            zone_index.save()
+
+        await io_pool.run(set_offsets)
+        if shared is not None:
+            await io_pool.run(shared.broadcast, "zones", 0, {"offsets":offsets, "moves":moves})
+        return moves
+
+    # hour jsons are shared by every user, so only hour_owner changes them
+    moves = await hour_owner.call(move)
+    print(f"Moved {len(moves)} prompts for "
+          + ", ".join(f"{zone} (now UTC{zones.format_offset(offset)})" for zone, offset in offsets.items()) + ".")
+    return len(moves)
+
+hourly_task = None
+retention_task = None
+inbox_task = None
+zone_task = None
+outbox_task = None
+metrics_tasks = []
+
+def start_loops():
+    """
+    Starts the prompt scheduler and outbox, hourly updates, retention, zone transitions, break reminders, flushing,
+    and checking for changes from other workers.
+    Safe to call again on reconnect; anything already running is left alone.
+    """
+    global hourly_task, retention_task, inbox_task, zone_task, outbox_task, catch_up_since
+    # fires the minutes missed while the bot was down first, only the first time
+    prompt_scheduler.start(catch_up_since)
+    catch_up_since = None
+    if outbox_task is None or outbox_task.done():
+        outbox_task = asyncio.get_event_loop().create_task(run_outbox())
+    if METRICS_ENABLED and not metrics_tasks:
+        if METRICS_PORT:
+            metrics_tasks.append(asyncio.get_event_loop().create_task(bot_metrics.serve("127.0.0.1", METRICS_PORT)))
+        if METRICS_DUMP_PATH:
+            metrics_tasks.append(asyncio.get_event_loop().create_task(bot_metrics.dump_every(METRICS_DUMP_PATH, METRICS_DUMP_SECONDS)))
+    if hourly_task is None or hourly_task.done():
+        hourly_task = asyncio.get_event_loop().create_task(run_hourly_updates())
+    # only worker 0 writes logs
+    if SHARD_ID == sharding.COMMAND_SHARD and (retention_task is None or retention_task.done()):
+        retention_task = asyncio.get_event_loop().create_task(run_retention())
+    # only worker 0 writes hour jsons; it tells the others which prompts moved
+    if SHARD_ID == sharding.COMMAND_SHARD and (zone_task is None or zone_task.done()):
+        zone_task = asyncio.get_event_loop().create_task(run_zone_transitions())
+    if shared is not None and (inbox_task is None or inbox_task.done()):
+        inbox_task = asyncio.get_event_loop().create_task(run_shard_inbox())
+    break_tracker.start()
+    if not flush_data.is_running():
+        flush_data.start()
+
+async def check_registry():
+    """
+    Compares the registered user index against the users in storage and fixes any differences.
+    Runs once in the background after startup.
+    """
+    await client.wait_until_ready()
+
+    def check():
+        # users registered since the last flush aren't in storage yet
+        users.flush()
+        return util.registered_users.check(store.list_users())
+
+    added, removed = await io_pool.run(check)
+    if added or removed:
+        print(f"Registry index was out of date: {len(added)} users missing, {len(removed)} extra. Fixed.")
+
+async def check_zone_index():
+    """
+    Compares zone_index against the zones in the users' jsons in storage and fixes any differences.
+    Runs once in the background after startup.
+    """
+    await client.wait_until_ready()
+
+    def check():
+        # zones picked since the last flush aren't in storage yet
+        users.flush()
+        return zone_index.check(store.user_zones(), bot_clock.now())
+
+    added, removed = await io_pool.run(check)
+    if added or removed:
+        print(f"Zone index was out of date: {len(added)} users missing, {len(removed)} extra. Fixed.")
+        # zones it didn't have might change offset before the one run_zone_transitions() is waiting for
+        zone_wakeup.set()
+
+@bot_metrics.instrument("loop")
+async def send_break_reminder(user_id: int, game_name: str):
+    """
+    Sends a user a break reminder. Called by break_tracker whenever one is due.
+    """
+    channel = await prompt_fanout.channel_for(user_id)
+    await channel.send("Time for a break? If you need,\n"
+                       "- Get some food\n"
+                       "- Get some water\n"
+                       "- Stretch or move around! :)")
+
+break_tracker = breaks.BreakTracker(send_break_reminder)
+
+@tasks.loop(seconds=FLUSH_SECONDS)
+@bot_metrics.instrument("loop")
+async def flush_data():
+    """
+    Runs every FLUSH_SECONDS. Writes changed user jsons from the cache to storage and the zone index
+    if users picked or dropped zones, then folds the rest of the journal into storage and empties it.
+    """
+    def flush():
+        users.flush()
+        zone_index.flush()
+        store.compact()
+
+    await io_pool.run(flush)
+
+bot_metrics.gauge("cornbot_registered_users", "Registered users.", lambda: len(util.registered_users))
+bot_metrics.gauge("cornbot_zone_users", "Users whose prompts follow an IANA zone's daylight saving time.", lambda: len(zone_index))
+bot_metrics.gauge("cornbot_scheduled_prompts", "Prompts in the scheduler.", prompt_scheduler.count)
+bot_metrics.gauge("cornbot_game_sessions", "Game sessions being tracked for break reminders.", lambda: len(break_tracker.sessions))
+bot_metrics.gauge("cornbot_user_cache_bytes", "Estimated bytes of user jsons in the cache.", lambda: users.memory_used)
+bot_metrics.gauge("cornbot_user_cache_hit_ratio", "User cache hit ratio since startup.", lambda: users.stats()["hit_ratio"])
+bot_metrics.gauge("cornbot_response_cache_hit_ratio", "Share of list replies served from the response cache since startup.",
+                  lambda: response_cache.stats()["hit_ratio"])
+bot_metrics.gauge("cornbot_timezone_cache_hit_ratio", "Share of timezone tables reused from the same minute since startup.",
+                  lambda: util.timezones_cache_stats()["hit_ratio"])
+bot_metrics.gauge("cornbot_journal_bytes", "Bytes in the journal waiting to be compacted.", mutation_journal.size)
+bot_metrics.gauge("cornbot_journal_syncs", "Journal fsyncs since startup.", lambda: mutation_journal.syncs)
+bot_metrics.gauge("cornbot_journal_appends_coalesced", "Journal appends that shared another append's fsync.", lambda: mutation_journal.coalesced)
+bot_metrics.gauge("cornbot_active_mailboxes", "Users with commands queued or running.", lambda: len(user_mailboxes.actors))
+bot_metrics.gauge("cornbot_hour_owner_queue", "Hour json changes waiting for the owner task.", lambda: len(hour_owner))
+bot_metrics.gauge("cornbot_io_queue", "Jobs waiting for or running on the I/O thread.", lambda: io_pool.queued)
+bot_metrics.gauge("cornbot_io_busy_seconds", "Seconds the I/O thread has spent running jobs.", lambda: io_pool.busy)
+bot_metrics.gauge("cornbot_shard_messages_received", "Changes applied from other workers since startup.",
+                  lambda: shared.received if shared else 0)
+bot_metrics.gauge("cornbot_shard_prompts_already_sent", "Prompts skipped because another worker had already sent them.",
+                  lambda: shared.duplicates if shared else 0)
+bot_metrics.gauge("cornbot_prompts_sent", "Prompts sent since startup.", lambda: prompt_fanout.sent)
+bot_metrics.gauge("cornbot_prompts_failed", "Prompts that failed to send since startup.", lambda: prompt_fanout.failed)
+bot_metrics.gauge("cornbot_outbox_pending", "Prompts queued in the outbox, waiting to send or retry.", lambda: prompt_outbox.pending)
+
+
+if __name__ == "__main__":
+    load_state()
+    # GOOOOO!
+    connect_began = time.perf_counter()
+    client.run('TOKEN_HERE')
+    # let the I/O thread finish, then write out anything still waiting in the user cache and journal
+    io_pool.close()
+    users.flush()
+    zone_index.flush()
+    store.compact()
+    store.close()
+    prompt_outbox.close()
+    if shared is not None:
+        shared.close()
@@ -0,0 +1,258 @@
+# latency, disk and discord API metrics for commands and loops
+# served in prometheus text format on a local port, and optionally dumped to a json file
+
+import asyncio, atomicwrite, bisect, functools, itertools, json, os, sys, time
+
+# upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, the way prometheus expects them.
+    """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # counts[i] is how many observations were in (buckets[i-1], buckets[i]]; the last one is past every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns [(upper bound, observations <= it)], ending with "+Inf".
+        """
+        return list(zip(self.buckets + ("+Inf",), itertools.accumulate(self.counts)))
+
+
+class Metrics:
+    """
+    Records, for each command and loop, a latency histogram plus how many bytes it made
+    the disk read and write, how many files it opened, and how many discord API calls it made.
+
+    Bytes come from /proc/self/io and files from an audit hook, so they're process-wide
+    counters diffed around each call; anything running concurrently on the event loop
+    (like a send awaiting the network) gets counted towards whichever calls overlap it.
+    When ENABLED is False, start() and finish() return right away and nothing is recorded.
+    """
+
+    def __init__(self, enabled: bool=True, buckets: tuple=DEFAULT_BUCKETS):
+        """
+        ENABLED: whether to record anything; can be changed later
+        BUCKETS: upper bounds of the latency histogram buckets, in seconds
+        """
+        self.enabled = enabled
+        self.buckets = buckets
+        # (kind, name) -> Histogram
+        self.durations = {}
+        # (kind, name) -> {"read_bytes": int, "written_bytes": int, "files_opened": int, "api_calls": int, "errors": int}
+        self.totals = {}
+        # "METHOD /path" -> calls, for every discord API call whether or not it was inside a command
+        self.api_routes = {}
+        # name -> (help string, function returning a number)
+        self.gauges = {}
+        self.files_opened = 0
+        self.api_calls = 0
+        # seconds spent in start() and finish(), i.e. what recording metrics costs
+        self.overhead = 0.0
+        self.io_fd = None
+        try:
+            self.io_fd = os.open("/proc/self/io", os.O_RDONLY)
+        except OSError:
+            # not linux; disk bytes just stay at 0
+            pass
+        # audit hooks can't be removed, so it's only added once something is measured
+        self.hooked = False
+
+    def start(self, kind: str, name: str):
+        """
+        Starts measuring one call. Returns a token to pass to finish(), or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        began = time.perf_counter()
+        if not self.hooked:
+            sys.addaudithook(self._audit)
+            self.hooked = True
+        read_bytes, written_bytes = self._disk_bytes()
+        token = (kind, name, read_bytes, written_bytes, self.files_opened, self.api_calls, time.perf_counter())
+        self.overhead += token[-1] - began
+        return token
+
+    def finish(self, token: tuple, failed: bool=False):
+        """
+        Records a call started with start(). FAILED counts it as an error.
+        """
+        if token is None:
+            return
+        ended = time.perf_counter()
+        kind, name, read_bytes, written_bytes, files_opened, api_calls, began = token
+        key = (kind, name)
+        if key not in self.durations:
+            self.durations[key] = Histogram(self.buckets)
+            self.totals[key] = {"read_bytes":0, "written_bytes":0, "files_opened":0, "api_calls":0, "errors":0}
+        self.durations[key].observe(ended - began)
+        now_read, now_written = self._disk_bytes()
+        totals = self.totals[key]
+        totals["read_bytes"] += now_read - read_bytes
+        totals["written_bytes"] += now_written - written_bytes
+        totals["files_opened"] += self.files_opened - files_opened
+        totals["api_calls"] += self.api_calls - api_calls
+        totals["errors"] += 1 if failed else 0
+        self.overhead += time.perf_counter() - ended
+
+    def instrument(self, kind: str):
+        """
+        Decorator that measures every call of an async function, named after the function.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await function(*args, **kwargs)
+                token = self.start(kind, function.__name__)
+                failed = True
+                try:
+                    result = await function(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    self.finish(token, failed)
+            return wrapper
+        return decorator
+
+    def count_api_calls(self, http):
+        """
+        Wraps a discord.py HTTPClient's request() so every API call is counted by route.
+        """
+        request = http.request
+
+        async def counting_request(route, *args, **kwargs):
+            if self.enabled:
+                self.api_calls += 1
+                key = f"{route.method} {route.path}"
+                self.api_routes[key] = self.api_routes.get(key, 0) + 1
+            return await request(route, *args, **kwargs)
+
+        http.request = counting_request
+
+    def gauge(self, name: str, help: str, function):
+        """
+        Adds a gauge whose value is FUNCTION() at the time it's read.
+        """
+        self.gauges[name] = (help, function)
+
+    def snapshot(self):
+        """
+        Returns every metric as a json-friendly dict.
+        """
+        calls = {}
+        for (kind, name), histogram in self.durations.items():
+            calls.setdefault(kind, {})[name] = {
+                "count":histogram.count,
+                "seconds":histogram.sum,
+                "buckets":{str(bound):count for bound, count in histogram.cumulative()},
+                **self.totals[(kind, name)]
+            }
+        return {
+            "time":time.time(),
+            "enabled":self.enabled,
+            "calls":calls,
+            "api_routes":dict(self.api_routes),
+            "gauges":{name:function() for name, (_, function) in self.gauges.items()},
+            "overhead_seconds":self.overhead
+        }
+
+    def prometheus(self):
+        """
+        Returns every metric in prometheus text exposition format.
+        """
+        lines = ["# HELP cornbot_duration_seconds Time spent in commands and loop iterations.",
+                 "# TYPE cornbot_duration_seconds histogram"]
+        for (kind, name), histogram in self.durations.items():
+            labels = f'kind="{_escape(kind)}",name="{_escape(name)}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'cornbot_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"cornbot_duration_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"cornbot_duration_seconds_count{{{labels}}} {histogram.count}")
+        for total, help in (("read_bytes", "Bytes read from disk."), ("written_bytes", "Bytes written to disk."),
+                            ("files_opened", "Files opened."), ("api_calls", "Discord API calls made."),
+                            ("errors", "Calls that raised an exception.")):
+            lines.append(f"# HELP cornbot_{total}_total {help}")
+            lines.append(f"# TYPE cornbot_{total}_total counter")
+            for (kind, name), totals in self.totals.items():
+                lines.append(f'cornbot_{total}_total{{kind="{_escape(kind)}",name="{_escape(name)}"}} {totals[total]}')
+        lines.append("# HELP cornbot_api_route_calls_total Discord API calls by route.")
+        lines.append("# TYPE cornbot_api_route_calls_total counter")
+        for route, calls in self.api_routes.items():
+            lines.append(f'cornbot_api_route_calls_total{{route="{_escape(route)}"}} {calls}')
+        for name, (help, function) in self.gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {function()}")
+        lines.append("# HELP cornbot_metrics_overhead_seconds_total Time spent recording metrics.")
+        lines.append("# TYPE cornbot_metrics_overhead_seconds_total counter")
+        lines.append(f"cornbot_metrics_overhead_seconds_total {self.overhead}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int):
+        """
+        Serves GET /metrics (prometheus) and GET /metrics.json on HOST:PORT. Returns the asyncio server.
+        """
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def dump_every(self, path: str, seconds: float):
+        """
+        Writes snapshot() to PATH every SECONDS, through a temp file so readers never see half of one.
+        """
+        while True:
+            await asyncio.sleep(seconds)
+            # no fsync; losing the last snapshot to a power cut doesn't matter
+            atomicwrite.write_file(path, json.dumps(self.snapshot()).encode(), fsync=False)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            # skip the headers
+            while (await reader.readline()).strip():
+                pass
+            path = request_line[1] if len(request_line) > 1 else ""
+            if path == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.prometheus()
+            elif path == "/metrics.json":
+                status, content_type, body = "200 OK", "application/json", json.dumps(self.snapshot())
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "Try /metrics or /metrics.json\n"
+            body = body.encode()
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def _audit(self, event: str, args: tuple):
+        if event == "open" and self.enabled:
+            self.files_opened += 1
+
+    def _disk_bytes(self):
+        """
+        Returns (bytes read, bytes written) by this process at the storage layer so far.
+        """
+        if self.io_fd is None:
+            return 0, 0
+        read_bytes = written_bytes = 0
+        for line in os.pread(self.io_fd, 512, 0).split(b"\n"):
+            if line.startswith(b"read_bytes:"):
+                read_bytes = int(line[11:])
+            elif line.startswith(b"write_bytes:"):
+                written_bytes = int(line[12:])
+        return read_bytes, written_bytes
+
+
+def _escape(value: str):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
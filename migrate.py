@@ -0,0 +1,39 @@
+# one-shot migration from the legacy users/ and times/ layout into the sqlite backend
+# usage: python migrate.py [--source DIR] [--db PATH]
+
+import argparse, os, storage
+
+def migrate(source: storage.Storage, destination: storage.Storage):
+    """
+    Copies every user json, log, and hour json from one backend into another.
+    Returns a tuple of (users copied, logs copied, hour jsons copied).
+    """
+    user_count = 0
+    log_count = 0
+    # one commit for the whole copy, so a failed migration leaves nothing behind
+    with destination.batch():
+        for user_id in source.list_users():
+            destination.save_user(user_id, source.load_user(user_id))
+            user_count += 1
+            log_data = source.load_log(user_id)
+            if log_data is not None:
+                destination.save_log(user_id, log_data)
+                log_count += 1
+        for hr in range(24):
+            destination.save_hour(hr, source.load_hour(hr))
+    return user_count, log_count, 24
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate cornbot data from users/ and times/ into sqlite.")
+    parser.add_argument("--source", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="folder containing users/ and times/ (default: this folder)")
+    parser.add_argument("--db", default=None, help="database to create (default: <source>/cornbot.db)")
+    args = parser.parse_args()
+    db_path = args.db or os.path.join(args.source, "cornbot.db")
+    if os.path.exists(db_path):
+        parser.error(f"{db_path} already exists; remove it first to re-run the migration.")
+    source = storage.LegacyStorage(args.source)
+    destination = storage.SQLiteStorage(db_path)
+    users, logs, hours = migrate(source, destination)
+    destination.close()
+    print(f"Migrated {users} users, {logs} logs, and {hours} hour files into {db_path}.")
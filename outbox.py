@@ -0,0 +1,162 @@
+# durable queue of prompts waiting to be sent
+# when a minute comes due its prompts are written here first and sent from here, so a failed send is retried
+# with backoff instead of lost, and prompts queued before a restart still go out after it
+
+import contextlib, sqlite3
+import datetime as dt
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    due TEXT NOT NULL,
+    content TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (next_attempt);
+"""
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+def _timestamp(when: dt.datetime):
+    return (when - EPOCH).total_seconds()
+
+
+class Outbox:
+    """
+    Prompts that came due and haven't been sent yet, in a sqlite file of their own.
+
+    add() queues a minute's prompts and records that minute as fired, in one commit, so after a restart
+    fired_through() says where to catch up from. take() returns prompts ready to send, newest minute first,
+    so a backlog never holds up the minute that's due now. finish() deletes the ones that went out and
+    pushes each failed one back by RETRY_SECONDS, doubling every attempt, until MAX_ATTEMPTS.
+    A prompt sent right before a crash, before finish() recorded it, is sent again after the restart.
+    """
+
+    def __init__(self, path: str, retry_seconds: float, max_attempts: int):
+        """
+        PATH: sqlite file to keep the queue in
+        RETRY_SECONDS: wait before the first retry of a failed send
+        MAX_ATTEMPTS: sends to try before giving up on a prompt
+        """
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(OUTBOX_SCHEMA)
+        # kept in memory so the metrics gauge doesn't query from the event loop
+        self.pending = self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.added = 0
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.expired = 0
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.db.execute("BEGIN")
+        try:
+            yield
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def add(self, due: dt.datetime, messages: list):
+        """
+        Queues every (user_id, content) in MESSAGES as due at DUE, and records DUE as fired.
+        """
+        with self._transaction():
+            self.db.executemany("INSERT INTO outbox (user_id, due, content, next_attempt) VALUES (?, ?, ?, ?)",
+                                [(user_id, due.isoformat(), content, _timestamp(due)) for user_id, content in messages])
+            self.db.execute("INSERT OR REPLACE INTO progress (key, value) VALUES ('fired_through', ?)", (due.isoformat(),))
+        self.pending += len(messages)
+        self.added += len(messages)
+
+    def remove(self, due: dt.datetime, user_ids: list):
+        """
+        Takes back the prompts due at DUE to USER_IDS that add() queued, say because another worker sent them.
+        """
+        if not user_ids:
+            return
+        removed = 0
+        with self._transaction():
+            # in chunks, under sqlite's limit on bound parameters
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                removed += self.db.execute(f"DELETE FROM outbox WHERE due = ? AND user_id IN ({','.join('?' * len(chunk))})",
+                                           [due.isoformat(), *chunk]).rowcount
+        self.pending -= removed
+        self.added -= removed
+
+    def fired_through(self):
+        """
+        Returns the last minute whose prompts were queued, or None if none ever were.
+        """
+        row = self.db.execute("SELECT value FROM progress WHERE key = 'fired_through'").fetchone()
+        return dt.datetime.fromisoformat(row[0]) if row is not None else None
+
+    def take(self, now: dt.datetime, limit: int):
+        """
+        Returns up to LIMIT prompts that are ready to send at NOW, as (id, user_id, due, content),
+        newest due first. They stay queued until finish() is called with them.
+        """
+        rows = self.db.execute("SELECT id, user_id, due, content FROM outbox WHERE next_attempt <= ? ORDER BY due DESC, id LIMIT ?",
+                               (_timestamp(now), limit)).fetchall()
+        return [(row_id, user_id, dt.datetime.fromisoformat(due), content) for row_id, user_id, due, content in rows]
+
+    def finish(self, sent: list, failed: list, now: dt.datetime):
+        """
+        Removes the prompts with ids in SENT, and schedules a retry of those in FAILED
+        (or drops them, if that was their last attempt). Returns how many were dropped.
+        """
+        with self._transaction():
+            self.db.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in sent])
+            attempts = dict(self.db.execute(f"SELECT id, attempts + 1 FROM outbox WHERE id IN ({','.join('?' * len(failed))})",
+                                            failed).fetchall()) if failed else {}
+            dropped = [row_id for row_id, attempt in attempts.items() if attempt >= self.max_attempts]
+            self.db.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in dropped])
+            self.db.executemany("UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                                [(attempt, _timestamp(now) + self.retry_seconds * 2 ** (attempt - 1), row_id)
+                                 for row_id, attempt in attempts.items() if attempt < self.max_attempts])
+        self.pending -= len(sent) + len(dropped)
+        self.sent += len(sent)
+        self.retried += len(attempts) - len(dropped)
+        self.dropped += len(dropped)
+        return len(dropped)
+
+    def next_attempt(self):
+        """
+        Returns when the next queued prompt is ready to send, or None if the outbox is empty.
+        """
+        row = self.db.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()
+        return EPOCH + dt.timedelta(seconds=row[0]) if row[0] is not None else None
+
+    def expire(self, before: dt.datetime):
+        """
+        Drops queued prompts due before BEFORE, too old to be worth sending. Returns how many.
+        """
+        with self._transaction():
+            expired = self.db.execute("DELETE FROM outbox WHERE due < ?", (before.isoformat(),)).rowcount
+        self.pending -= expired
+        self.expired += expired
+        return expired
+
+    def stats(self):
+        return {
+            "pending":self.pending,
+            "added":self.added,
+            "sent":self.sent,
+            "retried":self.retried,
+            "dropped":self.dropped,
+            "expired":self.expired
+        }
+
+    def close(self):
+        self.db.close()
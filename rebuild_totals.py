@@ -0,0 +1,33 @@
+# recomputes the summary stored alongside every activity log (all-time totals and newest rows) from the raw rows
+# run it with the bot stopped, after editing logs by hand or if a summary is suspected to be wrong
+# usage: python rebuild_totals.py [--directory DIR] [--backend sqlite]
+
+import argparse, os, storage
+
+def rebuild(store: storage.Storage):
+    """
+    Rebuilds every user's log summary from their full log. Returns how many were rebuilt.
+    """
+    rebuilt = 0
+    # one commit for all of them
+    with store.batch():
+        for user_id in store.list_users():
+            # loading a log sums its totals from the rows
+            log_data = store.load_log(user_id)
+            if log_data is not None:
+                store.save_summary(user_id, log_data.summary())
+                rebuilt += 1
+    return rebuilt
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute cornbot's stored log totals from the raw log rows.")
+    parser.add_argument("--directory", default=os.environ.get("CORNBOT_DIRECTORY", os.path.dirname(os.path.abspath(__file__))),
+                        help="folder holding cornbot.db or users/ (default: $CORNBOT_DIRECTORY or this folder)")
+    parser.add_argument("--backend", choices=["sqlite", "legacy"], default=os.environ.get("CORNBOT_STORAGE", "sqlite"))
+    args = parser.parse_args()
+    if os.path.exists(os.path.join(args.directory, "journal.log")) and os.path.getsize(os.path.join(args.directory, "journal.log")):
+        parser.error("journal.log isn't empty; start and stop the bot once so it's folded into storage first.")
+    store = storage.open_storage(args.backend, args.directory)
+    rebuilt = rebuild(store)
+    store.close()
+    print(f"Rebuilt totals for {rebuilt} logs in {args.directory}.")
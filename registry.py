@@ -0,0 +1,84 @@
+# index of registered user ids
+# kept as a set in memory for O(1) membership checks, and as a sorted json list on disk
+# so startup doesn't have to list every user in storage
+
+import json, atomicwrite
+
+class UserRegistry:
+    """
+    Set of registered user ids, persisted to an index file.
+
+    add() and remove() rewrite the index right away; registering and resetting are rare,
+    while membership checks happen on every command and presence update.
+    The index can drift from storage (a crash between saving a user and writing the index,
+    files edited by hand), so check() compares it against storage and fixes it.
+    """
+
+    def __init__(self, path: str=None):
+        """
+        PATH: index file to persist to; None keeps the registry in memory only
+        """
+        self.path = path
+        self.user_ids = set()
+
+    def __contains__(self, user_id: int):
+        return user_id in self.user_ids
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __iter__(self):
+        return iter(self.user_ids)
+
+    def load(self, path: str):
+        """
+        Replaces the registry with the ids in an index file, and persists to it from now on.
+        Returns False if the file doesn't exist yet (the registry is left empty).
+        """
+        self.path = path
+        try:
+            with open(path, "r") as file:
+                self.user_ids = set(json.load(file))
+        except FileNotFoundError:
+            self.user_ids = set()
+            return False
+        return True
+
+    def add(self, user_id: int):
+        if user_id not in self.user_ids:
+            self.user_ids.add(user_id)
+            self.save()
+
+    def remove(self, user_id: int):
+        if user_id in self.user_ids:
+            self.user_ids.discard(user_id)
+            self.save()
+
+    def rebuild(self, user_ids: list):
+        """
+        Replaces the registry with USER_IDS and persists it.
+        """
+        self.user_ids = set(user_ids)
+        self.save()
+
+    def check(self, user_ids: list):
+        """
+        Makes the registry match USER_IDS, the users that actually exist in storage.
+        Returns (added, removed): lists of ids that were missing from or extra in the index.
+        """
+        stored = set(user_ids)
+        added = sorted(stored - self.user_ids)
+        removed = sorted(self.user_ids - stored)
+        if added or removed:
+            self.user_ids = stored
+            self.save()
+        return added, removed
+
+    def save(self):
+        """
+        Writes the index to a temp file and renames it over the old one,
+        so a crash mid-write never leaves a half-written index.
+        """
+        if self.path is None:
+            return
+        atomicwrite.write_file(self.path, json.dumps(sorted(self.user_ids)).encode())
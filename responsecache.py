@@ -0,0 +1,60 @@
+# cache of rendered replies to read-only commands ("list prompts", "list breaks", "list logs")
+# each user has a data version that main.py bumps whenever it changes their data,
+# and a cached reply is only used while the version it was rendered at is still current
+
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    LRU cache of reply strings, keyed by user id plus whatever else the reply depends on.
+
+    Nothing has to find and delete a user's cached replies when their data changes:
+    bump() moves the user to a new version, and replies from older versions are dropped
+    the next time they're looked up (or pushed out by newer ones).
+    """
+
+    def __init__(self, max_entries: int):
+        """
+        MAX_ENTRIES: how many replies to keep, over all users
+        """
+        self.max_entries = max_entries
+        # (user_id, key) -> (version, reply), least recently used first
+        self.entries = OrderedDict()
+        # user_id -> version; users who were never changed are at version 0
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, user_id: int):
+        """
+        Marks a user's data as changed, so none of their cached replies are used again.
+        """
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+
+    async def get(self, user_id: int, key: tuple, render):
+        """
+        Returns the cached reply for USER_ID and KEY, or awaits RENDER() for a new one and caches it.
+        """
+        version = self.versions.get(user_id, 0)
+        entry = self.entries.get((user_id, key))
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self.entries.move_to_end((user_id, key))
+            return entry[1]
+        self.misses += 1
+        reply = await render()
+        # kept under the version it was rendered from, in case the data changed while rendering
+        self.entries[(user_id, key)] = (version, reply)
+        self.entries.move_to_end((user_id, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return reply
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries":len(self.entries),
+            "hits":self.hits,
+            "misses":self.misses,
+            "hit_ratio":self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,132 @@
+# in-memory prompt scheduler
+# holds every user's prompt times in 1440 minute-of-day buckets (UTC) and sleeps until the next one is due
+
+import asyncio, traceback
+import datetime as dt
+from clock import Clock, default_clock
+
+MINUTES_PER_DAY = 24 * 60
+
+def slot(hour: int, minute: int):
+    """
+    Returns the minute-of-day bucket index for a UTC hour and minute.
+    """
+    return hour * 60 + minute
+
+
+class PromptScheduler:
+    """
+    Timer wheel with one bucket of user ids per minute of the day.
+
+    Adding or removing a prompt is a set operation on one bucket and never restarts anything;
+    if an add makes an earlier minute due, the sleeping run() loop is woken up to re-plan.
+    When a minute comes up, CALLBACK(due, user_ids) is awaited with the datetime the minute
+    started at and a copy of its bucket.
+    """
+
+    def __init__(self, callback, clock: Clock=None):
+        """
+        CALLBACK: async function taking a datetime and a list of user ids
+        CLOCK: clock.Clock to read and wait on time with; defaults to clock.default_clock()
+        """
+        self.callback = callback
+        self.clock = clock or default_clock()
+        self.buckets = [set() for _ in range(MINUTES_PER_DAY)]
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def add(self, slot: int, user_id: int):
+        self.buckets[slot].add(user_id)
+        self.wakeup.set()
+
+    def remove(self, slot: int, user_id: int):
+        self.buckets[slot].discard(user_id)
+
+    def move(self, moves: list):
+        """
+        Applies many (user_id, old slot, new slot) changes at once, waking run() only once.
+        Either slot may be None to only add or only remove.
+        """
+        # every remove goes first, since one of a user's prompts can move into the minute another moves out of
+        for user_id, old, _ in moves:
+            if old is not None:
+                self.buckets[old].discard(user_id)
+        for user_id, _, new in moves:
+            if new is not None:
+                self.buckets[new].add(user_id)
+        self.wakeup.set()
+
+    def load(self, hr: int, hour_json: dict):
+        """
+        Adds every user id in an hour json to the scheduler.
+        """
+        for minute, user_ids in hour_json.items():
+            self.buckets[slot(hr, int(minute))].update(user_ids)
+        self.wakeup.set()
+
+    def count(self):
+        """
+        Returns how many prompts are scheduled in total.
+        """
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def next_due(self, after: dt.datetime):
+        """
+        Returns the start of the next minute after AFTER that has any prompts, or None if there are none.
+        """
+        minute_start = after.replace(second=0, microsecond=0)
+        current = slot(minute_start.hour, minute_start.minute)
+        for i in range(1, MINUTES_PER_DAY + 1):
+            if self.buckets[(current + i) % MINUTES_PER_DAY]:
+                return minute_start + dt.timedelta(minutes=i)
+        return None
+
+    def start(self, since: dt.datetime=None):
+        """
+        Starts run() as a task, unless it's already running.
+        SINCE: the last minute that fired before a restart; minutes after it that were missed are fired first
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_event_loop().create_task(self.run(since))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self, since: dt.datetime=None):
+        """
+        Fires each minute's bucket once, at the start of that minute.
+        Minutes that have already started when they get added (including the minute
+        the scheduler starts in, unless it's after SINCE) are skipped until the next day.
+        """
+        last_fired = since or self.clock.now().replace(second=0, microsecond=0)
+        while True:
+            due = self.next_due(last_fired)
+            if due is None:
+                # nothing scheduled at all; wait for an add()
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                now = self.clock.now()
+            else:
+                await self.clock.sleep_until(due, self.wakeup)
+                # read once: woken a moment before DUE, a second read could already be past it,
+                # and re-planning from that would skip DUE
+                now = self.clock.now()
+                if now >= due:
+                    last_fired = due
+                    await self._fire(due)
+                    # if that took long enough for the next minute to come due, the next
+                    # sleep_until returns right away, so late minutes are never skipped
+                    continue
+            # woken by add() (or a timer a hair early), so re-plan from now; nothing that was planned has come due yet
+            last_fired = max(last_fired, now.replace(second=0, microsecond=0))
+
+    async def _fire(self, due: dt.datetime):
+        user_ids = list(self.buckets[slot(due.hour, due.minute)])
+        if len(user_ids) == 0:
+            return
+        try:
+            await self.callback(due, user_ids)
+        # one bad minute shouldn't stop every prompt after it
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,143 @@
+# running the bot as several worker processes, one per gateway shard
+# Discord hands guilds to shards by (guild_id >> 22) % shard_count; user ids are split between workers
+# the same way, and each worker sends the prompts and break reminders of the users it owns
+# DMs only ever arrive on shard 0, so worker 0 runs every command and is the only one that writes user data;
+# it tells the other workers about changes through a small sqlite file they all share
+
+import json, sqlite3, time
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shard INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sent (
+    user_id INTEGER NOT NULL,
+    due TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (user_id, due)
+);
+CREATE INDEX IF NOT EXISTS messages_shard ON messages (shard, id);
+"""
+
+# the shard that receives DMs, so runs commands and owns writes to storage
+COMMAND_SHARD = 0
+
+def shard_for(snowflake: int, shard_count: int):
+    """
+    Returns which shard a guild or user id belongs to, using Discord's formula for guilds.
+    The top bits of a snowflake are its creation time in ms, so ids spread evenly.
+    """
+    return (snowflake >> 22) % shard_count
+
+
+class SharedStore:
+    """
+    The state workers share: a queue of messages per worker, and a record of which prompts were sent.
+
+    post() and broadcast() queue a message (a kind, a user id and a json body) for other workers,
+    and receive() takes everything queued for this one, oldest first, so each worker
+    applies changes in the order worker 0 made them. claim() is checked before every prompt
+    goes out, so no prompt is sent twice even while ownership is moving between workers.
+    """
+
+    def __init__(self, path: str, shard_id: int, shard_count: int):
+        """
+        PATH: sqlite file every worker opens, usually shared.db next to the data
+        """
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SHARED_SCHEMA)
+        self.posted = 0
+        self.received = 0
+        self.claimed = 0
+        self.duplicates = 0
+
+    def owns(self, user_id: int):
+        """
+        Returns True if this worker sends USER_ID's prompts and break reminders.
+        """
+        return shard_for(user_id, self.shard_count) == self.shard_id
+
+    def owner(self, user_id: int):
+        return shard_for(user_id, self.shard_count)
+
+    def post(self, shard: int, kind: str, user_id: int, body: dict=None):
+        """
+        Queues a message for one worker.
+        """
+        self.db.execute("INSERT INTO messages (shard, kind, user_id, body) VALUES (?, ?, ?, ?)",
+                        (shard, kind, user_id, json.dumps(body)))
+        self.posted += 1
+
+    def broadcast(self, kind: str, user_id: int, body: dict=None):
+        """
+        Queues a message for every worker except this one.
+        """
+        self.db.executemany("INSERT INTO messages (shard, kind, user_id, body) VALUES (?, ?, ?, ?)",
+                            [(shard, kind, user_id, json.dumps(body)) for shard in range(self.shard_count) if shard != self.shard_id])
+        self.posted += self.shard_count - 1
+
+    def receive(self, limit: int=1000):
+        """
+        Removes and returns up to LIMIT messages queued for this worker, as (kind, user_id, body), oldest first.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.db.execute("SELECT id, kind, user_id, body FROM messages WHERE shard = ? ORDER BY id LIMIT ?",
+                                   (self.shard_id, limit)).fetchall()
+            if rows:
+                self.db.execute("DELETE FROM messages WHERE shard = ? AND id <= ?", (self.shard_id, rows[-1][0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.received += len(rows)
+        return [(kind, user_id, json.loads(body)) for _, kind, user_id, body in rows]
+
+    def claim(self, user_ids: list, due: str):
+        """
+        Records that this worker is sending the prompts due at DUE to USER_IDS.
+        Returns the ids nobody had claimed yet; the rest were already sent and should be skipped.
+        """
+        claimed = []
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id in user_ids:
+                cursor = self.db.execute("INSERT OR IGNORE INTO sent (user_id, due, shard, sent_at) VALUES (?, ?, ?, ?)",
+                                         (user_id, due, self.shard_id, now))
+                if cursor.rowcount:
+                    claimed.append(user_id)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.claimed += len(claimed)
+        self.duplicates += len(user_ids) - len(claimed)
+        return claimed
+
+    def prune(self, older_than: float):
+        """
+        Forgets sent prompts recorded more than OLDER_THAN seconds ago.
+        """
+        self.db.execute("DELETE FROM sent WHERE sent_at < ?", (time.time() - older_than,))
+
+    def stats(self):
+        return {
+            "shard_id":self.shard_id,
+            "shard_count":self.shard_count,
+            "posted":self.posted,
+            "received":self.received,
+            "claimed":self.claimed,
+            "duplicates":self.duplicates
+        }
+
+    def close(self):
+        self.db.close()
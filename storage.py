@@ -0,0 +1,611 @@
+# storage backends for cornbot
+# LegacyStorage keeps the original users/*.json, users/*.csv and times/*.json layout,
+# SQLiteStorage keeps everything in one WAL-mode database with indexed tables
+
+import contextlib, io, json, os, sqlite3
+from atomicwrite import AtomicWriter
+from concurrent.futures import ThreadPoolExecutor
+# activitylog is imported inside the methods that need it, because it pulls in numpy
+# and most startups never touch a log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    tz INTEGER NOT NULL,
+    zone TEXT
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    user_id INTEGER NOT NULL,
+    time TEXT NOT NULL,
+    content TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, time)
+);
+CREATE TABLE IF NOT EXISTS breaks (
+    user_id INTEGER NOT NULL,
+    game TEXT NOT NULL,
+    minutes INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, game)
+);
+CREATE TABLE IF NOT EXISTS activity_columns (
+    user_id INTEGER NOT NULL,
+    activity TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, activity)
+);
+CREATE TABLE IF NOT EXISTS activity (
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (user_id, date, activity)
+);
+CREATE TABLE IF NOT EXISTS times (
+    hour INTEGER NOT NULL,
+    minute TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_summaries (
+    user_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS times_hour ON times (hour, minute);
+CREATE INDEX IF NOT EXISTS times_user ON times (user_id);
+CREATE INDEX IF NOT EXISTS activity_date ON activity (user_id, date);
+"""
+
+class Storage:
+    """
+    Base class for storage backends. Every method that main.py uses to
+    read or write user data goes through one of these.
+
+    User json objects look like {"tz": int, "prompts": {"HH:MM": str}, "breaks": {game: int}},
+    plus "zone" (an IANA name like "Europe/Berlin") for users who picked one; see zones.py.
+    Logs are activitylog.ActivityLog objects, and every saved log has an activitylog.LogSummary saved with it.
+    Hour json objects look like {"MM": {user_id, ...}} in memory: a set per minute, so adding or removing
+    a prompt doesn't scan everyone else in a popular minute. They're stored as sorted lists.
+    """
+
+    def __init__(self):
+        # hr -> entries found twice in the same minute when that hour json was last loaded, which sets drop;
+        # see minute_sets(). An hour is dropped from it once it's saved, since saving writes the sets
+        self.hour_duplicates = {}
+
+    @property
+    def duplicate_entries(self):
+        """
+        How many duplicate entries the hour jsons in storage have, as of the last time each was loaded.
+        """
+        return sum(self.hour_duplicates.values())
+
+    def list_users(self):
+        raise NotImplementedError
+
+    def load_user(self, user_id: int):
+        raise NotImplementedError
+
+    def save_user(self, user_id: int, user_json: dict):
+        raise NotImplementedError
+
+    def delete_user(self, user_id: int):
+        raise NotImplementedError
+
+    def load_log(self, user_id: int):
+        raise NotImplementedError
+
+    def save_log(self, user_id: int, log_data: "ActivityLog"):
+        raise NotImplementedError
+
+    def delete_log(self, user_id: int):
+        raise NotImplementedError
+
+    def load_summary(self, user_id: int):
+        """
+        Returns a user's LogSummary, or None if the user has no logs.
+        Backends that store summaries override this; the fallback reads the whole log.
+        """
+        log_data = self.load_log(user_id)
+        return log_data.summary() if log_data is not None else None
+
+    def save_summary(self, user_id: int, summary: "LogSummary"):
+        """
+        Stores a log's summary. save_log() does this itself; rebuild_totals.py calls it directly.
+        """
+        pass
+
+    def load_hour(self, hr: int):
+        raise NotImplementedError
+
+    def save_hour(self, hr: int, hour_json: dict):
+        raise NotImplementedError
+
+    def load_hours(self):
+        """
+        Returns {hr: hour json} for all 24 hours. Used once at startup to build the prompt scheduler.
+        """
+        return {hr:self.load_hour(hr) for hr in range(24)}
+
+    def slots_of(self, user_id: int):
+        """
+        Returns the sorted UTC minutes of the day (see scheduler.slot()) a user has a prompt scheduled in,
+        going by the hour jsons. Backends with a reverse index override this; the fallback reads all 24.
+        """
+        return sorted(hr * 60 + int(minute) for hr, hour_json in self.load_hours().items()
+                      for minute, user_ids in hour_json.items() if user_id in user_ids)
+
+    def user_zones(self):
+        """
+        Returns {user_id: zone} for every user who picked an IANA zone. Backends that store the zone
+        on its own override this; the fallback reads every user json.
+        """
+        user_zones = {}
+        for user_id in self.list_users():
+            user_json = self.load_user(user_id)
+            if user_json is not None and user_json.get("zone") is not None:
+                user_zones[user_id] = user_json["zone"]
+        return user_zones
+
+    def minute_sets(self, hr: int, hour_json: dict):
+        """
+        Returns hour HR's json as stored, {"MM": [user_id, ...]}, with a set per minute,
+        and records how many user ids it listed twice in one minute in hour_duplicates.
+        """
+        sets = {minute:set(user_ids) for minute, user_ids in hour_json.items()}
+        duplicates = sum(len(user_ids) - len(sets[minute]) for minute, user_ids in hour_json.items())
+        if duplicates:
+            self.hour_duplicates[hr] = duplicates
+        else:
+            self.hour_duplicates.pop(hr, None)
+        return sets
+
+    # the methods below are single mutations that commands make
+    # by default they load, change, and save the whole object,
+    # but backends can override them to write less
+
+    def log_time(self, user_id: int, date, activity: str, seconds: int):
+        """
+        Adds seconds to an activity on a date, making the user's log if it doesn't exist.
+        Returns the new time logged for that day.
+        """
+        log_data = self.load_log(user_id)
+        if log_data is None:
+            from activitylog import ActivityLog
+            log_data = ActivityLog()
+        updated = log_data.add(date, activity, seconds)
+        self.save_log(user_id, log_data)
+        return updated
+
+    def drop_activity(self, user_id: int, activity: str):
+        log_data = self.load_log(user_id)
+        log_data.drop(activity)
+        self.save_log(user_id, log_data)
+
+    def merge_activities(self, user_id: int, activity1: str, activity2: str, new_activity: str):
+        log_data = self.load_log(user_id)
+        log_data.merge(activity1, activity2, new_activity)
+        self.save_log(user_id, log_data)
+
+    def roll_up_log(self, user_id: int, today, daily_days: int, weekly_days: int):
+        """
+        Rolls a user's old log rows into weeks and months (see ActivityLog.roll_up()).
+        Returns True if the log changed and was saved.
+        """
+        log_data = self.load_log(user_id)
+        if log_data is None or not log_data.roll_up(today, daily_days, weekly_days):
+            return False
+        self.save_log(user_id, log_data)
+        return True
+
+    def add_to_hour(self, hr: int, minute: str, user_id: int):
+        """
+        Adds a user id to a minute in an hour json. Returns the updated hour json.
+        """
+        hour_json = self.load_hour(hr)
+        # if there are no prompts scheduled at this minute, make an empty set
+        hour_json.setdefault(minute, set()).add(user_id)
+        self.save_hour(hr, hour_json)
+        return hour_json
+
+    def remove_from_hour(self, hr: int, minute: str, user_id: int):
+        """
+        Removes a user id from a minute in an hour json. Returns the updated hour json.
+        """
+        hour_json = self.load_hour(hr)
+        if user_id in hour_json.get(minute, ()):
+            hour_json[minute].discard(user_id)
+            # if minute set is now empty, pop it
+            if len(hour_json[minute]) == 0:
+                hour_json.pop(minute)
+        self.save_hour(hr, hour_json)
+        return hour_json
+
+    def move_in_hours(self, moves: list):
+        """
+        Moves many prompts between minutes at once, loading and saving each changed hour json once.
+        MOVES is a list of (user_id, old slot, new slot), where a slot is a UTC minute of the day
+        (see scheduler.slot()); either may be None to only add or only remove.
+        Returns the hours that changed.
+        """
+        hours = {}
+
+        def load_hour(hr: int):
+            if hr not in hours:
+                hours[hr] = self.load_hour(hr)
+            return hours[hr]
+
+        changed = apply_hour_moves(load_hour, moves)
+        with self.batch():
+            for hr in changed:
+                self.save_hour(hr, hours[hr])
+        return changed
+
+    def batch(self):
+        """
+        Returns a context manager; everything saved inside it is committed together when it ends.
+        """
+        return contextlib.nullcontext()
+
+    def close(self):
+        pass
+
+
+class LegacyStorage(Storage):
+    """
+    The original directory layout: users/{id}.json, users/{id}.csv and times/{hour}.json.
+    Files are replaced atomically through an atomicwrite.AtomicWriter, and reads see
+    writes that are still waiting to be committed.
+    """
+
+    def __init__(self, directory: str, write_delay: float=0.0, fsync: bool=True, call_later=None):
+        """
+        DIRECTORY: folder holding users/ and times/
+        WRITE_DELAY: seconds writes can wait to be committed together; see AtomicWriter
+        FSYNC: whether commits fsync
+        CALL_LATER: how delayed commits are scheduled; see AtomicWriter
+        """
+        super().__init__()
+        self.users_path = os.path.join(directory, "users")
+        self.times_path = os.path.join(directory, "times")
+        os.makedirs(self.users_path, exist_ok=True)
+        os.makedirs(self.times_path, exist_ok=True)
+        self.writer = AtomicWriter(write_delay, fsync, call_later)
+
+    def _read(self, path: str):
+        """
+        Returns a file's contents as a str, including a pending write, or None if it doesn't exist.
+        """
+        data = self.writer.read(path)
+        if data is not None:
+            return data.decode()
+        try:
+            with open(path, "r", newline="") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def list_users(self):
+        user_ids = {int(filename[:-5]) for filename in os.listdir(self.users_path) if filename.endswith(".json")}
+        for path in self.writer.pending:
+            if os.path.dirname(path) == self.users_path and path.endswith(".json"):
+                user_ids.add(int(os.path.basename(path)[:-5]))
+        return list(user_ids)
+
+    def load_user(self, user_id: int):
+        """
+        Returns a user json object, or None if the user has no file.
+        """
+        data = self._read(os.path.join(self.users_path, f"{user_id}.json"))
+        return json.loads(data) if data is not None else None
+
+    def save_user(self, user_id: int, user_json: dict):
+        self.writer.write(os.path.join(self.users_path, f"{user_id}.json"), json.dumps(user_json).encode())
+
+    def delete_user(self, user_id: int):
+        path = os.path.join(self.users_path, f"{user_id}.json")
+        self.writer.discard(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def load_log(self, user_id: int):
+        """
+        Returns a user's ActivityLog, or None if the user has no logs.
+        """
+        from activitylog import ActivityLog
+        data = self._read(os.path.join(self.users_path, f"{user_id}.csv"))
+        return ActivityLog.from_csv(io.StringIO(data, newline="")) if data is not None else None
+
+    def save_log(self, user_id: int, log_data: "ActivityLog"):
+        file = io.StringIO(newline="")
+        log_data.to_csv(file)
+        self.writer.write(os.path.join(self.users_path, f"{user_id}.csv"), file.getvalue().encode())
+        self.save_summary(user_id, log_data.summary())
+
+    def delete_log(self, user_id: int):
+        """
+        Deletes a user's logs. Returns False if there were no logs to delete.
+        """
+        path = os.path.join(self.users_path, f"{user_id}.csv")
+        existed = self.writer.read(path) is not None
+        self.writer.discard(path)
+        if os.path.exists(path):
+            os.remove(path)
+            existed = True
+        summary_path = os.path.join(self.users_path, f"{user_id}.summary")
+        self.writer.discard(summary_path)
+        if os.path.exists(summary_path):
+            os.remove(summary_path)
+        return existed
+
+    def load_summary(self, user_id: int):
+        """
+        Returns a user's LogSummary from users/{id}.summary, or from their whole log if it has none yet.
+        """
+        data = self._read(os.path.join(self.users_path, f"{user_id}.summary"))
+        if data is None:
+            return super().load_summary(user_id)
+        from activitylog import LogSummary
+        return LogSummary.from_json(json.loads(data))
+
+    def save_summary(self, user_id: int, summary: "LogSummary"):
+        self.writer.write(os.path.join(self.users_path, f"{user_id}.summary"), json.dumps(summary.to_json()).encode())
+
+    def load_hour(self, hr: int):
+        data = self._read(os.path.join(self.times_path, f"{hr}.json"))
+        return self.minute_sets(hr, json.loads(data)) if data is not None else {}
+
+    def save_hour(self, hr: int, hour_json: dict):
+        self.hour_duplicates.pop(hr, None)
+        self.writer.write(os.path.join(self.times_path, f"{hr}.json"), json.dumps(minute_lists(hour_json)).encode())
+
+    def batch(self):
+        return self.writer.hold()
+
+    def close(self):
+        self.writer.commit()
+
+    def load_hours(self):
+        # the 24 files are independent, so read them in parallel instead of one after another
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return dict(zip(range(24), executor.map(self.load_hour, range(24))))
+
+
+class SQLiteStorage(Storage):
+    """
+    Keeps all user data in a single SQLite database in WAL mode.
+    Every save happens inside one transaction, so a crash can't leave half-written data.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        # isolation_level=None so transactions are only opened by _transaction()
+        # check_same_thread=False because main.py opens it on the main thread and uses it from its I/O thread;
+        # only one thread ever uses it at a time
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        # databases made before zone names were supported
+        if "zone" not in [row[1] for row in self.db.execute("PRAGMA table_info(users)")]:
+            self.db.execute("ALTER TABLE users ADD COLUMN zone TEXT")
+
+    def _transaction(self):
+        """
+        Returns a context manager that runs its body in a single transaction.
+        """
+        return _Transaction(self.db)
+
+    def list_users(self):
+        return [row[0] for row in self.db.execute("SELECT id FROM users")]
+
+    def load_user(self, user_id: int):
+        row = self.db.execute("SELECT tz, zone FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        # positions keep dicts in the order they were made, which matters for
+        # "delete prompt <#>" and for "default" always being the first break
+        prompts = self.db.execute("SELECT time, content FROM prompts WHERE user_id = ? ORDER BY position", (user_id,))
+        breaks = self.db.execute("SELECT game, minutes FROM breaks WHERE user_id = ? ORDER BY position", (user_id,))
+        user_json = {
+            "tz":row[0],
+            "prompts":{time:content for time, content in prompts},
+            "breaks":{game:minutes for game, minutes in breaks}
+        }
+        if row[1] is not None:
+            user_json["zone"] = row[1]
+        return user_json
+
+    def save_user(self, user_id: int, user_json: dict):
+        with self._transaction():
+            self.db.execute("INSERT OR REPLACE INTO users (id, tz, zone) VALUES (?, ?, ?)",
+                            (user_id, user_json["tz"], user_json.get("zone")))
+            self.db.execute("DELETE FROM prompts WHERE user_id = ?", (user_id,))
+            self.db.executemany("INSERT INTO prompts (user_id, time, content, position) VALUES (?, ?, ?, ?)",
+                                [(user_id, time, content, i) for i, (time, content) in enumerate(user_json["prompts"].items())])
+            self.db.execute("DELETE FROM breaks WHERE user_id = ?", (user_id,))
+            self.db.executemany("INSERT INTO breaks (user_id, game, minutes, position) VALUES (?, ?, ?, ?)",
+                                [(user_id, game, minutes, i) for i, (game, minutes) in enumerate(user_json["breaks"].items())])
+
+    def delete_user(self, user_id: int):
+        with self._transaction():
+            self.db.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            self.db.execute("DELETE FROM prompts WHERE user_id = ?", (user_id,))
+            self.db.execute("DELETE FROM breaks WHERE user_id = ?", (user_id,))
+
+    def load_log(self, user_id: int):
+        columns = [row[0] for row in self.db.execute(
+            "SELECT activity FROM activity_columns WHERE user_id = ? ORDER BY position", (user_id,))]
+        if len(columns) == 0:
+            return None
+        cells = self.db.execute("SELECT date, activity, seconds FROM activity WHERE user_id = ?", (user_id,)).fetchall()
+        from activitylog import ActivityLog
+        return ActivityLog.from_cells(columns, cells)
+
+    def save_log(self, user_id: int, log_data: "ActivityLog"):
+        rows = [(user_id, date, activity, seconds) for date, activity, seconds in log_data.cells()]
+        with self._transaction():
+            self.db.execute("DELETE FROM activity_columns WHERE user_id = ?", (user_id,))
+            self.db.executemany("INSERT INTO activity_columns (user_id, activity, position) VALUES (?, ?, ?)",
+                                [(user_id, activity, i) for i, activity in enumerate(log_data.activities)])
+            self.db.execute("DELETE FROM activity WHERE user_id = ?", (user_id,))
+            self.db.executemany("INSERT INTO activity (user_id, date, activity, seconds) VALUES (?, ?, ?, ?)", rows)
+            self.save_summary(user_id, log_data.summary())
+
+    def delete_log(self, user_id: int):
+        with self._transaction():
+            deleted = self.db.execute("DELETE FROM activity_columns WHERE user_id = ?", (user_id,)).rowcount
+            self.db.execute("DELETE FROM activity WHERE user_id = ?", (user_id,))
+            self.db.execute("DELETE FROM log_summaries WHERE user_id = ?", (user_id,))
+        return deleted > 0
+
+    def load_summary(self, user_id: int):
+        """
+        Returns a user's LogSummary from one row, or from their whole log if it has none yet
+        (databases made before summaries existed, until rebuild_totals.py is run).
+        """
+        row = self.db.execute("SELECT summary FROM log_summaries WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return super().load_summary(user_id)
+        from activitylog import LogSummary
+        return LogSummary.from_json(json.loads(row[0]))
+
+    def save_summary(self, user_id: int, summary: "LogSummary"):
+        self.db.execute("INSERT OR REPLACE INTO log_summaries (user_id, summary) VALUES (?, ?)",
+                        (user_id, json.dumps(summary.to_json())))
+
+    def load_hour(self, hr: int):
+        hour_json = {}
+        for minute, user_id in self.db.execute(
+                "SELECT minute, user_id FROM times WHERE hour = ? ORDER BY minute, position", (hr,)):
+            hour_json.setdefault(minute, []).append(user_id)
+        return self.minute_sets(hr, hour_json)
+
+    def load_hours(self):
+        # one scan of the table instead of 24 queries
+        hours = {hr:{} for hr in range(24)}
+        for hr, minute, user_id in self.db.execute("SELECT hour, minute, user_id FROM times ORDER BY hour, minute, position"):
+            hours[hr].setdefault(minute, []).append(user_id)
+        return {hr:self.minute_sets(hr, hour_json) for hr, hour_json in hours.items()}
+
+    def user_zones(self):
+        return dict(self.db.execute("SELECT id, zone FROM users WHERE zone IS NOT NULL"))
+
+    def slots_of(self, user_id: int):
+        # times_user makes this a lookup instead of a scan
+        return sorted(hr * 60 + int(minute) for hr, minute in
+                      self.db.execute("SELECT DISTINCT hour, minute FROM times WHERE user_id = ?", (user_id,)))
+
+    def save_hour(self, hr: int, hour_json: dict):
+        rows = []
+        for minute, user_ids in minute_lists(hour_json).items():
+            rows += [(hr, minute, user_id, i) for i, user_id in enumerate(user_ids)]
+        self.hour_duplicates.pop(hr, None)
+        with self._transaction():
+            self.db.execute("DELETE FROM times WHERE hour = ?", (hr,))
+            self.db.executemany("INSERT INTO times (hour, minute, user_id, position) VALUES (?, ?, ?, ?)", rows)
+
+    def batch(self):
+        return self._transaction()
+
+    def close(self):
+        self.db.close()
+
+
+class _Transaction:
+    """
+    BEGIN/COMMIT around a block, or ROLLBACK if the block raises.
+    Inside another transaction it does nothing, so saves inside a batch() share the batch's commit.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.nested = False
+
+    def __enter__(self):
+        self.nested = self.db.in_transaction
+        if not self.nested:
+            self.db.execute("BEGIN")
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.nested:
+            return False
+        if exc_type is None:
+            self.db.execute("COMMIT")
+        else:
+            self.db.execute("ROLLBACK")
+        return False
+
+
+def has_legacy_users(directory: str):
+    """
+    Returns whether DIRECTORY has any user jsons in the legacy users/ folder.
+    """
+    try:
+        with os.scandir(os.path.join(directory, "users")) as entries:
+            return any(entry.name.endswith(".json") for entry in entries)
+    except FileNotFoundError:
+        return False
+
+def open_storage(backend: str, directory: str, write_delay: float=0.0, call_later=None):
+    """
+    Returns a storage backend by name, either "sqlite" or "legacy".
+
+    DIRECTORY: folder holding cornbot.db for sqlite, or users/ and times/ for legacy
+    WRITE_DELAY: for legacy, seconds file writes can wait to be committed together
+    CALL_LATER: for legacy, how delayed commits are scheduled; see atomicwrite.AtomicWriter
+    """
+    if backend == "sqlite":
+        db_path = os.path.join(directory, "cornbot.db")
+        # opening would create an empty cornbot.db, which hides every legacy user and stops migrate.py from running
+        if not os.path.exists(db_path) and has_legacy_users(directory):
+            raise SystemExit(f"{directory} has users/ but no cornbot.db: run python migrate.py once to move them over, "
+                             "or set CORNBOT_STORAGE=legacy to keep using the files.")
+        return SQLiteStorage(db_path)
+    elif backend == "legacy":
+        return LegacyStorage(directory, write_delay, call_later=call_later)
+    else:
+        raise ValueError(f"Unknown storage backend '{backend}'")
+
+
+def minute_lists(hour_json: dict):
+    """
+    Returns an hour json the way it's stored: {"MM": [user_id, ...]}, each list sorted.
+    """
+    return {minute:sorted(user_ids) for minute, user_ids in hour_json.items()}
+
+def apply_hour_moves(load_hour, moves: list):
+    """
+    Applies (user_id, old slot, new slot) MOVES to hour jsons in place, getting each from LOAD_HOUR(hr).
+    Returns the set of hours that changed.
+    """
+    # grouped per minute first, so a bulk move (a whole zone at a DST change) is one set operation per minute
+    removes = {}
+    adds = {}
+    for user_id, old, new in moves:
+        if old is not None:
+            removes.setdefault(old, set()).add(user_id)
+        if new is not None:
+            adds.setdefault(new, set()).add(user_id)
+    changed = set()
+    # every remove goes first, since one of a user's prompts can move into the minute another moves out of
+    for slot, user_ids in removes.items():
+        hr, minute = divmod(slot, 60)
+        hour_json = load_hour(hr)
+        key = f"{minute:02}"
+        scheduled = hour_json.get(key)
+        if scheduled is None or scheduled.isdisjoint(user_ids):
+            continue
+        scheduled -= user_ids
+        if not scheduled:
+            hour_json.pop(key)
+        changed.add(hr)
+    for slot, user_ids in adds.items():
+        hr, minute = divmod(slot, 60)
+        scheduled = load_hour(hr).setdefault(f"{minute:02}", set())
+        if not user_ids <= scheduled:
+            scheduled |= user_ids
+            changed.add(hr)
+    return changed
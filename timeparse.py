@@ -0,0 +1,177 @@
+# one parser for the durations and clock times users type into commands
+# durations: "1h30m", "90 min", "1.5 hours", "2 hours 15 minutes", "1:30"; clock times: "8:45", "20:00"
+# results are cached, since the same few inputs ("30m", "1h", "20:00") come up over and over
+
+import datetime as dt, functools, re
+from typing import NamedTuple
+
+# every unit name and abbreviation, and how many seconds it's worth
+# any prefix of "hours", "minutes" or "seconds" works, like before, plus the usual short forms
+UNITS = {}
+for _name, _seconds in (("hours", 3600), ("minutes", 60), ("seconds", 1)):
+    for _end in range(1, len(_name) + 1):
+        UNITS[_name[:_end]] = _seconds
+UNITS.update({"hr":3600, "hrs":3600, "mins":60, "sec":1, "secs":1})
+
+# one alternative per kind of token; "other" catches any character nothing else can start with
+_TOKEN = re.compile(r"(?P<clock>\d+:\d+)|(?P<number>\d+(?:\.\d+)?|\.\d+)|(?P<word>[a-z]+)|(?P<space>\s+)|(?P<other>.)", re.IGNORECASE)
+
+# how many distinct inputs to remember results for
+CACHE_SIZE = 4096
+
+class Duration(NamedTuple):
+    """
+    A parsed duration. SECONDS is rounded to a whole second.
+    """
+    seconds: int
+
+    @property
+    def timedelta(self):
+        return dt.timedelta(seconds=self.seconds)
+
+
+class ClockTime(NamedTuple):
+    """
+    A parsed 24-hour clock time.
+    """
+    hour: int
+    minute: int
+
+    @property
+    def text(self):
+        """
+        The time as "HH:MM", the format prompt times are stored in.
+        """
+        return f"{self.hour:02}:{self.minute:02}"
+
+
+class ParseError(ValueError):
+    """
+    Raised for input that couldn't be parsed. POSITION is the index in the input where it went wrong.
+    """
+
+    def __init__(self, message: str, text: str, position: int):
+        super().__init__(message)
+        self.message = message
+        self.text = text
+        self.position = position
+
+    def pointer(self):
+        """
+        Returns the input with the problem part marked, e.g. "1h 30 `xyz`".
+        """
+        match = _TOKEN.match(self.text, self.position)
+        end = match.end() if match else len(self.text)
+        return f"{self.text[:self.position]}`{self.text[self.position:end]}`{self.text[end:]}"
+
+
+def parse_duration(text: str):
+    """
+    Parses a whole string as a duration and returns a Duration.
+    Numbers can be whole or decimal, units can be spelled out or abbreviated, spaces are optional,
+    and "H:MM" counts as hours and minutes. Raises ParseError if any of it isn't part of a duration.
+    """
+    result = _parse_duration(text)
+    if isinstance(result, ParseError):
+        raise ParseError(result.message, result.text, result.position)
+    return result
+
+def parse_clock(text: str):
+    """
+    Parses "H:MM" or "HH:MM" in 24-hour time and returns a ClockTime. Raises ParseError otherwise.
+    """
+    result = _parse_clock(text)
+    if isinstance(result, ParseError):
+        raise ParseError(result.message, result.text, result.position)
+    return result
+
+def split_duration(text: str):
+    """
+    Splits a string ending in a duration, like "minecraft 1h 30m", into its start and the duration.
+    Returns (start with surrounding spaces stripped, Duration). The duration has to start after a space,
+    so a number stuck to a word ("game2 45m") stays part of the start. The longest duration that parses wins.
+    Raises ParseError if no ending of the string is a duration.
+    """
+    result = _split_duration(text)
+    if isinstance(result, ParseError):
+        raise ParseError(result.message, result.text, result.position)
+    return result
+
+def cache_info():
+    """
+    Returns {function name: functools cache info} for the parser caches.
+    """
+    return {function.__name__:function.cache_info() for function in (_parse_duration, _parse_clock, _split_duration)}
+
+# the cached functions return errors instead of raising them, so failed inputs are cached too;
+# callers raise a fresh copy, since raising the cached one would keep growing its traceback
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _parse_duration(text: str):
+    seconds = 0.0
+    # a number waiting for its unit, and where it started
+    number = None
+    number_at = 0
+    found = False
+    for match in _TOKEN.finditer(text):
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        value = match.group()
+        if kind == "number":
+            if number is not None:
+                return ParseError(f"`{text[number_at:match.start()].strip()}` needs a unit", text, number_at)
+            number = float(value)
+            number_at = match.start()
+        elif kind == "word":
+            unit = UNITS.get(value.lower())
+            if unit is None:
+                return ParseError(f"unknown unit `{value}`", text, match.start())
+            if number is None:
+                return ParseError(f"`{value}` needs a number before it", text, match.start())
+            seconds += number * unit
+            number = None
+            found = True
+        elif kind == "clock":
+            if number is not None:
+                return ParseError(f"`{text[number_at:match.start()].strip()}` needs a unit", text, number_at)
+            hours, minutes = value.split(":")
+            if len(minutes) != 2 or int(minutes) >= 60:
+                return ParseError(f"`{value}` isn't hours and minutes", text, match.start())
+            seconds += int(hours) * 3600 + int(minutes) * 60
+            found = True
+        else:
+            return ParseError(f"unexpected `{value}`", text, match.start())
+    if number is not None:
+        return ParseError(f"`{text[number_at:].strip()}` needs a unit", text, number_at)
+    if not found:
+        return ParseError("no time given", text, len(text))
+    return Duration(round(seconds))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _parse_clock(text: str):
+    stripped = text.strip()
+    offset = text.find(stripped) if stripped else len(text)
+    match = _TOKEN.match(stripped)
+    if match is None or match.lastgroup != "clock" or match.end() != len(stripped):
+        return ParseError("times look like `HH:MM`", text, offset)
+    hour, minute = stripped.split(":")
+    if int(hour) >= 24 or len(hour) > 2:
+        return ParseError(f"`{hour}` isn't an hour from 0 to 23", text, offset)
+    if len(minute) != 2 or int(minute) >= 60:
+        return ParseError(f"`{minute}` isn't a minute from 00 to 59", text, offset + len(hour) + 1)
+    return ClockTime(int(hour), int(minute))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _split_duration(text: str):
+    error = None
+    # try each word start from the left, so the longest duration is found first
+    for match in re.finditer(r"(?:^|(?<=\s))\S", text):
+        result = _parse_duration(text[match.start():])
+        if isinstance(result, Duration):
+            return text[:match.start()].strip(), result
+        # the last word's error is the one reported, since that's the part that should've been a duration
+        error = ParseError(result.message, text, match.start() + result.position)
+    if error is None:
+        return ParseError("no time given", text, len(text))
+    return error
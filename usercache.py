@@ -0,0 +1,152 @@
+# in-memory cache of user json objects that sits in front of a storage backend
+# profiles are written back in batches instead of on every command
+
+import json
+from collections import OrderedDict
+
+class UserStore:
+    """
+    LRU cache of parsed user json objects with write-behind flushing.
+
+    Commands get() a profile, change it, then put() it back, which only marks it dirty.
+    flush() writes every dirty profile to storage; main.py calls it on a timer and on shutdown.
+    Dirty profiles are written out before they can be evicted, so nothing is lost
+    when the memory budget is hit.
+    """
+
+    def __init__(self, storage, memory_budget: int, journal=None):
+        """
+        STORAGE: storage backend from storage.open_storage()
+        MEMORY_BUDGET: roughly how many bytes of profiles to keep in memory
+        JOURNAL: optional journal.Journal; if given, every put() and delete() is journaled
+            right away so changes waiting to be flushed survive a crash
+        """
+        self.storage = storage
+        self.journal = journal
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        # user_id -> user json, least recently used first
+        self.profiles = OrderedDict()
+        # user_id -> estimated size in bytes
+        self.sizes = {}
+        self.dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def get(self, user_id: int):
+        """
+        Returns a user json object, or None if the user isn't registered.
+        """
+        if user_id in self.profiles:
+            self.hits += 1
+            self.profiles.move_to_end(user_id)
+            return self.profiles[user_id]
+        self.misses += 1
+        user_json = self.storage.load_user(user_id)
+        if user_json is not None:
+            self._insert(user_id, user_json)
+        return user_json
+
+    def put(self, user_id: int, user_json: dict):
+        """
+        Stores a new or changed user json object and marks it to be flushed.
+        """
+        if self.journal is not None:
+            self.journal.append({"op":"user", "user_id":user_id, "json":user_json})
+        if user_id in self.profiles:
+            self.memory_used -= self.sizes[user_id]
+            self.profiles[user_id] = user_json
+            self.profiles.move_to_end(user_id)
+            self.sizes[user_id] = _estimate_size(user_json)
+            self.memory_used += self.sizes[user_id]
+        else:
+            self._insert(user_id, user_json)
+        self.dirty.add(user_id)
+        self._evict()
+
+    def delete(self, user_id: int):
+        """
+        Drops a user from the cache and deletes their json from storage right away.
+        """
+        if self.journal is not None:
+            self.journal.append({"op":"user_delete", "user_id":user_id})
+        if user_id in self.profiles:
+            self.profiles.pop(user_id)
+            self.memory_used -= self.sizes.pop(user_id)
+        self.dirty.discard(user_id)
+        self.storage.delete_user(user_id)
+
+    def refresh(self, user_id: int, user_json: dict):
+        """
+        Caches a copy of a user json that another process has already stored, without writing it again.
+        """
+        self.forget(user_id)
+        self._insert(user_id, user_json)
+
+    def forget(self, user_id: int):
+        """
+        Drops a user from the cache without touching storage, so the next get() reads it fresh.
+        """
+        if user_id in self.profiles:
+            self.profiles.pop(user_id)
+            self.memory_used -= self.sizes.pop(user_id)
+        self.dirty.discard(user_id)
+
+    def flush(self):
+        """
+        Writes every dirty profile to storage. Returns how many were written.
+        """
+        flushed = 0
+        # committed together, as one transaction or one round of file writes
+        with self.storage.batch():
+            for user_id in list(self.dirty):
+                self.storage.save_user(user_id, self.profiles[user_id])
+                flushed += 1
+        self.dirty.clear()
+        self.writes += flushed
+        return flushed
+
+    def stats(self):
+        """
+        Returns a dict of cache counters, for sizing memory_budget.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "profiles":len(self.profiles),
+            "dirty":len(self.dirty),
+            "memory_used":self.memory_used,
+            "memory_budget":self.memory_budget,
+            "hits":self.hits,
+            "misses":self.misses,
+            "hit_ratio":self.hits / lookups if lookups else 0.0,
+            "evictions":self.evictions,
+            "writes":self.writes
+        }
+
+    def _insert(self, user_id: int, user_json: dict):
+        self.profiles[user_id] = user_json
+        self.sizes[user_id] = _estimate_size(user_json)
+        self.memory_used += self.sizes[user_id]
+        self._evict()
+
+    def _evict(self):
+        # always keep the most recently used profile, even if it alone is over budget
+        while self.memory_used > self.memory_budget and len(self.profiles) > 1:
+            user_id, user_json = self.profiles.popitem(last=False)
+            # write back before forgetting it
+            if user_id in self.dirty:
+                self.storage.save_user(user_id, user_json)
+                self.dirty.discard(user_id)
+                self.writes += 1
+            self.memory_used -= self.sizes.pop(user_id)
+            self.evictions += 1
+
+
+def _estimate_size(user_json: dict):
+    """
+    Rough in-memory size of a user json object, in bytes.
+    Python dicts and strs carry a lot of overhead, so the serialized length is scaled up.
+    """
+    return len(json.dumps(user_json)) * 4 + 200
@@ -0,0 +1,251 @@
+# IANA timezone support: users can give a zone name like "Europe/Berlin" instead of a fixed UTC offset
+# prompts are kept in UTC minute buckets, so when a zone's offset changes (daylight saving time) the prompts of
+# everyone in it have to move; ZoneIndex precomputes when each zone in use changes next, and main.py moves just
+# those users' prompts in one bulk change at that moment, instead of recomputing anyone's offset every minute
+
+import datetime as dt
+import functools, json, zoneinfo, atomicwrite
+from clock import default_clock
+
+# how far ahead each zone's transitions are worked out at a time
+TRANSITION_HORIZON = dt.timedelta(days=400)
+# how often a zone's offset is sampled when looking for transitions; no zone changes offset twice this quickly
+TRANSITION_STEP = dt.timedelta(hours=6)
+
+@functools.lru_cache(maxsize=1)
+def _zone_names():
+    # lowercase name -> canonical name; listing the tz database takes a while, so it's only done once
+    return {name.lower():name for name in zoneinfo.available_timezones()}
+
+def lookup(name: str):
+    """
+    Returns the canonical name of the IANA zone NAME, ignoring case, or None if there's no such zone.
+    """
+    return _zone_names().get(name.lower())
+
+def offset_at(zone: str, when: dt.datetime):
+    """
+    Returns ZONE's UTC offset at WHEN (naive UTC) in hours: an int, or a float for zones like UTC+5:30.
+    """
+    offset = when.replace(tzinfo=dt.timezone.utc).astimezone(zoneinfo.ZoneInfo(zone)).utcoffset()
+    minutes = int(offset.total_seconds()) // 60
+    return minutes // 60 if minutes % 60 == 0 else minutes / 60
+
+def transitions(zone: str, start: dt.datetime, end: dt.datetime):
+    """
+    Returns [(when, offset)] for every change to ZONE's offset after START and up to END (naive UTC),
+    where WHEN is the first UTC minute at the new OFFSET.
+    """
+    found = []
+    sample = start.replace(second=0, microsecond=0)
+    before = offset_at(zone, sample)
+    while sample < end:
+        next_sample = min(sample + TRANSITION_STEP, end)
+        after = offset_at(zone, next_sample)
+        if after != before:
+            # binary search for the minute it changed; transitions always fall on a minute
+            low, high = 0, int((next_sample - sample).total_seconds()) // 60
+            while high - low > 1:
+                middle = (low + high) // 2
+                if offset_at(zone, sample + dt.timedelta(minutes=middle)) == before:
+                    low = middle
+                else:
+                    high = middle
+            found.append((sample + dt.timedelta(minutes=high), after))
+            before = after
+        sample = next_sample
+    return found
+
+def utc_slot(local_time: str, offset):
+    """
+    Returns the UTC minute of the day (see scheduler.slot()) of a "HH:MM" local time at OFFSET hours from UTC.
+    """
+    return (int(local_time[:2]) * 60 + int(local_time[3:]) - round(offset * 60)) % (24 * 60)
+
+def local_time(when: dt.datetime, offset):
+    """
+    Returns the "HH:MM" local time at OFFSET hours from UTC of WHEN (naive UTC).
+    """
+    return f"{when + dt.timedelta(minutes=round(offset * 60)):%H:%M}"
+
+def format_offset(offset):
+    """
+    Returns an offset in hours the way users type it: "+2", "-4", "+5:30".
+    """
+    minutes = round(offset * 60)
+    hours, minutes = divmod(abs(minutes), 60)
+    return f"{'+' if offset >= 0 else '-'}{hours}" + (f":{minutes:02}" if minutes else "")
+
+
+class ZoneIndex:
+    """
+    Which users picked each zone, the offset their prompts are scheduled at, and when that next has to change.
+
+    The prompts of users with a zone are always scheduled at offset(zone), not at the zone's offset right now.
+    The two only differ for the moment between main.py moving a zone's prompts and the transition itself,
+    and going by offset() means a prompt added or deleted in that moment still lands in the right minute.
+    A user picking or dropping a zone only marks the index dirty, and main.py's flush writes it before emptying
+    the journal, so commands never rewrite the whole file; a zone changing offset is saved right away.
+    The index can drift from the users' jsons (a crash between a user picking a zone and the next flush),
+    so like registry.UserRegistry, check() compares it against storage and fixes it.
+    Not locked: main.py changes it and calls next_change() on its I/O thread, and only reads offset() and len()
+    from the event loop.
+    """
+
+    def __init__(self, path: str=None):
+        """
+        PATH: index file to persist to; None keeps the index in memory only
+        """
+        self.path = path
+        # zone -> set of user ids
+        self.members = {}
+        # zone -> offset in hours its users' prompts are scheduled at
+        self.offsets = {}
+        # zone -> (worked out from, worked out until, [(when, offset)])
+        self.transitions = {}
+        # whether members changed since the file was last written
+        self.dirty = False
+
+    def __len__(self):
+        # list() copies the sets in one step, since the I/O thread may add or drop a zone meanwhile
+        return sum(map(len, list(self.members.values())))
+
+    def load(self, path: str):
+        """
+        Replaces the index with the one in PATH, and persists to it from now on.
+        Returns False if the file doesn't exist yet (the index is left empty).
+        """
+        self.path = path
+        try:
+            with open(path, "r") as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            return False
+        self.members = {zone:set(entry["users"]) for zone, entry in index.items()}
+        self.offsets = {zone:entry["offset"] for zone, entry in index.items()}
+        self.transitions = {}
+        self.dirty = False
+        return True
+
+    def add(self, user_id: int, zone: str, now: dt.datetime):
+        """
+        Puts a user in ZONE (taking them out of any other). Returns True if no one was in ZONE before,
+        so its transitions are new to whoever is waiting on next_change().
+        """
+        self._discard(user_id)
+        new = zone not in self.members
+        if new:
+            self.members[zone] = set()
+            self.offsets[zone] = offset_at(zone, now)
+        self.members[zone].add(user_id)
+        self.dirty = True
+        return new
+
+    def remove(self, user_id: int):
+        if self._discard(user_id):
+            self.dirty = True
+
+    def check(self, user_zones: dict, now: dt.datetime):
+        """
+        Makes the index match USER_ZONES ({user_id: zone}), the zones in the users' jsons in storage.
+        Returns (added, removed): lists of ids that were missing from or extra in the index,
+        counting a user in the wrong zone as both.
+        """
+        indexed = {user_id:zone for zone, user_ids in self.members.items() for user_id in user_ids}
+        added = sorted(user_id for user_id, zone in user_zones.items() if indexed.get(user_id) != zone)
+        removed = sorted(user_id for user_id, zone in indexed.items() if user_zones.get(user_id) != zone)
+        for user_id in removed:
+            self._discard(user_id)
+        for user_id in added:
+            self.add(user_id, user_zones[user_id], now)
+        if added or removed:
+            self.save()
+        return added, removed
+
+    def _discard(self, user_id: int):
+        for zone, user_ids in self.members.items():
+            if user_id in user_ids:
+                user_ids.discard(user_id)
+                # zones nobody uses any more aren't tracked
+                if not user_ids:
+                    self.members.pop(zone)
+                    self.offsets.pop(zone)
+                    self.transitions.pop(zone, None)
+                return True
+        return False
+
+    def offset(self, zone: str):
+        """
+        Returns the offset in hours ZONE's prompts are scheduled at.
+        Zones this index hasn't heard of yet (another worker just added them) go by their offset now.
+        """
+        # one lookup, since the I/O thread can drop the zone between checking for it and reading it
+        offset = self.offsets.get(zone)
+        if offset is not None:
+            return offset
+        return offset_at(zone, default_clock().now())
+
+    def offset_for(self, user_json: dict):
+        """
+        Returns the offset in hours a user's prompts are scheduled at: their zone's, or their fixed "tz".
+        """
+        zone = user_json.get("zone")
+        return self.offset(zone) if zone is not None else user_json["tz"]
+
+    def set_offsets(self, offsets: dict):
+        """
+        Records that the prompts of each zone in OFFSETS ({zone: hours}) have been moved to that offset.
+        Only in memory; call save() after.
+        """
+        self.offsets.update({zone:offset for zone, offset in offsets.items() if zone in self.members})
+
+    def next_change(self, after: dt.datetime):
+        """
+        Returns (when, {zone: new offset}) for the first time at or after AFTER that any zone in use
+        won't be at the offset its prompts are scheduled at, or None if that doesn't happen within the horizon.
+        A zone that's already off at AFTER, say because the bot was down over a transition, is due at AFTER.
+        """
+        earliest = None
+        changes = {}
+        for zone in self.members:
+            change = self._next_change(zone, after)
+            if change is None:
+                continue
+            when, offset = change
+            if earliest is None or when < earliest:
+                earliest, changes = when, {zone:offset}
+            elif when == earliest:
+                changes[zone] = offset
+        return (earliest, changes) if earliest is not None else None
+
+    def _next_change(self, zone: str, after: dt.datetime):
+        offset = offset_at(zone, after)
+        if offset != self.offsets[zone]:
+            return after, offset
+        begin, until, found = self.transitions.get(zone, (None, None, []))
+        # worked out once per zone, then again when the horizon is half used up
+        if begin is None or after < begin or after > until - TRANSITION_HORIZON / 2:
+            begin, until = after, after + TRANSITION_HORIZON
+            found = transitions(zone, begin, until)
+            self.transitions[zone] = (begin, until, found)
+        for when, offset in found:
+            if when > after and offset != self.offsets[zone]:
+                return when, offset
+        return None
+
+    def flush(self):
+        """
+        Writes the index if users picked or dropped a zone since it was last written.
+        """
+        if self.dirty:
+            self.save()
+
+    def save(self):
+        """
+        Writes the index to a temp file and renames it over the old one.
+        """
+        self.dirty = False
+        if self.path is None:
+            return
+        index = {zone:{"offset":self.offsets[zone], "users":sorted(user_ids)} for zone, user_ids in self.members.items()}
+        atomicwrite.write_file(self.path, json.dumps(index).encode())